@@ -0,0 +1,182 @@
+'''asyncio API for programming SmartDrives, independent of Qt.
+
+One event loop can program many ports concurrently:
+
+    async def programUnit(portName, image):
+        progress = Progress()
+        task = progress.watch(program(portName, image, progress=progress))
+        async for stage, percent, text in progress:
+            print(portName, stage, percent, text)
+        return await task
+
+    loop.run_until_complete(asyncio.gather(
+        *[programUnit(p, image) for p in portNames]))
+
+Cancelling a task stops programming, kills lpc21isp and closes the
+port.  Serial ports are polled without blocking the loop.  On Windows
+before Python 3.8 the bootloader stage needs the ProactorEventLoop.
+
+The protocol itself lives in ota.py and lpc21isp.py and is shared with
+the Qt SmartDrive and the headless programmer.
+'''
+import asyncio
+import time
+
+import capture
+import lpc21isp
+import manifest
+import ota
+
+stages = ('bootloader', 'firmware')
+
+# how often an idle port is polled for received data (seconds)
+pollInterval = 0.002
+# writes wait while more than this many bytes are queued in the driver
+maxOutWaiting = 256
+
+class ProgrammingError(Exception):
+    pass
+
+class Progress:
+    '''Async iterator over (stage, percent, text) progress updates.
+
+    Call it as a progress callback; repeated updates are dropped.'''
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.last = None
+
+    def __call__(self, stage, percent, text):
+        update = (stage, int(percent), text)
+        if update != self.last:
+            self.last = update
+            self.queue.put_nowait(update)
+
+    def close(self):
+        '''Ends the iteration once the queued updates are consumed.'''
+        self.queue.put_nowait(None)
+
+    def watch(self, coro):
+        '''Schedules coro and closes the progress when it is done.'''
+        task = asyncio.ensure_future(coro)
+        task.add_done_callback(lambda t: self.close())
+        return task
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        update = await self.queue.get()
+        if update is None:
+            raise StopAsyncIteration
+        return update
+
+class AsyncPort:
+    '''Non-blocking wrapper around a pyserial-style port.'''
+    def __init__(self, port):
+        self.port = port
+        self.port.timeout = 0
+
+    def reset_input_buffer(self):
+        self.port.reset_input_buffer()
+
+    async def read(self, timeout):
+        '''Returns the received data, or b'' if none arrived in time.'''
+        deadline = time.monotonic() + timeout
+        while True:
+            waiting = self.port.in_waiting
+            if waiting:
+                return self.port.read(waiting)
+            if time.monotonic() >= deadline:
+                return b''
+            await asyncio.sleep(pollInterval)
+
+    async def write(self, data):
+        while self.port.out_waiting > maxOutWaiting:
+            await asyncio.sleep(pollInterval)
+        self.port.write(data)
+
+    def close(self):
+        self.port.close()
+
+def _noProgress(stage, percent, text):
+    pass
+
+async def program_bootloader(portName, progress=None, hexFile=None, preset='default'):
+    '''Programs the bootloader with lpc21isp, using the lpc21isp preset.'''
+    report = progress or _noProgress
+    report('bootloader', 0, 'Programming bootloader')
+    try:
+        process = await asyncio.create_subprocess_exec(
+            lpc21isp.program(), *lpc21isp.arguments(portName, hexFile, preset),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT)
+    except OSError as error:
+        raise ProgrammingError("Couldn't run lpc21isp: {}".format(error))
+    output = capture.OutputCapture('lpc21isp', portName)
+    parser = lpc21isp.OutputParser()
+    try:
+        while True:
+            data = await process.stdout.read(4096)
+            if not data:
+                break
+            percent, status = parser.feed(output.feed(data))
+            report('bootloader', percent, status)
+        parser.feed(output.finish())
+        code = await process.wait()
+        if code != 0:
+            raise ProgrammingError(output.saveOnFailure("Bootloader failed: {}".format(code)))
+    finally:
+        output.close()
+        if process.returncode is None:
+            process.kill()
+    report('bootloader', 100, 'Bootloader complete')
+
+async def program_firmware(portName, image, progress=None,
+                           transmitDelay=0.001, timeout=ota.readyTimeout):
+    '''Sends an MX2+ OTA image (or the name of an OTA file) to the
+    bootloader. Returns the seconds the bootloader took to get ready.'''
+    report = progress or _noProgress
+    if isinstance(image, str):
+        manifest.verify(image, 'ota')
+        image = ota.FirmwareFile(image)
+    report('firmware', 0, 'Waiting for Bootloader Ready')
+    try:
+        port = AsyncPort(ota.openPort(portName, timeout=0))
+    except Exception as error:
+        raise ProgrammingError("Couldn't open serial port {}".format(error))
+    try:
+        port.reset_input_buffer()
+        handshake = ota.Handshake(timeout)
+        while True:
+            now = time.monotonic()
+            if handshake.expired(now):
+                raise ProgrammingError(
+                    "Timed out after {} s waiting for the bootloader.".format(timeout))
+            p = handshake.poll(now)
+            if p is not None:
+                await port.write(p)
+            wait = min(handshake.nextSend, handshake.deadline) - time.monotonic()
+            data = await port.read(max(0, wait))
+            if handshake.feed(data, time.monotonic()):
+                break
+        report('firmware', 0, 'Bootloader Ready ({:.2f} s)'.format(handshake.readyTime))
+
+        for percent, frame in ota.firmwareFrames(image):
+            await port.write(frame)
+            report('firmware', percent, 'Sending MX2+ Firmware')
+            # also lets the other ports on this loop run
+            await asyncio.sleep(transmitDelay)
+
+        report('firmware', 100, 'Rebooting MX2+')
+        await port.write(ota.stopPacket)
+    finally:
+        port.close()
+    return handshake.readyTime
+
+async def program(portName, image, stages=stages, progress=None, bootloaderPreset='default',
+                  **kwargs):
+    '''Runs the given stages on one SmartDrive, in order.'''
+    if 'bootloader' in stages:
+        await program_bootloader(portName, progress, preset=bootloaderPreset)
+    if 'firmware' in stages:
+        return await program_firmware(portName, image, progress, **kwargs)
@@ -0,0 +1,560 @@
+#!/usr/bin/python
+'''Benchmarks for the programmer's hot paths.
+
+Run with ``python ./benchmark.py <benchmark>``; see ``--help`` for the
+list of benchmarks.  None of them need hardware or a display.
+'''
+import argparse
+import multiprocessing
+import random
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+
+import bleupdate
+import bundle
+import capture
+import headless
+import lpc21isp
+import manifest
+import ota
+import portsession
+import selftest
+import serialtrace
+import smartdrivebluetoothcore
+from packet import Decoder, Packet
+
+defaultFirmware = 'firmwares/MX2+.15.ota'
+
+def readFirmware(fileName):
+    with open(fileName, 'rb') as f:
+        return bytearray(f.read())
+
+def firmwarePackets(fw, blockSize=16):
+    return [Packet(Packet.ota, Packet.smartDrive, fw[i:(i+blockSize)])
+            for i in range(0, len(fw), blockSize)]
+
+def noisyStream(packets, noise, rng):
+    '''Returns the packets as one byte stream with random noise (including
+    stray start / end markers) between them and a few corrupted packets.'''
+    markers = [Packet.start, Packet.end]
+    stream = bytearray()
+    sent = 0
+    for p in packets:
+        if rng.random() < noise:
+            junk = bytes(rng.choice(markers) if rng.random() < 0.2 else rng.randrange(256)
+                         for _ in range(rng.randrange(1, 32)))
+            stream += junk
+        data = bytearray(p.data)
+        if rng.random() < noise / 4:
+            data[rng.randrange(3, len(data) - 3)] ^= 0x5A
+        else:
+            sent += 1
+        stream += data
+    return stream, sent
+
+def chunks(stream, rng, maxChunk):
+    i = 0
+    while i < len(stream):
+        n = rng.randrange(1, maxChunk + 1)
+        yield stream[i:(i+n)]
+        i += n
+
+def benchDecoder(args):
+    rng = random.Random(args.seed)
+    fw = readFirmware(args.firmware)
+    packets = firmwarePackets(fw)
+    stream, sent = noisyStream(packets * args.repeat, args.noise, rng)
+    pieces = list(chunks(stream, rng, args.chunk))
+
+    decoder = Decoder()
+    begin = time.perf_counter()
+    received = 0
+    for piece in pieces:
+        received += len(decoder.feed(piece))
+    elapsed = time.perf_counter() - begin
+
+    print('decoder: {} bytes in {} chunks (noise {:.0%})'.format(
+        len(stream), len(pieces), args.noise))
+    print('  intact packets sent: {}  decoded: {}  bytes dropped: {}'.format(
+        sent, received, decoder.dropped))
+    print('  {:.0f} frames/s, {:.2f} MB/s'.format(
+        received / elapsed, len(stream) / elapsed / 1e6))
+
+def benchPacket(args):
+    fw = readFirmware(args.firmware)
+    blocks = [fw[i:(i+16)] for i in range(0, len(fw), 16)] * args.repeat
+
+    # memory per packet: Packet objects vs one preallocated frame stream
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    packets = [Packet(Packet.ota, Packet.smartDrive, b) for b in blocks]
+    objectBytes = tracemalloc.get_traced_memory()[0] - before
+    del packets
+    before = tracemalloc.get_traced_memory()[0]
+    stream = bytearray(sum(Packet.packetLength(len(b)) for b in blocks))
+    streamBytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    begin = time.perf_counter()
+    for b in blocks:
+        Packet(Packet.ota, Packet.smartDrive, b).data
+    objectTime = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    offset = 0
+    for b in blocks:
+        offset = Packet.encode(stream, offset, Packet.ota, Packet.smartDrive, b)
+    streamTime = time.perf_counter() - begin
+
+    print('packet: {} blocks of 16 bytes'.format(len(blocks)))
+    print('  Packet objects: {:6.1f} bytes/packet {:9.0f} packets/s'.format(
+        objectBytes / len(blocks), len(blocks) / objectTime))
+    print('  Packet.encode:  {:6.1f} bytes/packet {:9.0f} packets/s'.format(
+        streamBytes / len(blocks), len(blocks) / streamTime))
+
+def bleUpdateLog(lines, rng):
+    '''Synthetic 'bleupdate-cli update' output with progress redrawn on
+    carriage returns, like a progress bar.'''
+    out = ['Connecting to CC Debugger...\n', 'Erasing flash\n']
+    phases = ['Writing', 'Verifying']
+    per = max(1, lines // len(phases))
+    for phase in phases:
+        for i in range(per):
+            out.append('{}: {}%\r'.format(phase, 100 * i // per))
+        out.append('{}: 100%\n'.format(phase))
+    out.append('Update complete\n')
+    return ''.join(out)
+
+def benchBLEParser(args):
+    rng = random.Random(args.seed)
+    print('bleparser: update output replayed in random chunks')
+    for scale in (1, 2, 4, 8, 16):
+        log = bleUpdateLog(args.lines * scale, rng)
+        pieces = list(chunks(log, rng, args.chunk))
+
+        begin = time.perf_counter()
+        parser = bleupdate.OutputParser('update')
+        for piece in pieces:
+            parser.feed(piece)
+        parser.finish()
+        elapsed = time.perf_counter() - begin
+        assert parser.percent == 100, parser.percent
+
+        # the old approach: search the whole output again for every chunk
+        begin = time.perf_counter()
+        output = ''
+        for piece in pieces:
+            output += piece
+            bleupdate.serialPattern.search(output)
+            bleupdate.addressPattern.search(output)
+            bleupdate.licensePattern.search(output)
+        rescan = time.perf_counter() - begin
+
+        print('  {:8d} bytes: parser {:7.1f} ns/byte   rescan {:8.1f} ns/byte'.format(
+            len(log), elapsed / len(log) * 1e9, rescan / len(log) * 1e9))
+
+def simulatedPorts(count, prefix='bench'):
+    return ['sim://{}{}'.format(prefix, i) for i in range(count)]
+
+def benchPool(args):
+    # a larger image so process start up does not dominate
+    fw = readFirmware(args.firmware) * args.repeat
+    fd, fwFileName = tempfile.mkstemp(suffix='.ota')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(fw)
+    try:
+        runPool(args, fw, fwFileName)
+    finally:
+        os.remove(fwFileName)
+
+def runPool(args, fw, fwFileName):
+    maxPorts = args.ports or multiprocessing.cpu_count()
+    print('pool: firmware stage on simulated ports, {} cores'.format(
+        multiprocessing.cpu_count()))
+
+    def threaded(ports):
+        threads = [threading.Thread(target=headless.programPort,
+                                    args=(p, fwFileName, ['firmware'], 0))
+                   for p in ports]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def pooled(ports):
+        results = headless.run(ports, fwFileName, stages=['firmware'],
+                               transmitDelay=0)
+        assert all(r['ok'] for r in results), results
+
+    for name, func in [('threads', threaded), ('processes', pooled)]:
+        base = None
+        n = 1
+        while n <= maxPorts:
+            ports = simulatedPorts(n, name)
+            begin = time.perf_counter()
+            func(ports)
+            elapsed = time.perf_counter() - begin
+            rate = n * len(fw) / elapsed
+            base = base or rate
+            print('  {:9s} {:3d} ports: {:6.2f} s {:8.0f} KB/s  speedup {:4.1f}x'.format(
+                name, n, elapsed, rate / 1000, rate / base))
+            n *= 2
+
+def benchTrace(args):
+    fw = readFirmware(args.firmware) * args.repeat
+    running = lambda: True
+
+    def send(traced):
+        port = ota.openPort('sim://trace')
+        if traced:
+            port = serialtrace.TracedPort(port, serialtrace.Recorder(), 'sim://trace')
+        ota.waitForReady(port, running)
+        begin = time.perf_counter()
+        ota.sendFirmware(port, fw, running, transmitDelay=0)
+        elapsed = time.perf_counter() - begin
+        port.close()
+        return elapsed
+
+    # alternate the runs and keep the best of each, to cancel out noise
+    plain = traced = float('inf')
+    for i in range(args.runs):
+        plain = min(plain, send(False))
+        traced = min(traced, send(True))
+    packets = (len(fw) + ota.blockSize - 1) // ota.blockSize
+    perPacket = (traced - plain) / packets
+    # 8N1 at the OTA baudrate: ten bits on the wire per byte
+    wireTime = Packet.packetLength(ota.blockSize) * 10 / ota.baudrate
+    print('trace: {} packets sent to a simulated port, best of {}'.format(packets, args.runs))
+    print('  untraced: {:.3f} s'.format(plain))
+    print('  traced:   {:.3f} s'.format(traced))
+    print('  cost {:.2f} us/packet, {:.3%} of the {:.2f} ms a packet takes on the wire'.format(
+        perPacket * 1e6, perPacket / wireTime, wireTime * 1000))
+
+def benchBundle(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        layouts = [('before', bundle.previousDatas()),
+                   ('after', bundle.datas(os.path.join(tmp, 'build')))]
+        print('bundle: extracting the one-file data files, best of {}'.format(args.runs))
+        for name, files in layouts:
+            # the one-file archive stores each file zlib compressed and
+            # extracts it to a temporary folder at every launch
+            archive = []
+            for dest, src in files:
+                with open(src, 'rb') as f:
+                    archive.append((dest, zlib.compress(f.read(), 9)))
+            best = float('inf')
+            for i in range(args.runs):
+                out = os.path.join(tmp, 'extract{}{}'.format(name, i))
+                begin = time.perf_counter()
+                written = 0
+                for dest, data in archive:
+                    path = os.path.join(out, dest)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, 'wb') as f:
+                        written += f.write(zlib.decompress(data))
+                best = min(best, time.perf_counter() - begin)
+            print('  {:6s} {:3d} files, {:8d} bytes in the archive, {:8d} extracted in {:.1f} ms'.format(
+                name, len(files), sum(len(data) for dest, data in archive), written, best * 1000))
+
+def benchDashboard(args):
+    # the dashboard needs Qt, but no display
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    import dashboard
+
+    app = QApplication.instance() or QApplication([])
+    model = dashboard.StationModel()
+    view = dashboard.Dashboard(model)
+    view.resize(1200, 800)
+    view.show()
+    for i in range(args.tiles):
+        model.addTile(i, 'port {}'.format(i), 'mx2')
+        model.onStart(i, 'firmware', 88000)
+    app.processEvents()
+
+    # progress updates at a steady rate, spread over all tiles
+    interval = 1 / args.rate
+    updates = 0
+    frames, paints = model.frames, view.delegate.paints
+    begin = time.monotonic()
+    nextUpdate = begin
+    while time.monotonic() - begin < args.seconds:
+        now = time.monotonic()
+        while nextUpdate <= now:
+            model.onStatus(updates % args.tiles, (updates // args.tiles) % 100, 'Sending MX2+ Firmware')
+            updates += 1
+            nextUpdate += interval
+        app.processEvents()
+        time.sleep(0.001)
+    app.processEvents()
+    elapsed = time.monotonic() - begin
+    frames = model.frames - frames
+    print('dashboard: {} tiles, {} updates/s for {:.0f} s'.format(args.tiles, args.rate, args.seconds))
+    print('  {} updates -> {} repaints ({:.0f}/s), {} tiles painted'.format(
+        updates, frames, frames / elapsed, view.delegate.paints - paints))
+
+def benchManifest(args):
+    names = ['firmwares/ota-bootloader.hex', args.firmware, 'firmwares/SmartDriveBluetooth.1.6.fw']
+    print('manifest: checking the images of one unit, {} units'.format(args.units))
+    verifier = manifest.Verifier()
+    begin = time.perf_counter()
+    for name in names:
+        verifier.verify(name, manifest.guessTarget(name))
+    first = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for i in range(args.units):
+        for name in names:
+            verifier.verify(name, manifest.guessTarget(name))
+    cached = (time.perf_counter() - begin) / args.units
+    size = sum(os.path.getsize(name) for name in names)
+    print('  first check: {:.2f} ms for {} bytes'.format(first * 1000, size))
+    print('  every unit after: {:.1f} us, {} scans in all'.format(cached * 1e6, verifier.scans))
+
+def residentBytes():
+    '''Resident set size of this process (Linux), or None.'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+def benchSoak(args):
+    # a shift of units on the stand-in tools, as fast as they can run
+    fakes = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakes')
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    os.environ.setdefault('SD_LPC21ISP', os.path.join(fakes, 'lpc21isp'))
+    os.environ.setdefault('SD_BLEUPDATE_CLI', os.path.join(fakes, 'bleupdate-cli'))
+    os.environ['FAKE_SPEED'] = '0'
+    from PyQt5.QtCore import QCoreApplication, QEventLoop
+    from smartdrive import SmartDrive
+    from smartdrivebluetooth import SmartDriveBluetooth
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    smartDrive = SmartDrive('sim://soak')
+    bluetooth = SmartDriveBluetooth('firmwares/SmartDriveBluetooth.1.6.fw', device='FAKE0')
+    failures = []
+    loop = QEventLoop()
+    for signal in (smartDrive.bootloaderFinished, bluetooth.firmwareFinished):
+        signal.connect(loop.quit)
+    smartDrive.bootloaderFailed.connect(lambda msg: (failures.append(msg), loop.quit()))
+    bluetooth.failed.connect(lambda msg: (failures.append(msg), loop.quit()))
+
+    print('soak: {} units, lpc21isp + bleupdate-cli get + update each'.format(args.units))
+    print('{:>8s} {:>10s} {:>12s} {:>12s}'.format('units', 'processes', 'rss', 'python heap'))
+    tracemalloc.start()
+    begin = time.monotonic()
+    rss = []
+    for unit in range(1, args.units + 1):
+        smartDrive.programBootloader()
+        loop.exec_()
+        bluetooth.getDeviceInfo()
+        loop.exec_()
+        if unit == 1 or unit % max(1, args.units // 8) == 0:
+            rss.append(residentBytes())
+            print('{:8d} {:10d} {:>12s} {:>12s}'.format(
+                unit, unit * 3, '{:.1f} MB'.format(rss[-1] / 1e6) if rss[-1] else '-',
+                '{:.1f} MB'.format(tracemalloc.get_traced_memory()[0] / 1e6)))
+    elapsed = time.monotonic() - begin
+    tracemalloc.stop()
+    print('  {} processes in {:.0f} s, {} failed'.format(args.units * 3, elapsed, len(failures)))
+    if rss[0] and rss[-1]:
+        print('  rss grew {:+.1f} MB after the first unit'.format((rss[-1] - rss[0]) / 1e6))
+
+    # one tool printing far more than usual, e.g. stuck in a progress loop
+    chunk = ('Sector 1: ' + '.' * 100 + '\n').encode('utf-8') * 40
+    count = args.flood * 1000000 // len(chunk)
+    for name in ('str', 'capture'):
+        tracemalloc.start()
+        begin = time.perf_counter()
+        if name == 'str':
+            output = ''
+            for i in range(count):
+                output += str(chunk, 'utf-8')
+                lpc21isp.parseOutput(output)
+        else:
+            output = capture.OutputCapture('lpc21isp', 'soak')
+            parser = lpc21isp.OutputParser()
+            for i in range(count):
+                parser.feed(output.feed(chunk))
+            output.finish()
+        elapsed = time.perf_counter() - begin
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if name == 'capture':
+            output.close()
+        print('  {} MB of output kept in a {:8s} {:6.2f} s, peak {:.1f} MB'.format(
+            args.flood, name + ':', elapsed, peak / 1e6))
+        del output
+
+def benchLatency(args):
+    timer = args.timer / 1000
+    running = lambda: True
+    print('latency: simulated adapter with a {:.0f} ms latency timer, best of {}'.format(
+        args.timer, args.runs))
+    fw = ota.FrameStream(readFirmware(args.firmware))
+    for lowLatency in (False, True):
+        session = portsession.PortSession(
+            'sim://latency?latency={}'.format(timer), lowLatency=lowLatency)
+        port = session.acquire(ota.baudrate)
+        handshake = min(ota.waitForReady(port, running) for i in range(args.runs))
+        begin = time.perf_counter()
+        writeSize = session.writeSize
+        ota.sendFirmware(port, fw, running, transmitDelay=0, writeSize=writeSize)
+        send = time.perf_counter() - begin
+        session.release()
+
+        session = portsession.PortSession(
+            'sim://loop?loopback=1&realtime=1&latency={}'.format(timer), lowLatency=lowLatency)
+        port = session.acquire(ota.baudrate, timeout=0.05)
+        times, errors = selftest.ping(port, ota.baudrate, args.runs * 10)
+        session.release()
+        print('  {:12s} otaStart/otaReady {:5.1f} ms, packet round trip p50 {:5.1f} ms, '
+              'image written in {:5.1f} ms ({})'.format(
+                  'low latency' if lowLatency else 'default', handshake * 1000,
+                  statistics.median(times) * 1000, send * 1000,
+                  '{} byte writes'.format(writeSize) if writeSize else 'one write per packet'))
+
+# times the import of modules in a fresh interpreter
+importScript = """
+import sys, time
+begin = time.perf_counter()
+for name in sys.argv[1:]:
+    __import__(name)
+elapsed = time.perf_counter() - begin
+print(elapsed, any(m.startswith('PyQt5') for m in sys.modules))
+"""
+
+def importTime(modules, runs):
+    '''Returns the fastest import of modules in runs fresh interpreters
+    and whether they loaded Qt.'''
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = float('inf')
+    for i in range(runs):
+        result = subprocess.run([sys.executable, '-c', importScript] + modules, cwd=here,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+        elapsed, qt = result.stdout.decode().split('\n')[-2].split()
+        best = min(best, float(elapsed))
+    return best, qt == 'True'
+
+def programBluetooth(device):
+    core = smartdrivebluetoothcore.SmartDriveBluetoothCore(
+        'firmwares/SmartDriveBluetooth.1.6.fw', device=device)
+    errors = []
+    core.events.connect('failed', errors.append)
+    return core.program(), errors
+
+def benchCore(args):
+    fakes = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakes')
+    os.environ.setdefault('SD_LPC21ISP', os.path.join(fakes, 'lpc21isp'))
+    os.environ.setdefault('SD_BLEUPDATE_CLI', os.path.join(fakes, 'bleupdate-cli'))
+    os.environ.setdefault('FAKE_SPEED', '0')
+    print('core: import time in a fresh interpreter, best of {} (target {:.0f} ms)'.format(
+        args.runs, args.target))
+    for modules in (['smartdrivecore'], ['smartdrivebluetoothcore'],
+                    ['smartdrive'], ['smartdrivebluetooth']):
+        elapsed, qt = importTime(modules, args.runs)
+        print('  {:24s} {:6.1f} ms  {}{}'.format(
+            ' '.join(modules), elapsed * 1000, 'Qt' if qt else 'no Qt',
+            '' if qt or elapsed * 1000 < args.target else '  OVER TARGET'))
+
+    ports = simulatedPorts(args.units, 'core')
+    devices = ['FAKE{}'.format(i) for i in range(args.units)]
+    begin = time.perf_counter()
+    with multiprocessing.Pool(args.units) as pool:
+        mx2 = pool.starmap(headless.programPort,
+                           [(p, args.firmware, headless.stages, 0) for p in ports])
+        ble = pool.map(programBluetooth, devices)
+    elapsed = time.perf_counter() - begin
+    failed = [r['error'] for r in mx2 if not r['ok']] + [e for ok, e in ble if not ok]
+    print('  {} units in worker processes in {:.2f} s, {} failed{}'.format(
+        args.units, elapsed, len(failed), ': {}'.format(failed[0]) if failed else ''))
+
+def main():
+    parser = argparse.ArgumentParser(description='SD Programmer benchmarks')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--firmware', default=defaultFirmware,
+                        help='MX2+ OTA file used as payload')
+    sub = parser.add_subparsers(dest='benchmark')
+
+    p = sub.add_parser('decoder', help='streaming packet decoder frames/s')
+    p.add_argument('--noise', type=float, default=0.1,
+                   help='fraction of packets preceded by noise')
+    p.add_argument('--chunk', type=int, default=64,
+                   help='maximum size of each received chunk')
+    p.add_argument('--repeat', type=int, default=10,
+                   help='number of times to send the firmware')
+    p.set_defaults(func=benchDecoder)
+
+    p = sub.add_parser('packet', help='packet memory use and encode throughput')
+    p.add_argument('--repeat', type=int, default=10,
+                   help='number of times to frame the firmware')
+    p.set_defaults(func=benchPacket)
+
+    p = sub.add_parser('pool', help='multi-port scaling, threads vs processes')
+    p.add_argument('--ports', type=int, default=None,
+                   help='maximum number of simulated ports, defaults to the core count')
+    p.add_argument('--repeat', type=int, default=10,
+                   help='number of copies of the firmware in the image sent to each port')
+    p.set_defaults(func=benchPool)
+
+    p = sub.add_parser('bleparser', help='bleupdate-cli output parser cost per byte')
+    p.add_argument('--lines', type=int, default=2000,
+                   help='progress lines in the smallest log')
+    p.add_argument('--chunk', type=int, default=256,
+                   help='maximum size of each output chunk')
+    p.set_defaults(func=benchBLEParser)
+
+    p = sub.add_parser('trace', help='serial tracing overhead on the OTA transfer')
+    p.add_argument('--repeat', type=int, default=10,
+                   help='number of copies of the firmware in the image sent')
+    p.add_argument('--runs', type=int, default=5,
+                   help='runs with and without tracing')
+    p.set_defaults(func=benchTrace)
+
+    p = sub.add_parser('bundle', help='one-file executable data extraction at startup')
+    p.add_argument('--runs', type=int, default=5)
+    p.set_defaults(func=benchBundle)
+
+    p = sub.add_parser('dashboard', help='dashboard repaints for a stream of progress updates')
+    p.add_argument('--tiles', type=int, default=16)
+    p.add_argument('--rate', type=float, default=500, help='progress updates per second')
+    p.add_argument('--seconds', type=float, default=3)
+    p.set_defaults(func=benchDashboard)
+
+    p = sub.add_parser('manifest', help='firmware manifest check, first and cached')
+    p.add_argument('--units', type=int, default=1000)
+    p.set_defaults(func=benchManifest)
+
+    p = sub.add_parser('soak', help='memory of tool output capture over a shift of units')
+    p.add_argument('--units', type=int, default=480,
+                   help='units programmed, 60 an hour for an 8 hour shift')
+    p.add_argument('--flood', type=int, default=1,
+                   help='MB printed by one runaway tool')
+    p.set_defaults(func=benchSoak)
+
+    p = sub.add_parser('latency', help='round trips with and without low latency mode')
+    p.add_argument('--timer', type=float, default=16, help='adapter latency timer (ms)')
+    p.add_argument('--runs', type=int, default=5)
+    p.set_defaults(func=benchLatency)
+
+    p = sub.add_parser('core', help='import time of the Qt-free cores and units in workers')
+    p.add_argument('--runs', type=int, default=5)
+    p.add_argument('--target', type=float, default=50, help='import time target (ms)')
+    p.add_argument('--units', type=int, default=4, help='units programmed by worker processes')
+    p.set_defaults(func=benchCore)
+
+    args = parser.parse_args()
+    if args.benchmark is None:
+        parser.print_help()
+        sys.exit(1)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
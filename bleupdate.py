@@ -0,0 +1,142 @@
+'''Incremental parsing of bleupdate-cli output.
+
+Output is fed to an OutputParser in whatever chunks it arrives in.  Only
+complete lines are parsed, each exactly once, and only the unfinished
+last line is kept between chunks, so the cost stays linear in the size
+of the output.  Each parsed line produces zero or more events:
+
+    Debugger(device)                        list: a CC-Debugger was found
+    DeviceInfo(serial, licenseKey, address) get: all device info is known
+    Progress(percent, phase)                update: programming progress
+    Phase(text)                             any other status line
+    Error(message)                          an error was reported
+'''
+import re
+from collections import namedtuple
+
+Debugger = namedtuple('Debugger', 'device')
+DeviceInfo = namedtuple('DeviceInfo', 'serial licenseKey address')
+Progress = namedtuple('Progress', 'percent phase')
+Phase = namedtuple('Phase', 'text')
+Error = namedtuple('Error', 'message')
+
+# a CC-Debugger in the output of 'bleupdate-cli list', identified by its
+# serial number if it is printed and by its index otherwise; the format is
+# that of fakes/bleupdate-cli and unverified against the real tool
+debuggerPattern = re.compile(
+    r'^\s*(?:\[?(\d+)\]?[:.)]?\s*)?.*CC Debugger(?:.*?serial(?: number)?\s*[:=]?\s*(\w+))?',
+    re.I)
+serialPattern = re.compile(r'Serial number\s*:\s*([\d\w]+)')
+addressPattern = re.compile(r'Address\s*:\s*([\d:\w]+)')
+licensePattern = re.compile(r'License key\s*:\s*([\d\w]+)')
+percentPattern = re.compile(r'(\d{1,3})(?:\.\d+)?\s*%')
+numberPattern = re.compile(r'^\s*(\d{1,3})\s*$')
+# bleupdate-cli starts its error lines with 'Error:' or 'Failed'; a match
+# anywhere in the line would also take '0 errors' or 'failsafe' for one
+errorPattern = re.compile(r'^\s*(?:(?:error|failure)\s*(?:[:!-]|$)|failed\b)', re.I)
+# progress bars redraw the line with carriage returns
+linePattern = re.compile(r'\r\n|\r|\n')
+
+# how much of an unterminated line is kept
+maxLineLength = 4096
+
+def parseDebuggers(output):
+    '''Returns the device selectors of the CC-Debuggers in list output.'''
+    parser = OutputParser('list')
+    parser.feed(output)
+    parser.finish()
+    return parser.devices
+
+class OutputParser:
+    def __init__(self, command):
+        self.command = command
+        self.tail = ''
+        self.devices = []
+        self.serial = None
+        self.licenseKey = None
+        self.address = None
+        self.percent = 0
+        self.phase = ''
+        self.errors = []
+
+    @property
+    def deviceInfo(self):
+        if self.serial is None or self.licenseKey is None or self.address is None:
+            return None
+        return DeviceInfo(self.serial, self.licenseKey, self.address)
+
+    def feed(self, text):
+        '''Parses the complete lines in text and returns their events.'''
+        lines = linePattern.split(self.tail + text)
+        self.tail = lines.pop()[-maxLineLength:]
+        events = []
+        for line in lines:
+            self.parseLine(line, events)
+        return events
+
+    def finish(self):
+        '''Parses the unterminated last line once the process has exited.'''
+        events = []
+        if self.tail:
+            self.parseLine(self.tail, events)
+            self.tail = ''
+        return events
+
+    def parseLine(self, line, events):
+        line = line.strip()
+        if not line:
+            return
+        if errorPattern.search(line):
+            self.errors.append(line)
+            events.append(Error(line))
+            if self.command == 'get':
+                # the line may still carry device info
+                self.parseGetLine(line, events, phase=False)
+        elif self.command == 'list':
+            self.parseListLine(line, events)
+        elif self.command == 'get':
+            self.parseGetLine(line, events)
+        elif self.command == 'update':
+            self.parseUpdateLine(line, events)
+
+    def parseListLine(self, line, events):
+        m = debuggerPattern.search(line)
+        if m is None:
+            events.append(Phase(line))
+            return
+        device = m.group(2) or m.group(1) or str(len(self.devices))
+        if device not in self.devices:
+            self.devices.append(device)
+            events.append(Debugger(device))
+
+    def parseGetLine(self, line, events, phase=True):
+        complete = self.deviceInfo is not None
+        for pattern, name in ((serialPattern, 'serial'),
+                              (addressPattern, 'address'),
+                              (licensePattern, 'licenseKey')):
+            m = pattern.search(line)
+            if m is not None:
+                setattr(self, name, m.group(1))
+                break
+        else:
+            if phase:
+                events.append(Phase(line))
+            return
+        if not complete and self.deviceInfo is not None:
+            events.append(self.deviceInfo)
+
+    def parseUpdateLine(self, line, events):
+        m = percentPattern.search(line) or numberPattern.search(line)
+        if m is None:
+            self.phase = line
+            events.append(Phase(line))
+            return
+        # progress never goes backwards within a phase
+        percent = min(100, int(m.group(1)))
+        text = line[:m.start()].strip(' :-[')
+        if text and text != self.phase:
+            self.phase = text
+            self.percent = percent
+        else:
+            self.percent = max(self.percent, percent)
+        events.append(Progress(self.percent, self.phase))
@@ -0,0 +1,164 @@
+'''A pool of lpc21isp processes, one per port, shared by the stations.
+
+Every unit's bootloader is a separate lpc21isp run that synchronizes
+with the chip's ISP autobaud again, so runs can't share a sync; what can
+be shared is the waiting.  The pool runs the lpc21isp of many ports at
+once, up to maxRunning at a time (the rest are queued in order), kills a
+run that takes longer than timeout seconds, and reports each run with an
+lpc21isp.Result.  Runs are started with a preset from lpc21isp.presets,
+e.g. 'fast' for a higher baud rate or 'nowipe' for blank units.
+
+The pool lives on one thread; submit() and cancel() are slots, so the
+stations on other threads call them through queued signals.
+'''
+import collections
+import time
+
+from PyQt5.QtCore import QObject, QProcess, QTimer, pyqtSignal, pyqtSlot
+
+import capture
+import lpc21isp
+import tools
+
+# lpc21isp runs at the same time, by default
+maxRunning = 8
+# seconds a run may take before it is killed
+timeout = lpc21isp.timeout
+
+class Run:
+    '''One lpc21isp run, queued or running.'''
+    def __init__(self, portName, preset):
+        self.portName = portName
+        self.preset = preset
+        self.process = None
+        self.timer = None
+        self.output = None
+        self.parser = None
+        self.begin = time.monotonic()
+        self.error = None
+        self.stopped = False
+
+class BootloaderPool(QObject):
+    '''Runs lpc21isp for the submitted ports.'''
+    # port, percent, status
+    status = pyqtSignal(str, int, str)
+    # lpc21isp.Result
+    finished = pyqtSignal(object)
+
+    def __init__(self, maxRunning=maxRunning, timeout=timeout, parent=None):
+        super().__init__(parent)
+        self.maxRunning = maxRunning
+        self.timeout = timeout
+        self.queue = collections.deque()
+        self.running = {}
+
+    def isBusy(self, portName):
+        return portName in self.running or any(r.portName == portName for r in self.queue)
+
+    @pyqtSlot(str, str)
+    def submit(self, portName, preset='default'):
+        '''Programs the bootloader on the port when a slot is free. A port
+        that already has a run is left alone: its Result is the one the
+        submitter gets.'''
+        run = Run(portName, preset)
+        if self.isBusy(portName):
+            # a Result for the port now would be taken for the running one's
+            print("[BOOTLOADER] {}: lpc21isp is already running, not submitted again".format(
+                portName))
+            return
+        try:
+            lpc21isp.getPreset(preset)
+        except ValueError as error:
+            self.finish(run, None, str(error))
+            return
+        self.queue.append(run)
+        if len(self.running) >= self.maxRunning:
+            self.status.emit(portName, 0, 'Waiting for lpc21isp ({} running)'.format(len(self.running)))
+        self.startNext()
+
+    @pyqtSlot(str)
+    def cancel(self, portName):
+        '''Stops the port's run, or takes it out of the queue.'''
+        for run in list(self.queue):
+            if run.portName == portName:
+                self.queue.remove(run)
+                run.stopped = True
+                self.finish(run, None, None)
+        run = self.running.get(portName)
+        if run is not None:
+            run.stopped = True
+            run.process.kill()
+
+    @pyqtSlot()
+    def cancelAll(self):
+        self.queue.clear()
+        for portName in list(self.running):
+            self.cancel(portName)
+
+    def startNext(self):
+        while self.queue and len(self.running) < self.maxRunning:
+            self.start(self.queue.popleft())
+
+    def start(self, run):
+        run.output = capture.OutputCapture('lpc21isp', run.portName)
+        run.parser = lpc21isp.OutputParser()
+        run.process = QProcess(self)
+        run.process.setProcessChannelMode(QProcess.MergedChannels)
+        run.process.readyReadStandardOutput.connect(lambda: self.onDataReady(run))
+        run.process.errorOccurred.connect(lambda error: self.onError(run, error))
+        run.process.finished.connect(lambda code, status: self.onFinished(run, code, status))
+        run.timer = QTimer(self)
+        run.timer.setSingleShot(True)
+        run.timer.timeout.connect(lambda: self.onTimeout(run))
+        self.running[run.portName] = run
+        self.status.emit(run.portName, 0, '')
+        run.process.start(lpc21isp.program(), lpc21isp.arguments(run.portName, preset=run.preset))
+        if self.timeout:
+            run.timer.start(int(self.timeout * 1000))
+
+    def onDataReady(self, run):
+        data = run.output.feed(run.process.readAllStandardOutput())
+        percent, state = run.parser.feed(data)
+        self.status.emit(run.portName, int(percent), state)
+
+    def onError(self, run, error):
+        if error == QProcess.FailedToStart:
+            # finished is not emitted for a process that never ran
+            self.onFinished(run, None, error)
+        elif run.error is None:
+            run.error = tools.processErrorToString(error)
+
+    def onTimeout(self, run):
+        run.error = 'lpc21isp did not finish within {:g} s'.format(self.timeout)
+        run.process.kill()
+
+    def onFinished(self, run, code, status):
+        if self.running.get(run.portName) is not run:
+            return
+        del self.running[run.portName]
+        run.timer.stop()
+        run.parser.feed(run.output.finish())
+        error = None
+        if run.stopped:
+            pass
+        elif code is None:
+            error = "Couldn't run lpc21isp: {}".format(tools.processErrorToString(status))
+        elif code != 0 or status != QProcess.NormalExit or run.error is not None:
+            error = run.output.saveOnFailure("Bootloader failed: {}: {}".format(
+                code, run.error or status))
+        run.output.close()
+        run.process.deleteLater()
+        run.timer.deleteLater()
+        self.finish(run, code, error)
+        self.startNext()
+
+    def finish(self, run, code, error):
+        seconds = time.monotonic() - run.begin
+        if run.stopped:
+            self.status.emit(run.portName, 0, 'Bootloader stopped.')
+        elif error is None:
+            self.status.emit(run.portName, 100, 'Bootloader complete')
+        else:
+            self.status.emit(run.portName, 0, 'Bootloader failed.')
+        self.finished.emit(lpc21isp.Result(run.portName, run.preset, error is None and not run.stopped,
+                                           code, error, run.stopped, seconds))
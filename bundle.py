@@ -0,0 +1,53 @@
+'''Data files bundled into the one-file Programmer executable.
+
+The one-file executable extracts every bundled file to a temporary
+folder at each launch, so only the files the programmer uses are
+bundled, and the MX2+ OTA images are bundled gzip compressed; they are
+decompressed block by block while they are sent (see ota.FirmwareFile).
+The lpc21isp hex file and the BLE image are handed to external tools by
+path, so they stay uncompressed.
+'''
+import glob
+import gzip
+import os
+import shutil
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# the pictures shown on the pages
+images = [
+    'images/cable.jpg',
+    'images/bootloaderProgramming.jpg',
+    'images/firmwareProgramming.jpg',
+    'images/runMX2+.jpg',
+]
+
+def compress(src, dst):
+    with open(src, 'rb') as fIn, gzip.open(dst, 'wb', compresslevel=9) as fOut:
+        shutil.copyfileobj(fIn, fOut)
+
+def relative(*patterns):
+    names = []
+    for pattern in patterns:
+        names += glob.glob(os.path.join(here, pattern), recursive=True)
+    return sorted(os.path.relpath(n, here).replace(os.sep, '/')
+                  for n in names if os.path.isfile(n))
+
+def datas(buildDir):
+    '''Returns the bundled files as (name in bundle, source path) pairs.
+    The OTA images are compressed into buildDir.'''
+    files = [(name, os.path.join(here, name)) for name in
+             relative('exes/*', 'icons/**/*', 'firmwares/*.hex', 'firmwares/*.fw',
+                      'firmwares/manifest.json') + images]
+    os.makedirs(os.path.join(buildDir, 'firmwares'), exist_ok=True)
+    for name in relative('firmwares/*.ota'):
+        dst = os.path.join(buildDir, name + '.gz')
+        compress(os.path.join(here, name), dst)
+        files.append((name + '.gz', dst))
+    return files
+
+def previousDatas():
+    '''The files bundled before: everything in exes, firmwares, icons and
+    images, uncompressed.'''
+    return [(name, os.path.join(here, name)) for name in
+            relative('exes/*', 'firmwares/*', 'icons/**/*', 'images/*')]
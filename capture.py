@@ -0,0 +1,111 @@
+'''Bounded capture of the output of external tools.
+
+The bootloader and Bluetooth stages launch lpc21isp and bleupdate-cli
+thousands of times a shift.  An OutputCapture decodes their output
+incrementally, so a multibyte character split across two reads is kept
+whole, and keeps only the most recent lines in memory.  The full output
+goes to a spool file that stays in memory while it is small and is
+written to disk past spoolSize; it is discarded when the capture is
+closed, unless the run failed and the log is saved with save().
+
+Saved logs go to $SD_LOG_DIR, or ~/.sdprogrammer/logs.
+'''
+import codecs
+import collections
+import os
+import re
+import shutil
+import tempfile
+import time
+
+# recent lines kept in memory by each capture
+maxLines = 200
+# how much of an unterminated line is kept, e.g. lpc21isp's progress dots
+maxLineLength = 4096
+# bytes of full output kept in memory before the spool goes to disk
+spoolSize = 65536
+
+linePattern = re.compile(r'\r\n|\r|\n')
+
+def logDir():
+    return os.environ.get('SD_LOG_DIR') or os.path.join(
+        os.path.expanduser('~'), '.sdprogrammer', 'logs')
+
+def logFileName(directory, tool, name):
+    '''Returns a new log file name for a tool run on name in directory.'''
+    safeName = re.sub(r'[^\w.-]+', '_', '{}-{}'.format(tool, name or '')).strip('_')
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(directory, '{}-{}.log'.format(safeName, stamp))
+
+class OutputCapture:
+    '''Output of one run of an external tool.'''
+    def __init__(self, tool, name=None, lines=maxLines):
+        self.tool = tool
+        self.name = name
+        # one decoder per output channel, so stdout and stderr reads can
+        # interleave without splitting each other's characters
+        self.decoders = {}
+        self.lines = collections.deque(maxlen=lines)
+        self.tail = ''
+        self.size = 0
+        self.spool = tempfile.SpooledTemporaryFile(spoolSize)
+
+    def feed(self, data, channel='stdout'):
+        '''Adds the bytes read from the process's channel, returns them
+        decoded.'''
+        data = bytes(data)
+        self.size += len(data)
+        if self.spool is not None:
+            self.spool.write(data)
+        decoder = self.decoders.get(channel)
+        if decoder is None:
+            decoder = self.decoders[channel] = codecs.getincrementaldecoder('utf-8')('replace')
+        return self.add(decoder.decode(data))
+
+    def finish(self):
+        '''Decodes what is left once the process has exited.'''
+        text = self.add(''.join(d.decode(b'', True) for d in self.decoders.values()))
+        if self.tail:
+            self.lines.append(self.tail)
+            self.tail = ''
+        return text
+
+    def add(self, text):
+        lines = linePattern.split(self.tail + text)
+        self.tail = lines.pop()[-maxLineLength:]
+        self.lines.extend(lines)
+        return text
+
+    def text(self):
+        '''The recent lines, as text.'''
+        return '\n'.join(list(self.lines) + ([self.tail] if self.tail else []))
+
+    def save(self, fileName=None):
+        '''Writes the full output to fileName, or a new file in logDir(),
+        and returns its name.'''
+        if fileName is None:
+            directory = logDir()
+            os.makedirs(directory, exist_ok=True)
+            fileName = logFileName(directory, self.tool, self.name)
+        with open(fileName, 'wb') as f:
+            if self.spool is not None:
+                self.spool.seek(0)
+                shutil.copyfileobj(self.spool, f)
+                self.spool.seek(0, os.SEEK_END)
+            else:
+                f.write(self.text().encode('utf-8'))
+        return fileName
+
+    def saveOnFailure(self, message):
+        '''Saves the full output and returns message with the log's name.'''
+        try:
+            fileName = self.save()
+        except OSError as error:
+            return '{}\n(could not save the {} log: {})'.format(message, self.tool, error)
+        return '{}\n{} log saved to {}'.format(message, self.tool, fileName)
+
+    def close(self):
+        '''Discards the full output; the recent lines are kept.'''
+        spool, self.spool = self.spool, None
+        if spool is not None:
+            spool.close()
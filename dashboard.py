@@ -0,0 +1,478 @@
+'''Multi-station dashboard: one tile per serial port and per CC-Debugger.
+
+Every tile shows its unit's stage, percent, status, throughput and last
+error.  Progress comes from the SmartDrive and BluetoothStation signals
+and goes into a StationModel, which collects the changed rows and tells
+the view about them once per frame, so hundreds of progress updates a
+second still cost one repaint per frame.
+
+Opening a tile (double click or Enter) shows the DIP switch
+instructions for the unit's next step and starts it.  "Program All
+Bootloaders" starts the bootloader on every station waiting for one;
+their lpc21isp runs share one BootloaderPool, which runs several at once.
+'''
+import time
+
+from PyQt5 import QtGui
+from PyQt5.QtCore import (QAbstractTableModel, QModelIndex, QObject, QRect, QSize, Qt,
+                          QThread, QTimer, pyqtSignal, pyqtSlot)
+from PyQt5.QtWidgets import (QApplication, QDialog, QFileDialog, QLabel, QListView,
+                             QMainWindow, QPushButton, QStyle, QStyledItemDelegate,
+                             QStyleOptionProgressBar, QVBoxLayout)
+
+import pages
+import resource
+import tools
+from action import Action
+from bootloaderpool import BootloaderPool
+from smartdrive import SmartDrive
+from smartdrivebluetooth import BluetoothStation
+
+columns = ('name', 'stage', 'percent', 'status', 'rate', 'units', 'error')
+
+class Tile:
+    '''State of one port or debugger.'''
+    def __init__(self, key, name, kind):
+        self.key = key
+        self.name = name
+        # 'mx2' for a serial port, 'ble' for a CC-Debugger
+        self.kind = kind
+        self.stage = 'idle'
+        self.percent = 0
+        self.status = ''
+        # bytes/s of the running stage, if known
+        self.rate = None
+        self.units = 0
+        self.error = None
+        self.running = False
+        self.stageStart = None
+        # bytes sent by the running stage at 100%
+        self.size = None
+
+class StationModel(QAbstractTableModel):
+    '''Tiles as table rows, one column per field in columns.'''
+    TileRole = Qt.UserRole
+    # longest time an update waits before it is shown (ms)
+    frameInterval = 16
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tiles = []
+        self.rows = {}
+        self.dirty = set()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.frameInterval)
+        self.timer.timeout.connect(self.flush)
+        # for measuring the batching
+        self.updates = 0
+        self.frames = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.tiles)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        tile = self.tiles[index.row()]
+        if role == self.TileRole:
+            return tile
+        if role == Qt.DisplayRole:
+            return getattr(tile, columns[index.column()])
+        if role == Qt.ToolTipRole:
+            return '\n'.join(t for t in (tile.name, tile.status, tile.error) if t)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return columns[section]
+        return None
+
+    def addTile(self, key, name, kind):
+        '''Adds a tile for key, or returns the existing one.'''
+        if key in self.rows:
+            return self.tiles[self.rows[key]]
+        row = len(self.tiles)
+        self.beginInsertRows(QModelIndex(), row, row)
+        tile = Tile(key, name, kind)
+        self.tiles.append(tile)
+        self.rows[key] = row
+        self.endInsertRows()
+        return tile
+
+    def tile(self, key):
+        return self.tiles[self.rows[key]]
+
+    def changed(self, key):
+        '''Schedules the tile's row to be repainted with the next frame.'''
+        self.updates += 1
+        self.dirty.add(self.rows[key])
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        if not self.dirty:
+            return
+        first, last = min(self.dirty), max(self.dirty)
+        self.dirty.clear()
+        self.frames += 1
+        self.dataChanged.emit(self.index(first, 0), self.index(last, len(columns) - 1))
+
+    # progress of a tile
+    def onStart(self, key, stage, size=None):
+        tile = self.tile(key)
+        tile.stage = stage
+        tile.percent = 0
+        tile.status = 'Starting'
+        tile.rate = None
+        tile.error = None
+        tile.running = True
+        tile.stageStart = time.monotonic()
+        tile.size = size
+        self.changed(key)
+
+    def onStatus(self, key, percent, status):
+        tile = self.tile(key)
+        percent = min(100, max(0, int(percent)))
+        tile.percent = percent
+        tile.status = status
+        if tile.size and tile.stageStart is not None:
+            elapsed = time.monotonic() - tile.stageStart
+            if elapsed > 0:
+                tile.rate = tile.size * percent / 100 / elapsed
+        self.changed(key)
+
+    def onFinished(self, key, status, unitDone=False):
+        tile = self.tile(key)
+        tile.percent = 100
+        tile.status = status
+        tile.running = False
+        if unitDone:
+            tile.units += 1
+        self.changed(key)
+
+    def onFailed(self, key, error):
+        tile = self.tile(key)
+        tile.status = 'Failed'
+        tile.error = error
+        tile.running = False
+        self.changed(key)
+
+class TileDelegate(QStyledItemDelegate):
+    '''Paints a tile: name, stage, progress, throughput and last error.'''
+    size = QSize(280, 140)
+    margin = 6
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.paints = 0
+
+    def sizeHint(self, option, index):
+        return self.size
+
+    def paint(self, painter, option, index):
+        self.paints += 1
+        tile = index.data(StationModel.TileRole)
+        rect = option.rect.adjusted(2, 2, -2, -2)
+        if tile.error:
+            color = QtGui.QColor(200, 40, 40)
+        elif tile.running:
+            color = QtGui.QColor(40, 110, 200)
+        elif tile.percent == 100:
+            color = QtGui.QColor(40, 160, 60)
+        else:
+            color = QtGui.QColor(150, 150, 150)
+
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(rect, option.palette.highlight().color().lighter(180))
+        painter.setPen(QtGui.QPen(color, 2))
+        painter.drawRect(rect)
+
+        m = self.margin
+        lineHeight = option.fontMetrics.height()
+        x, y, w = rect.x() + m, rect.y() + m, rect.width() - 2 * m
+
+        units = '{} units'.format(tile.units)
+        unitsWidth = option.fontMetrics.width(units) + m
+        font = QtGui.QFont(option.font)
+        font.setBold(True)
+        painter.setFont(font)
+        painter.setPen(option.palette.text().color())
+        painter.drawText(QRect(x, y, w - unitsWidth, lineHeight), Qt.AlignLeft,
+                         QtGui.QFontMetrics(font).elidedText(tile.name, Qt.ElideRight,
+                                                             w - unitsWidth))
+        painter.setFont(option.font)
+        painter.drawText(QRect(x, y, w, lineHeight), Qt.AlignRight, units)
+        y += lineHeight
+
+        painter.drawText(QRect(x, y, w, lineHeight), Qt.AlignLeft, tile.stage)
+        y += lineHeight
+        painter.drawText(QRect(x, y, w, lineHeight), Qt.AlignLeft,
+                         option.fontMetrics.elidedText(tile.status, Qt.ElideRight, w))
+        y += lineHeight + 2
+
+        bar = QStyleOptionProgressBar()
+        bar.rect = QRect(x, y, w, lineHeight)
+        bar.minimum = 0
+        bar.maximum = 100
+        bar.progress = int(tile.percent)
+        bar.text = '{}%'.format(int(tile.percent))
+        bar.textVisible = True
+        QApplication.style().drawControl(QStyle.CE_ProgressBar, bar, painter)
+        y += lineHeight + 2
+
+        if tile.rate:
+            painter.drawText(QRect(x, y, w, lineHeight), Qt.AlignLeft,
+                             '{:.1f} kB/s'.format(tile.rate / 1000))
+        y += lineHeight
+        if tile.error:
+            painter.setPen(QtGui.QColor(200, 40, 40))
+            painter.drawText(QRect(x, y, w, lineHeight), Qt.AlignLeft,
+                             option.fontMetrics.elidedText(
+                                 tile.error.replace('\n', ' '), Qt.ElideRight, w))
+        painter.restore()
+
+class Dashboard(QListView):
+    '''Grid of tiles over a StationModel.'''
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.delegate = TileDelegate(self)
+        self.setViewMode(QListView.IconMode)
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        self.setUniformItemSizes(True)
+        self.setSpacing(4)
+        self.setItemDelegate(self.delegate)
+        self.setModel(model)
+
+class InstructionsDialog(QDialog):
+    '''DIP switch instructions for the next step of a unit.'''
+    def __init__(self, title, instructions, parent=None, button='Start'):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        text, picture = instructions
+        layout = QVBoxLayout(self)
+        label = QLabel(text)
+        label.setWordWrap(True)
+        layout.addWidget(label)
+        image = QLabel(self)
+        image.setPixmap(QtGui.QPixmap(resource.path(picture)).scaled(
+            QSize(600, 450), Qt.KeepAspectRatio))
+        layout.addWidget(image)
+        startButton = QPushButton(button)
+        startButton.clicked.connect(self.accept)
+        layout.addWidget(startButton)
+
+class PortStation(QObject):
+    '''A SmartDrive on its own thread for one tile, stepping through
+    bootloader, firmware and the run switches for each unit.'''
+    startBootloader = pyqtSignal()
+    startFirmware = pyqtSignal()
+    stopSignal = pyqtSignal()
+
+    def __init__(self, portName, model, fwFileName=None, pool=None, bootloaderPreset='default'):
+        super().__init__()
+        self.portName = portName
+        self.model = model
+        model.addTile(portName, portName, 'mx2')
+        # the step the operator starts next: bootloader, firmware or run
+        self.next = 'bootloader'
+
+        self.thread = QThread()
+        self.smartDrive = SmartDrive(portName, fwFileName, pool=pool,
+                                     bootloaderPreset=bootloaderPreset)
+        self.smartDrive.moveToThread(self.thread)
+        self.startBootloader.connect(self.smartDrive.programBootloader)
+        self.startFirmware.connect(self.smartDrive.programFirmware)
+        self.stopSignal.connect(self.smartDrive.stop)
+        self.smartDrive.bootloaderStatus.connect(self.onStatus)
+        self.smartDrive.bootloaderFinished.connect(self.onBootloaderFinished)
+        self.smartDrive.bootloaderFailed.connect(self.onFailed)
+        self.smartDrive.firmwareStatus.connect(self.onStatus)
+        self.smartDrive.firmwareFinished.connect(self.onFirmwareFinished)
+        self.smartDrive.firmwareFailed.connect(self.onFailed)
+        self.thread.start()
+
+    def instructions(self):
+        return {
+            'bootloader': pages.bootloaderSwitches,
+            'firmware': pages.firmwareSwitches,
+            'run': pages.runSwitches,
+        }[self.next]
+
+    def startNext(self):
+        if self.next == 'bootloader':
+            self.model.onStart(self.portName, 'bootloader')
+            self.startBootloader.emit()
+        elif self.next == 'firmware':
+            fw = self.smartDrive.fw
+            self.model.onStart(self.portName, 'firmware', len(fw) if fw else None)
+            self.startFirmware.emit()
+        else:
+            # the unit is done, the next one starts with the bootloader
+            self.next = 'bootloader'
+            self.model.onFinished(self.portName, 'Ready for the next unit')
+
+    @pyqtSlot(int, str)
+    def onStatus(self, percent, status):
+        self.model.onStatus(self.portName, percent, status)
+
+    @pyqtSlot()
+    def onBootloaderFinished(self):
+        self.next = 'firmware'
+        self.model.onFinished(self.portName, 'Set the DIP switches for firmware')
+
+    @pyqtSlot()
+    def onFirmwareFinished(self):
+        self.next = 'run'
+        self.model.onFinished(self.portName, 'Set the DIP switches for running', unitDone=True)
+
+    @pyqtSlot(str)
+    def onFailed(self, error):
+        self.model.onFailed(self.portName, error)
+
+    def stop(self):
+        self.smartDrive.stop()
+        self.thread.quit()
+        self.thread.wait()
+        self.smartDrive.releasePort()
+
+class DashboardWindow(QMainWindow):
+    '''Programs the MX2+ on every port and SmartDrive Bluetooth on every
+    CC-Debugger from one window.'''
+    startBluetooth = pyqtSignal()
+
+    def __init__(self, portNames, fwFileName=None, bleFileName=None,
+                 bootloaderPreset='default', bootloaderJobs=None):
+        super().__init__()
+        self.setWindowTitle('Programmer Dashboard')
+        self.model = StationModel(self)
+        self.view = Dashboard(self.model, self)
+        self.view.activated.connect(self.openTile)
+        self.setCentralWidget(self.view)
+
+        # the stations' lpc21isp runs, on this thread
+        self.pool = BootloaderPool(parent=self)
+        if bootloaderJobs:
+            self.pool.maxRunning = bootloaderJobs
+        self.stations = {p: PortStation(p, self.model, fwFileName, self.pool, bootloaderPreset)
+                         for p in portNames}
+
+        self.bleThread = QThread()
+        self.bluetooth = BluetoothStation(bleFileName)
+        self.bluetooth.moveToThread(self.bleThread)
+        self.startBluetooth.connect(self.bluetooth.start)
+        self.bluetooth.debuggersFound.connect(self.onDebuggersFound)
+        self.bluetooth.status.connect(self.onBluetoothStatus)
+        self.bluetooth.deviceInfo.connect(self.onBluetoothDeviceInfo)
+        self.bluetooth.firmwareFinished.connect(self.onBluetoothFinished)
+        self.bluetooth.failed.connect(self.onBluetoothFailed)
+        self.bleThread.start()
+
+        toolbar = self.addToolBar('dashboard')
+        openAction = Action(resource.path('icons/toolbar/open.png'), 'Select MX2+ Firmware', self)
+        openAction.triggered.connect(self.onOpenFirmwareFile)
+        toolbar.addAction(openAction)
+        openBleAction = Action(resource.path('icons/toolbar/open.png'), 'Select BLE Firmware', self)
+        openBleAction.triggered.connect(self.onOpenBLEFile)
+        toolbar.addAction(openBleAction)
+        bootloaderAction = Action(resource.path('icons/toolbar/start.png'), 'Program All Bootloaders', self)
+        bootloaderAction.setStatusTip('Program the bootloader on every station waiting for one')
+        bootloaderAction.triggered.connect(self.onProgramAllBootloaders)
+        toolbar.addAction(bootloaderAction)
+        bleAction = Action(resource.path('icons/toolbar/start.png'), 'Program Bluetooth', self)
+        bleAction.setStatusTip('Program SmartDrive Bluetooth on every CC-Debugger')
+        bleAction.triggered.connect(self.onProgramBluetooth)
+        toolbar.addAction(bleAction)
+        locateBleAction = Action(resource.path('icons/toolbar/open.png'), 'Locate bleupdate-cli', self)
+        locateBleAction.setStatusTip('Select the bleupdate-cli executable used to program BLE')
+        locateBleAction.triggered.connect(self.onLocateBleUpdate)
+        toolbar.addAction(locateBleAction)
+
+        self.setGeometry(0, 0, 1200, 800)
+        missing = [t.error for t in (tools.registry.get(n) for n in tools.specs) if t.error]
+        if missing:
+            self.statusBar().showMessage('; '.join(missing))
+        self.show()
+
+    def onOpenFirmwareFile(self):
+        fname, _ = QFileDialog.getOpenFileName(
+            self, 'Select MX2+ Firmware OTA File', '', 'OTA Files (*.ota *.ota.gz)')
+        # checked once here; the stations then get the cached result
+        if fname and pages.checkFirmware(self, fname, 'ota'):
+            for station in self.stations.values():
+                station.smartDrive.onFirmwareFileSelected(fname)
+
+    def onOpenBLEFile(self):
+        fname, _ = QFileDialog.getOpenFileName(
+            self, 'Select SmartDrive BLE Firmware File', '', 'Firmware Files (*.fw)')
+        if fname and pages.checkFirmware(self, fname, 'ble'):
+            self.bluetooth.onFirmwareFileSelected(fname)
+
+    def onLocateBleUpdate(self):
+        tool = pages.locateBleUpdate(self)
+        if tool is not None:
+            self.statusBar().showMessage(tools.describe(tool))
+
+    def openTile(self, index):
+        tile = index.data(StationModel.TileRole)
+        station = self.stations.get(tile.key)
+        if station is None or tile.running:
+            return
+        button = 'Next Unit' if station.next == 'run' else 'Start'
+        dialog = InstructionsDialog(tile.name, station.instructions(), self, button)
+        if dialog.exec_() == QDialog.Accepted:
+            station.startNext()
+
+    def onProgramAllBootloaders(self):
+        waiting = [s for s in self.stations.values()
+                   if s.next == 'bootloader' and not self.model.tile(s.portName).running]
+        if not waiting:
+            self.statusBar().showMessage('No station is waiting for its bootloader')
+            return
+        dialog = InstructionsDialog('{} stations'.format(len(waiting)), pages.bootloaderSwitches, self)
+        if dialog.exec_() == QDialog.Accepted:
+            for station in waiting:
+                station.startNext()
+
+    # bluetooth tiles
+    def onProgramBluetooth(self):
+        self.startBluetooth.emit()
+
+    def onDebuggersFound(self, devices):
+        for device in devices:
+            self.model.addTile(device, 'CC-Debugger ' + device, 'ble')
+            self.model.onStart(device, 'bluetooth')
+
+    def onBluetoothStatus(self, device, percent, status):
+        if device:
+            self.model.onStatus(device, percent, status)
+
+    def onBluetoothDeviceInfo(self, device, serialNumber, licenseKey, address):
+        # the device info is also reset before each unit
+        if serialNumber:
+            self.model.tile(device).name = '{} S/N {}'.format(device, serialNumber)
+            self.model.changed(device)
+
+    def onBluetoothFinished(self, device):
+        self.model.onFinished(device, 'SmartDrive Bluetooth Programming Complete!', unitDone=True)
+
+    def onBluetoothFailed(self, device, error):
+        if not device:
+            # no debugger found at all
+            self.statusBar().showMessage(error)
+            return
+        self.model.onFailed(device, error)
+
+    def closeEvent(self, event):
+        self.pool.cancelAll()
+        for station in self.stations.values():
+            station.stop()
+        self.bluetooth.stop()
+        self.bleThread.quit()
+        self.bleThread.wait()
+        event.accept()
@@ -0,0 +1,29 @@
+'''Named callbacks: the plain Python counterpart of Qt signals.
+
+The programming cores (smartdrivecore, smartdrivebluetoothcore) report
+progress and results through Events, so they run without Qt, e.g. in a
+worker process.  The Qt classes connect each event to the signal of the
+same name and forward the core's attributes with coreAttribute().
+'''
+
+class Events:
+    def __init__(self, *names):
+        self.callbacks = {name: [] for name in names}
+
+    def connect(self, name, callback):
+        '''Calls callback with the event's arguments each time it happens.'''
+        self.callbacks[name].append(callback)
+
+    def disconnect(self, name, callback):
+        self.callbacks[name].remove(callback)
+
+    def emit(self, name, *args):
+        for callback in list(self.callbacks[name]):
+            callback(*args)
+
+    def names(self):
+        return list(self.callbacks)
+
+def coreAttribute(name):
+    '''A read-only property forwarding name to self.core.'''
+    return property(lambda self: getattr(self.core, name), doc='See the core.')
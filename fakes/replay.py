@@ -0,0 +1,61 @@
+'''Replays a recorded tool output profile with its original timing.
+
+A profile has one step per line: the seconds to wait before the step, a
+tab, and the text to print with python string escapes (so "\n", "\r"
+and "\t" control the line endings).  Lines starting with # are ignored.
+
+The replay is controlled with environment variables:
+
+    FAKE_SPEED        time scale, 1 is realtime, 0 is instant (default 1)
+    FAKE_FAIL_AT      fail at this fraction (0 - 1) of the profile, or at
+                      the first step containing this text
+    FAKE_FAIL_DEVICE  only fail when the selected device is this one
+    FAKE_EXIT_CODE    exit code used when failing (default 1)
+'''
+import codecs
+import os
+import sys
+import time
+
+def loadProfile(fileName):
+    steps = []
+    with open(fileName) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            delay, _, text = line.partition('\t')
+            steps.append((float(delay), codecs.decode(text, 'unicode_escape')))
+    return steps
+
+def failStep(steps, device=None):
+    '''Returns the index of the step to fail at, or None.'''
+    failAt = os.environ.get('FAKE_FAIL_AT')
+    failDevice = os.environ.get('FAKE_FAIL_DEVICE')
+    if not failAt or (failDevice and failDevice != device):
+        return None
+    try:
+        return int(float(failAt) * len(steps))
+    except ValueError:
+        for i, (delay, text) in enumerate(steps):
+            if failAt in text:
+                return i
+    return None
+
+def replay(steps, device=None, error='ERROR: simulated failure\n'):
+    '''Prints the steps and returns the exit code.'''
+    speed = float(os.environ.get('FAKE_SPEED', '1'))
+    fail = failStep(steps, device)
+    for i, (delay, text) in enumerate(steps):
+        if delay and speed:
+            time.sleep(delay * speed)
+        if i == fail:
+            sys.stdout.write(error)
+            sys.stdout.flush()
+            return int(os.environ.get('FAKE_EXIT_CODE', '1'))
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    return 0
+
+def profile(name):
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles', name)
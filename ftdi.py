@@ -0,0 +1,97 @@
+'''Low latency mode for FTDI USB-serial adapters.
+
+An FTDI adapter holds received bytes for up to its latency timer (16 ms
+by default) before it hands a short USB packet to the host, which adds
+that much to every round trip such as the otaStart / otaReady handshake.
+On Linux the ftdi_sio driver exposes the timer in sysfs, so it is set to
+1 ms while a port session holds the port and restored afterwards.  If
+sysfs can't be written (it needs root or a udev rule), the port is put
+in ASYNC_LOW_LATENCY mode through pyserial instead, which ftdi_sio also
+maps to a 1 ms timer; turning that mode off sets the driver default.
+
+Simulated ports support the ASYNC_LOW_LATENCY path, so the effect can be
+measured with "sim://name?latency=0.016".
+'''
+import os
+import sys
+
+# latency timer (ms) used while a session holds the port
+lowLatency = 1
+# bytes per write when frames can be sent back to back
+writeSize = 4096
+
+def sysfsPath(portName):
+    '''The latency_timer file of an FTDI port on Linux, or None.'''
+    if not sys.platform.startswith('linux') or not portName.startswith('/dev/'):
+        return None
+    name = os.path.basename(os.path.realpath(portName))
+    path = '/sys/bus/usb-serial/devices/{}/latency_timer'.format(name)
+    return path if os.path.exists(path) else None
+
+def readLatency(path):
+    with open(path) as f:
+        return int(f.read().strip())
+
+def writeLatency(path, ms):
+    with open(path, 'w') as f:
+        f.write(str(ms))
+
+class Tuning:
+    '''Low latency settings applied to one open port, undone by restore().'''
+    def __init__(self, port, portName):
+        self.port = port
+        self.portName = portName
+        self.path = sysfsPath(portName)
+        self.original = None
+        self.lowLatencyMode = False
+        self.method = None
+
+    def apply(self):
+        '''Returns true if the port was put in low latency mode.'''
+        if self.path is not None:
+            try:
+                self.original = readLatency(self.path)
+                if self.original > lowLatency:
+                    writeLatency(self.path, lowLatency)
+                self.method = 'sysfs'
+                return True
+            except (OSError, ValueError):
+                self.original = None
+        setMode = getattr(self.port, 'set_low_latency_mode', None)
+        if setMode is None or (self.path is None and not self.portName.startswith('sim://')):
+            # not an FTDI adapter, or no way to tune it on this platform
+            return False
+        try:
+            setMode(True)
+        except (OSError, ValueError, NotImplementedError):
+            return False
+        self.lowLatencyMode = True
+        self.method = 'ASYNC_LOW_LATENCY'
+        return True
+
+    def restore(self):
+        if self.original is not None:
+            try:
+                writeLatency(self.path, self.original)
+            except OSError:
+                pass
+            self.original = None
+        if self.lowLatencyMode:
+            try:
+                self.port.set_low_latency_mode(False)
+            except (OSError, ValueError):
+                pass
+            self.lowLatencyMode = False
+
+    def __str__(self):
+        if self.method is None:
+            return 'not tuned'
+        if self.method == 'sysfs':
+            return 'latency timer {} ms (was {} ms)'.format(lowLatency, self.original)
+        return 'ASYNC_LOW_LATENCY'
+
+def tune(port, portName):
+    '''Puts an open port in low latency mode, returns the Tuning to restore
+    or None if there was nothing to tune.'''
+    tuning = Tuning(port, portName)
+    return tuning if tuning.apply() else None
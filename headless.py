@@ -0,0 +1,132 @@
+'''Headless programming of many SmartDrives at once.
+
+Each port's programming session runs in its own worker process, so the
+framing and parsing work for one port never competes with another for
+the GIL.  Workers program with a SmartDriveCore, which doesn't import
+Qt.  Workers send progress back over a multiprocessing queue as
+(port, stage, percent, text) tuples, and each session returns a result
+dict with the port, whether it succeeded, the error message and the
+time taken by each stage.
+'''
+import multiprocessing
+import queue
+import time
+
+import manifest
+from smartdrivecore import SmartDriveCore
+
+stages = ('bootloader', 'firmware')
+
+# progress queue of the worker process, set by _initWorker
+_progress = None
+
+def _initWorker(progress, allowUnlisted=False):
+    global _progress
+    _progress = progress
+    if allowUnlisted:
+        manifest.allowUnlisted()
+
+class Reporter:
+    '''Sends progress to the queue, only when the whole percent changes.'''
+    def __init__(self, portName, stage):
+        self.portName = portName
+        self.stage = stage
+        self.last = None
+
+    def __call__(self, percent, text=''):
+        percent = int(percent)
+        if _progress is not None and (percent, text) != self.last:
+            self.last = (percent, text)
+            _progress.put((self.portName, self.stage, percent, text))
+
+def programPort(portName, fwFileName, stages=stages, transmitDelay=0.001,
+                bootloaderPreset='default'):
+    '''Programs one SmartDrive with a SmartDriveCore; this is what runs in
+    each worker.'''
+    result = {'port': portName, 'ok': False, 'error': None, 'timings': {}}
+    timings = result['timings']
+    errors = []
+    core = SmartDriveCore(portName, transmitDelay=transmitDelay,
+                          bootloaderPreset=bootloaderPreset)
+    for name in ('invalidFirmware', 'bootloaderFailed', 'firmwareFailed'):
+        core.events.connect(name, errors.append)
+    core.events.connect('bootloaderStatus', Reporter(portName, 'bootloader'))
+    core.events.connect('firmwareStatus', Reporter(portName, 'firmware'))
+    try:
+        core.selectFirmware(fwFileName)
+        if errors:
+            result['error'] = errors[0]
+            return result
+        for stage in stages:
+            begin = time.monotonic()
+            if stage == 'bootloader':
+                ok = core.programBootloader()
+            elif stage == 'firmware':
+                ok = core.programFirmware()
+                timings['ready'] = core.readyTime
+            else:
+                result['error'] = 'Unknown stage {!r}'.format(stage)
+                return result
+            timings[stage] = time.monotonic() - begin
+            if not ok:
+                result['error'] = errors[0] if errors else '{} stopped'.format(stage)
+                return result
+    except Exception as error:
+        result['error'] = str(error)
+        return result
+    finally:
+        core.releasePort()
+    result['ok'] = True
+    return result
+
+def run(portNames, fwFileName, stages=stages, processes=None,
+        transmitDelay=0.001, onProgress=None, bootloaderPreset='default',
+        allowUnlisted=False):
+    '''Programs all ports concurrently and returns their results in order.
+
+    processes defaults to one per port, up to the number of cores.
+    onProgress(port, stage, percent, text) is called in this process.
+    Images that are in no manifest are only programmed with
+    allowUnlisted.'''
+    if processes is None:
+        processes = min(len(portNames), multiprocessing.cpu_count())
+    progress = multiprocessing.Queue()
+
+    def drain(timeout):
+        try:
+            while True:
+                update = progress.get(timeout=timeout)
+                if onProgress is not None:
+                    onProgress(*update)
+                timeout = 0
+        except queue.Empty:
+            pass
+
+    with multiprocessing.Pool(processes, initializer=_initWorker,
+                              initargs=(progress, allowUnlisted)) as pool:
+        jobs = pool.starmap_async(programPort, [
+            (portName, fwFileName, stages, transmitDelay, bootloaderPreset)
+            for portName in portNames
+        ])
+        while not jobs.ready():
+            drain(0.1)
+        results = jobs.get()
+    drain(0.1)
+    return results
+
+def printProgress(portName, stage, percent, text):
+    print('[{}] {} {:3d}% {}'.format(portName, stage, percent, text), flush=True)
+
+def main(args):
+    results = run(args.ports, args.firmware, stages=args.stages,
+                  processes=args.processes, onProgress=printProgress,
+                  bootloaderPreset=args.bootloader_preset,
+                  allowUnlisted=args.allow_unlisted)
+    for r in results:
+        timings = ' '.join('{}={:.2f}s'.format(k, v) for k, v in r['timings'].items()
+                           if v is not None)
+        if r['ok']:
+            print('[{}] OK {}'.format(r['port'], timings))
+        else:
+            print('[{}] FAILED: {} {}'.format(r['port'], r['error'], timings))
+    return 0 if all(r['ok'] for r in results) else 1
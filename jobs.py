@@ -0,0 +1,203 @@
+'''Persistent per-unit job records, so an interrupted run can resume.
+
+A job is the programming of one unit on a port.  It records which
+stages (bootloader, firmware, bluetooth) completed, with the SHA-256 of
+the firmware file each stage used, and the unit's BLE serial number
+once it is known.  When the programmer restarts, the stages of the
+unit's open job that completed with the same firmware are skipped.  The
+job is found by the unit's BLE serial number when it is known; the job
+on the port can be any unit that was put there since, so the caller
+confirms it is the same one.
+
+Jobs live in memory and are written to an SQLite database by a
+background thread that commits in batches, so recording a stage never
+waits for the disk.
+'''
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import manifest
+
+stages = ('bootloader', 'firmware', 'bluetooth')
+
+schema = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    port TEXT NOT NULL,
+    serial TEXT,
+    started REAL NOT NULL,
+    ended REAL,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    job TEXT NOT NULL REFERENCES jobs(id),
+    stage TEXT NOT NULL,
+    firmware TEXT,
+    finished REAL NOT NULL,
+    PRIMARY KEY (job, stage)
+);
+'''
+
+def defaultFileName():
+    return os.path.join(os.path.expanduser('~'), '.sdprogrammer', 'jobs.sqlite3')
+
+def fileHash(fileName):
+    '''Returns the SHA-256 of a firmware image as hex, or None if it can't
+    be read. The hash is cached with the manifest check's, so it is only
+    computed again when the file changes.'''
+    if not fileName:
+        return None
+    return manifest.verifier.hash(fileName)
+
+class Job:
+    def __init__(self, port, id=None, serial=None, started=None):
+        self.id = id or uuid.uuid4().hex
+        self.port = port
+        self.serial = serial
+        self.started = time.time() if started is None else started
+        # stage -> (firmware hash, finished time)
+        self.stages = {}
+
+class JobStore:
+    '''Open jobs by port, backed by an SQLite file.'''
+    def __init__(self, fileName=None, interval=1.0):
+        self.fileName = fileName or defaultFileName()
+        self.interval = interval
+        self.jobs = {}
+        self.writes = queue.Queue()
+
+        dirName = os.path.dirname(self.fileName)
+        if dirName:
+            os.makedirs(dirName, exist_ok=True)
+        db = sqlite3.connect(self.fileName)
+        with db:
+            db.executescript(schema)
+        self.load(db)
+        db.close()
+
+        self.writer = threading.Thread(target=self.writeLoop, daemon=True)
+        self.writer.start()
+
+    def load(self, db):
+        byId = {}
+        for id, port, serial, started in db.execute(
+                "SELECT id, port, serial, started FROM jobs WHERE state = 'open'"):
+            byId[id] = self.jobs[port] = Job(port, id, serial, started)
+        for id, stage, firmware, finished in db.execute(
+                "SELECT job, stage, firmware, finished FROM stages "
+                "WHERE job IN (SELECT id FROM jobs WHERE state = 'open')"):
+            byId[id].stages[stage] = (firmware, finished)
+
+    def writeLoop(self):
+        '''Commits the queued writes in one transaction per interval, or
+        sooner when asked to flush.'''
+        db = sqlite3.connect(self.fileName)
+        running = True
+        while running:
+            batch = [self.writes.get()]
+            deadline = time.monotonic() + self.interval
+            while isinstance(batch[-1], tuple):
+                try:
+                    batch.append(self.writes.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                with db:
+                    for w in batch:
+                        if isinstance(w, tuple):
+                            db.execute(*w)
+            except sqlite3.Error as error:
+                # one bad write must not stop the writer
+                print("[JOBS] dropped a batch of {} writes: {}".format(len(batch), error))
+            for w in batch:
+                if w is None:
+                    running = False
+                elif isinstance(w, threading.Event):
+                    w.set()
+        db.close()
+
+    def write(self, sql, *args):
+        self.writes.put((sql, args))
+
+    def flush(self, timeout=5):
+        '''Waits until everything recorded so far is committed.'''
+        event = threading.Event()
+        self.writes.put(event)
+        return event.wait(timeout)
+
+    def close(self):
+        self.flush()
+        self.writes.put(None)
+        self.writer.join(5)
+
+    # jobs
+    def job(self, port, serial=None):
+        '''Returns the open job on port, or None. If the unit's serial
+        number is given, it is the open job with that serial number, which
+        moves to port if the unit was moved.'''
+        if not serial:
+            return self.jobs.get(port)
+        for job in list(self.jobs.values()):
+            if job.serial == serial:
+                if job.port != port:
+                    self.end(port, 'abandoned')
+                    del self.jobs[job.port]
+                    job.port = port
+                    self.jobs[port] = job
+                    self.write("UPDATE jobs SET port = ? WHERE id = ?", port, job.id)
+                return job
+        return None
+
+    def begin(self, port):
+        '''Starts a new job on port, abandoning any open one.'''
+        self.end(port, 'abandoned')
+        job = Job(port)
+        self.jobs[port] = job
+        self.write("INSERT INTO jobs (id, port, started, state) VALUES (?, ?, ?, 'open')",
+                   job.id, port, job.started)
+        return job
+
+    def end(self, port, state='done'):
+        '''Closes the open job on port as done or abandoned.'''
+        job = self.jobs.pop(port, None)
+        if job is not None:
+            self.write("UPDATE jobs SET state = ?, ended = ? WHERE id = ?",
+                       state, time.time(), job.id)
+
+    def setSerial(self, port, serial):
+        job = self.jobs.get(port)
+        if job is None or (job.serial is not None and job.serial != serial):
+            # another unit than the one the job was started for
+            job = self.begin(port)
+        job.serial = serial
+        self.write("UPDATE jobs SET serial = ? WHERE id = ?", serial, job.id)
+
+    def stageDone(self, port, stage, firmware):
+        '''Records that stage completed with the firmware hash. The later
+        stages have to run again, e.g. the bootloader wipes the flash.'''
+        job = self.jobs.get(port) or self.begin(port)
+        now = time.time()
+        job.stages[stage] = (firmware, now)
+        later = stages[(stages.index(stage) + 1):]
+        for s in later:
+            job.stages.pop(s, None)
+        if later:
+            self.write("DELETE FROM stages WHERE job = ? AND stage IN ({})".format(
+                ','.join('?' * len(later))), job.id, *later)
+        self.write("INSERT OR REPLACE INTO stages (job, stage, firmware, finished) "
+                   "VALUES (?, ?, ?, ?)", job.id, stage, firmware, now)
+
+    def isDone(self, port, stage, firmware, serial=None):
+        '''Returns the time stage completed on the unit's open job (see
+        job()) with the same firmware hash, or None if it has to run.'''
+        job = self.job(port, serial)
+        if job is None or stage not in job.stages:
+            return None
+        done, finished = job.stages[stage]
+        if firmware is None or done != firmware:
+            return None
+        return finished
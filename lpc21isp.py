@@ -0,0 +1,163 @@
+'''Command line and output parsing for the lpc21isp bootloader programmer.'''
+import collections
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import capture
+import resource
+import tools
+
+baudrate = 38400
+# crystal frequency on board (kHz)
+crystal = 12000
+# number of progress characters lpc21isp prints for the bootloader
+totalLength = 574
+
+def program():
+    '''Path of lpc21isp, see tools.'''
+    return tools.path('lpc21isp')
+
+def bootloaderImage():
+    '''Path of the bundled OTA bootloader image.'''
+    return resource.path("firmwares/ota-bootloader.hex")
+
+class Preset:
+    '''Options for one kind of lpc21isp run.'''
+    def __init__(self, name, baudrate=baudrate, wipe=True, description=''):
+        self.name = name
+        self.baudrate = baudrate
+        self.wipe = wipe
+        self.description = description
+
+# each run synchronizes with the ISP autobaud again, so a run is made
+# faster with a higher baud rate or by not wiping a blank chip first
+presets = {
+    'default': Preset('default', description='wipe the chip, {} baud'.format(baudrate)),
+    'fast': Preset('fast', 115200, description='wipe the chip, 115200 baud'),
+    'nowipe': Preset('nowipe', wipe=False,
+                     description="don't wipe the chip first (new, blank units only)"),
+}
+
+def getPreset(name):
+    '''The named Preset; raises ValueError for an unknown one.'''
+    try:
+        return presets[name or 'default']
+    except KeyError:
+        raise ValueError("Unknown lpc21isp preset '{}', use one of {}".format(
+            name, ', '.join(presets)))
+
+def arguments(portName, hexFile=None, preset='default'):
+    options = getPreset(preset)
+    if hexFile is None:
+        hexFile = bootloaderImage()
+    if sys.platform.startswith('win'):
+        portName = "\\\\.\\" + portName
+    return (["-wipe"] if options.wipe else []) + [
+        hexFile,
+        portName,
+        str(options.baudrate),
+        str(crystal)
+    ]
+
+# outcome of one lpc21isp run; error is None if it succeeded
+Result = collections.namedtuple('Result', 'port preset ok code error stopped seconds')
+
+# seconds a run may take before it is killed
+timeout = 120.0
+
+sectorPattern = re.compile(r'Sector \d+: (\.*)')
+# how much of an unterminated line is kept
+maxLineLength = 4096
+
+class OutputParser:
+    '''Parses lpc21isp output incrementally: each sector line's progress
+    dots are counted once the line is complete, so only the current line
+    is kept between chunks.'''
+    def __init__(self):
+        self.tail = ''
+        self.dots = 0
+        # the last line before the first sector, while there is none
+        self.status = None
+
+    def feed(self, text):
+        '''Returns (percent, status) after text was printed.'''
+        lines = (self.tail + text).split('\n')
+        self.tail = lines.pop()[-maxLineLength:]
+        for line in lines:
+            self.parseLine(line, True)
+        return self.parseLine(self.tail, False)
+
+    def parseLine(self, line, complete):
+        m = sectorPattern.search(line)
+        dots = self.dots
+        if m is not None:
+            dots += len(m.group(1))
+            if self.status is None:
+                self.status = line[:m.start()]
+        if complete:
+            self.dots = dots
+        status = self.status if self.status is not None else line
+        return dots / totalLength * 100, status or "Writing new firmware."
+
+def parseOutput(output):
+    '''Returns (percent, status) from everything lpc21isp printed so far.'''
+    return OutputParser().feed(output)
+
+def run(portName, preset='default', progress=None, isRunning=None, timeout=timeout):
+    '''Runs lpc21isp on the port and waits for it, without Qt.
+
+    progress(percent, status) is called as lpc21isp prints; the run is
+    killed once isRunning() returns false or after timeout seconds.
+    Returns a Result.'''
+    begin = time.monotonic()
+    try:
+        process = subprocess.Popen([program()] + arguments(portName, preset=preset),
+                                   stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+    except (OSError, ValueError) as error:
+        return Result(portName, preset, False, None, "Couldn't run lpc21isp: {}".format(error),
+                      False, time.monotonic() - begin)
+    output = capture.OutputCapture('lpc21isp', portName)
+    parser = OutputParser()
+    done = threading.Event()
+    killed = []
+
+    def watch():
+        deadline = begin + timeout
+        while not done.wait(0.05):
+            if isRunning is not None and not isRunning():
+                killed.append('stopped')
+            elif timeout and time.monotonic() > deadline:
+                killed.append('timeout')
+            else:
+                continue
+            process.kill()
+            return
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    with process:
+        for data in iter(lambda: process.stdout.read1(4096), b''):
+            status = parser.feed(output.feed(data))
+            if progress is not None:
+                progress(*status)
+        parser.feed(output.finish())
+        code = process.wait()
+    done.set()
+    watcher.join()
+    stopped = killed == ['stopped']
+    error = None
+    try:
+        if killed == ['timeout']:
+            error = output.saveOnFailure(
+                "Bootloader failed: lpc21isp did not finish within {:g} s".format(timeout))
+        elif code != 0 and not stopped:
+            error = output.saveOnFailure("Bootloader failed: {}".format(code))
+    finally:
+        output.close()
+    return Result(portName, preset, error is None and not stopped, code, error, stopped,
+                  time.monotonic() - begin)
@@ -0,0 +1,314 @@
+'''Firmware manifests and a cache of verified firmware images.
+
+A manifest is a JSON file listing the known firmware images:
+
+    {
+      "images": [
+        {"file": "SmartDriveMCU.1.6.ota", "target": "ota", "version": "1.6",
+         "size": 88048, "sha256": "..."},
+        ...
+      ],
+      "signature": "..."
+    }
+
+The target is 'bootloader' (the lpc21isp hex file), 'ota' (an MX2+ OTA
+image) or 'ble' (a SmartDrive Bluetooth image).  Sizes and hashes are
+of the image itself, so a gzip compressed OTA file matches the entry of
+the uncompressed one.  If $SD_MANIFEST_KEY is set, the manifest must
+carry an HMAC-SHA256 signature of its images made with that key.
+
+An image is checked in one streaming pass when it is loaded: it is
+rejected if its hash belongs to an image of another target, if it has
+the name of a listed image but not its hash (i.e. it is corrupted), or
+if it does not look like an image of its target.  Images that are in no
+manifest are rejected with UnlistedImage unless they were allowed: the
+operator confirms one with allow(image), or all of them with
+allowUnlisted(), e.g. for --allow-unlisted.  Results are cached by
+(path, mtime, size), so checking the image again for every unit on
+every station only costs a stat().
+
+The bundled manifest is firmwares/manifest.json, or $SD_FIRMWARE_MANIFEST;
+a manifest.json next to the image is used as well.
+
+    python manifest.py create firmwares/* -o firmwares/manifest.json
+    python manifest.py verify firmwares/SmartDriveMCU.1.6.ota
+'''
+import argparse
+import collections
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+
+import ota
+import resource
+
+targets = {
+    'bootloader': 'bootloader hex file',
+    'ota': 'MX2+ OTA file',
+    'ble': 'SmartDrive Bluetooth firmware file',
+}
+
+fileName = 'manifest.json'
+
+# bytes read per step of the streaming pass
+chunkSize = 65536
+
+Image = collections.namedtuple('Image', 'fileName target sha256 size version listed')
+
+class UnlistedImage(ValueError):
+    '''An image that is in no manifest and was not allowed.'''
+    def __init__(self, image):
+        super().__init__("'{}' is not in the firmware manifest".format(image.fileName))
+        self.image = image
+
+def defaultManifest():
+    return os.environ.get('SD_FIRMWARE_MANIFEST') or resource.path('firmwares/' + fileName)
+
+def imageName(path):
+    '''The name an image is listed under: its base name without .gz.'''
+    name = os.path.basename(path)
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return name
+
+def canonical(images):
+    return json.dumps(images, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+def sign(images, key):
+    return hmac.new(key.encode('utf-8'), canonical(images), hashlib.sha256).hexdigest()
+
+def digest(path):
+    '''Returns (sha256, size, first bytes) of the image in one pass.'''
+    h = hashlib.sha256()
+    size = 0
+    head = b''
+    with ota.openFirmware(path) as f:
+        for data in iter(lambda: f.read(chunkSize), b''):
+            if len(head) < 4:
+                head += data[:4]
+            h.update(data)
+            size += len(data)
+    return h.hexdigest(), size, head
+
+def scan(path, target):
+    '''Hashes the image and checks that it looks like an image of target.
+    Returns (sha256, size, version); raises ValueError if it doesn't and
+    OSError if it can't be read.'''
+    sha256, size, head = digest(path)
+    version = None
+    if target == 'ota':
+        version = ota.versionString(head[0:4])
+        if version == 'unknown' or size < 8:
+            raise ValueError("'{}' is not a valid {}".format(path, targets[target]))
+    elif head[:1] != b':':
+        # the bootloader and the BLE images are Intel HEX files
+        raise ValueError("'{}' is not a valid {}".format(path, targets[target]))
+    return sha256, size, version
+
+def load(path):
+    '''Returns the images of a manifest file, checking its signature if
+    $SD_MANIFEST_KEY is set. Raises ValueError if it is invalid.'''
+    with open(path, 'r') as f:
+        try:
+            manifest = json.load(f)
+            images = manifest['images']
+        except (ValueError, KeyError, TypeError):
+            raise ValueError("Invalid firmware manifest '{}'".format(path))
+    key = os.environ.get('SD_MANIFEST_KEY')
+    if key and not hmac.compare_digest(manifest.get('signature') or '', sign(images, key)):
+        raise ValueError("Firmware manifest '{}' is not signed".format(path))
+    return images
+
+def create(paths, targetOf, key=None):
+    '''Returns a manifest for the images, targetOf(path) giving each one's
+    target.'''
+    images = []
+    for path in paths:
+        target = targetOf(path)
+        sha256, size, version = scan(path, target)
+        images.append({'file': imageName(path), 'target': target,
+                       'version': version, 'size': size, 'sha256': sha256})
+    manifest = {'images': images}
+    if key:
+        manifest['signature'] = sign(images, key)
+    return manifest
+
+def guessTarget(path):
+    name = imageName(path)
+    if name.endswith('.hex'):
+        return 'bootloader'
+    if name.endswith('.ota'):
+        return 'ota'
+    return 'ble'
+
+class Verifier:
+    '''Checks images against the manifests and caches the results by
+    (path, mtime, size). Safe to share between threads.'''
+    def __init__(self, manifest=None):
+        self.manifest = manifest
+        self.lock = threading.Lock()
+        # (path, mtime, size, target) -> Image or the ValueError
+        self.results = {}
+        # (path, mtime, size) -> sha256
+        self.hashes = {}
+        # manifest path -> ((mtime, size), images)
+        self.manifests = {}
+        self.scans = 0
+        # hashes of the unlisted images the operator allowed, or all of them
+        self.allowed = set()
+        self.allowUnlisted = False
+
+    @staticmethod
+    def key(path):
+        st = os.stat(path)
+        return os.path.realpath(path), st.st_mtime_ns, st.st_size
+
+    def manifestImages(self, path):
+        '''Images of the manifest at path, [] if there is none.'''
+        try:
+            st = os.stat(path)
+        except OSError:
+            return []
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            cached = self.manifests.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        images = load(path)
+        with self.lock:
+            self.manifests[path] = (stamp, images)
+        return images
+
+    def listed(self, path):
+        images = list(self.manifestImages(self.manifest or defaultManifest()))
+        local = os.path.join(os.path.dirname(os.path.abspath(path)), fileName)
+        if os.path.abspath(local) != os.path.abspath(self.manifest or defaultManifest()):
+            images += self.manifestImages(local)
+        return images
+
+    def check(self, path, target):
+        sha256, size, version = scan(path, target)
+        self.scans += 1
+        with self.lock:
+            self.hashes[self.key(path)] = sha256
+        images = self.listed(path)
+        name = imageName(path)
+        for entry in images:
+            if entry.get('sha256') == sha256 and entry.get('size') == size:
+                if entry.get('target') != target:
+                    raise ValueError("'{}' is a {}, not a {}".format(
+                        path, targets.get(entry.get('target'), entry.get('target')),
+                        targets[target]))
+                return Image(path, target, sha256, size, entry.get('version') or version, True)
+        for entry in images:
+            if entry.get('file') == name and entry.get('target') == target:
+                raise ValueError("'{}' does not match the firmware manifest, "
+                                 "the file is corrupted".format(path))
+        return Image(path, target, sha256, size, version, False)
+
+    def allow(self, image):
+        '''Accepts the unlisted image from now on, as long as its content
+        stays the same.'''
+        with self.lock:
+            self.allowed.add(image.sha256)
+
+    def verify(self, path, target):
+        '''Returns the Image if path is a valid image of target; raises
+        ValueError if it isn't (UnlistedImage if it is only not allowed)
+        and OSError if it can't be read.'''
+        if target not in targets:
+            raise ValueError("Unknown firmware target '{}'".format(target))
+        key = self.key(path) + (target,)
+        with self.lock:
+            result = self.results.get(key)
+        if result is None:
+            try:
+                result = self.check(path, target)
+            except ValueError as error:
+                result = error
+            with self.lock:
+                self.results[key] = result
+        if isinstance(result, ValueError):
+            raise result
+        if not (result.listed or self.allowUnlisted or result.sha256 in self.allowed):
+            raise UnlistedImage(result)
+        return result
+
+    def hash(self, path):
+        '''SHA-256 of the image at path from the cache, or None if it can't
+        be read.'''
+        try:
+            key = self.key(path)
+        except OSError:
+            return None
+        with self.lock:
+            sha256 = self.hashes.get(key)
+        if sha256 is None:
+            try:
+                sha256 = digest(path)[0]
+            except OSError:
+                return None
+            with self.lock:
+                self.hashes[key] = sha256
+        return sha256
+
+verifier = Verifier()
+
+def verify(path, target):
+    '''Verifies path as an image of target with the shared Verifier.'''
+    return verifier.verify(path, target)
+
+def allow(image):
+    '''Accepts an unlisted image in the shared Verifier.'''
+    verifier.allow(image)
+
+def allowUnlisted():
+    '''Accepts every unlisted image in the shared Verifier.'''
+    verifier.allowUnlisted = True
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Create or check firmware manifests.')
+    sub = parser.add_subparsers(dest='command')
+    createParser = sub.add_parser('create', help='write a manifest for images')
+    createParser.add_argument('images', nargs='+')
+    createParser.add_argument('-o', '--output', default='-')
+    verifyParser = sub.add_parser('verify', help='check images against the manifests')
+    verifyParser.add_argument('images', nargs='+')
+    verifyParser.add_argument('-m', '--manifest', help='manifest to check against')
+    verifyParser.add_argument('--allow-unlisted', action='store_true',
+                              help='accept images that are in no manifest')
+    args = parser.parse_args(args)
+
+    args.images = [p for p in args.images if os.path.basename(p) != fileName]
+    if args.command == 'create':
+        manifest = create(args.images, guessTarget, os.environ.get('SD_MANIFEST_KEY'))
+        text = json.dumps(manifest, indent=2) + '\n'
+        if args.output == '-':
+            sys.stdout.write(text)
+        else:
+            with open(args.output, 'w') as f:
+                f.write(text)
+        return 0
+    if args.command == 'verify':
+        v = Verifier(args.manifest)
+        v.allowUnlisted = args.allow_unlisted
+        failed = 0
+        for path in args.images:
+            try:
+                image = v.verify(path, guessTarget(path))
+            except (OSError, ValueError) as error:
+                print('FAIL {}: {}'.format(path, error))
+                failed += 1
+            else:
+                print('OK   {}: {} {} {}{}'.format(
+                    path, image.target, image.version or '-', image.sha256[:16],
+                    '' if image.listed else ' (not in manifest)'))
+        return 1 if failed else 0
+    parser.print_help()
+    return 2
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
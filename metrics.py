@@ -0,0 +1,246 @@
+'''Programming statistics for line supervisors.
+
+Counters and histograms are kept in a Registry and can be exposed as a
+Prometheus-style text page over HTTP, or written to a file every few
+seconds.  StationMetrics turns the SmartDrive / SmartDriveBluetooth
+signals into metrics.  It only listens to the start, finished and
+failed signals, never to the per-packet progress updates, so the OTA
+transfer itself pays nothing for it.
+'''
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import portsession
+
+def formatLabels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in sorted(labels)) + '}'
+
+def formatValue(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.items())
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+class CounterFunction:
+    '''Counter kept elsewhere, read from function when rendered.'''
+    type = 'counter'
+
+    def __init__(self, name, help, function):
+        self.name = name
+        self.help = help
+        self.function = function
+
+    def samples(self):
+        yield self.name, (), self.function()
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets) + [float('inf')]
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield self.name + '_bucket', (('le', formatValue(bound)),), total
+        yield self.name + '_sum', (), self.sum
+        yield self.name + '_count', (), self.count
+
+class Registry:
+    def __init__(self, prefix='sdprogrammer'):
+        self.prefix = prefix
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def counter(self, name, help):
+        return self.add(Counter(self.prefix + '_' + name, help))
+
+    def counterFunction(self, name, help, function):
+        return self.add(CounterFunction(self.prefix + '_' + name, help, function))
+
+    def histogram(self, name, help, buckets):
+        return self.add(Histogram(self.prefix + '_' + name, help, buckets))
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        '''Returns all metrics in the Prometheus text format.'''
+        lines = []
+        with self.lock:
+            for metric in self.metrics:
+                lines.append('# HELP {} {}'.format(metric.name, metric.help))
+                lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+                for name, labels, value in metric.samples():
+                    lines.append('{}{} {}'.format(name, formatLabels(labels), formatValue(value)))
+        return '\n'.join(lines) + '\n'
+
+def serve(registry, port, host='127.0.0.1'):
+    '''Serves the metrics over HTTP from a background thread.'''
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def writePeriodically(registry, fileName, interval=5.0):
+    '''Rewrites fileName with the metrics every interval seconds from a
+    background thread. The file is replaced atomically.'''
+    def loop():
+        while True:
+            tmpName = fileName + '.tmp'
+            with open(tmpName, 'w') as f:
+                f.write(registry.render())
+            os.replace(tmpName, fileName)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
+
+class StationMetrics:
+    '''Programming statistics of one station, fed from the UI signals.'''
+    durationBuckets = [1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300]
+    rateBuckets = [1000, 2000, 4000, 6000, 8000, 10000, 12000]
+
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        r = self.registry
+        self.units = r.counter('units_total', 'SmartDrives programmed through every stage.')
+        self.units.inc(0)
+        self.stages = r.counter('stages_total', 'Stages completed, by stage.')
+        self.failures = r.counter('failures_total', 'Failed stages, by stage.')
+        self.lpc21ispSeconds = r.histogram(
+            'lpc21isp_seconds', 'Duration of the lpc21isp bootloader stage.',
+            self.durationBuckets)
+        self.firmwareSeconds = r.histogram(
+            'firmware_seconds', 'Duration of the MX2+ firmware stage.',
+            self.durationBuckets)
+        self.readySeconds = r.histogram(
+            'ota_ready_seconds', 'Time until the bootloader answered otaStart.',
+            [0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60])
+        self.otaBytesPerSecond = r.histogram(
+            'ota_bytes_per_second', 'Throughput of the MX2+ OTA transfer.',
+            self.rateBuckets)
+        self.bleupdateSeconds = r.histogram(
+            'bleupdate_seconds', 'Duration of the bleupdate-cli Bluetooth stage.',
+            self.durationBuckets)
+        ports = portsession.stats
+        r.counterFunction('port_opens_total', 'Serial port opens.', lambda: ports.opens)
+        r.counterFunction('port_open_seconds_total', 'Time spent opening serial ports.',
+                          lambda: ports.openSeconds)
+        r.counterFunction('port_closes_total', 'Serial port closes.', lambda: ports.closes)
+        r.counterFunction('port_close_seconds_total', 'Time spent closing serial ports.',
+                          lambda: ports.closeSeconds)
+        r.counterFunction('port_reconfigures_total', 'Baud rate changes on an open port.',
+                          lambda: ports.reconfigures)
+        self.started = {}
+        self.bluetoothPercent = 0
+
+    def connect(self, smartDrive, bluetooth, bootloaderStart, firmwareStart, bluetoothStart):
+        '''Connects to the stage start signals and the finished / failed
+        signals of the SmartDrive and SmartDriveBluetooth.'''
+        self.smartDrive = smartDrive
+        bootloaderStart.connect(lambda: self.onStart('bootloader'))
+        firmwareStart.connect(lambda: self.onStart('firmware'))
+        bluetoothStart.connect(lambda: self.onStart('bluetooth'))
+        smartDrive.bootloaderFinished.connect(self.onBootloaderFinished)
+        smartDrive.bootloaderFailed.connect(lambda e: self.onFailed('bootloader'))
+        smartDrive.firmwareFinished.connect(self.onFirmwareFinished)
+        smartDrive.firmwareFailed.connect(lambda e: self.onFailed('firmware'))
+        bluetooth.status.connect(self.onBluetoothStatus)
+        bluetooth.firmwareFinished.connect(self.onBluetoothFinished)
+        bluetooth.failed.connect(lambda e: self.onFailed('bluetooth'))
+
+    def onStart(self, stage):
+        self.started[stage] = time.monotonic()
+
+    def elapsed(self, stage):
+        start = self.started.pop(stage, None)
+        if start is None:
+            return None
+        return time.monotonic() - start
+
+    def finish(self, stage, histogram):
+        elapsed = self.elapsed(stage)
+        with self.registry.lock:
+            self.stages.inc(stage=stage)
+            if elapsed is not None:
+                histogram.observe(elapsed)
+
+    def onBootloaderFinished(self):
+        self.finish('bootloader', self.lpc21ispSeconds)
+
+    def onFirmwareFinished(self):
+        self.finish('firmware', self.firmwareSeconds)
+        sd = self.smartDrive
+        with self.registry.lock:
+            if sd.readyTime is not None:
+                self.readySeconds.observe(sd.readyTime)
+            if sd.transferTime:
+                self.otaBytesPerSecond.observe(sd.transferBytes / sd.transferTime)
+
+    def onBluetoothStatus(self, percent, text):
+        self.bluetoothPercent = percent
+
+    def onBluetoothFinished(self):
+        if self.bluetoothPercent != 100:
+            # SmartDriveBluetooth also reports finished when stopped
+            self.started.pop('bluetooth', None)
+            return
+        self.finish('bluetooth', self.bleupdateSeconds)
+        # bluetooth is the last stage of a unit
+        with self.registry.lock:
+            self.units.inc()
+
+    def onFailed(self, stage):
+        if self.elapsed(stage) is None:
+            # already failed, or stopped before starting
+            return
+        with self.registry.lock:
+            self.failures.inc(stage=stage)
@@ -0,0 +1,254 @@
+'''MX2+ OTA serial protocol, independent of the UI.
+
+The functions here take an open pyserial-style port and are shared by
+the Qt SmartDrive and the headless programmer.
+'''
+import gzip
+import os
+import struct
+import time
+import serial
+
+from packet import Decoder, Packet
+
+baudrate = 115200
+# firmware bytes sent per OTA packet
+blockSize = 16
+
+# otaStart / otaReady handshake timing (seconds)
+readyTimeout = 60.0
+readyInterval = 0.02
+readyMaxInterval = 0.25
+readyPollInterval = 0.005
+
+def versionString(vBytes):
+    '''Returns the firmware version encoded in the first bytes of an OTA
+    image, or 'unknown' if they are not a plausible version.'''
+    v = sum(vBytes)
+    if v >= 0xFF or v <= 0x00:
+        return 'unknown'
+    else:
+        return '{}.{}'.format((v & 0xF0) >> 4, v & 0x0F)
+
+gzipMagic = b'\x1f\x8b'
+
+def openFirmware(fileName):
+    '''Opens an OTA file for reading, decompressing it on the fly if it
+    is gzip compressed.'''
+    f = open(fileName, 'rb')
+    if f.peek(2)[:2] == gzipMagic:
+        f.close()
+        return gzip.open(fileName, 'rb')
+    return f
+
+def readFirmware(fileName):
+    '''Returns (image, version) for an OTA file, raising ValueError if it
+    is not a valid MX2+ OTA file.'''
+    with openFirmware(fileName) as f:
+        fw = bytearray(f.read())
+    version = versionString(fw[0:4])
+    if version == 'unknown':
+        raise ValueError("Invalid OTA file '{}'!".format(fileName))
+    return fw, version
+
+class FirmwareFile:
+    '''An OTA file, plain or gzip compressed, that is read block by block
+    while it is sent instead of being loaded into memory.
+
+    Raises OSError if the file can't be read and ValueError if it is not
+    a valid MX2+ OTA file.'''
+    def __init__(self, fileName):
+        self.fileName = fileName
+        with openFirmware(fileName) as f:
+            head = f.read(8)
+            compressed = isinstance(f, gzip.GzipFile)
+        self.version = versionString(head[0:4])
+        if self.version == 'unknown' or len(head) < 8:
+            raise ValueError("Invalid OTA file '{}'!".format(fileName))
+        self.checksum = bytes(head[4:8])
+        if compressed:
+            # the gzip trailer ends with the uncompressed size
+            with open(fileName, 'rb') as f:
+                f.seek(-4, os.SEEK_END)
+                self.size, = struct.unpack('<I', f.read(4))
+        else:
+            self.size = os.path.getsize(fileName)
+
+    def __len__(self):
+        return self.size
+
+    def blocks(self, size=blockSize):
+        '''Yields the image in blocks of size bytes. The blocks share one
+        buffer, so each must be used before asking for the next.'''
+        block = bytearray(size)
+        view = memoryview(block)
+        with openFirmware(self.fileName) as f:
+            while True:
+                n = f.readinto(block)
+                if not n:
+                    return
+                yield view[:n]
+
+def openPort(portName, baudrate=baudrate, timeout=1):
+    '''Opens a serial port, or a simulated device for "sim://" names.'''
+    if portName.startswith('sim://'):
+        import simulator
+        return simulator.SimulatedPort(portName, baudrate=baudrate, timeout=timeout)
+    return serial.Serial(port=portName,
+                         baudrate=baudrate,
+                         bytesize=serial.EIGHTBITS,
+                         parity=serial.PARITY_NONE,
+                         stopbits=serial.STOPBITS_ONE,
+                         timeout=timeout)
+
+class Handshake:
+    '''State of the otaStart / otaReady handshake, independent of how the
+    port is read and written.
+
+    The start packet is resent with a short interval that backs off up
+    to readyMaxInterval, while the incoming byte stream is scanned for
+    the ready packet.'''
+    startPacket = Packet(Packet.command, Packet.otaStart, [Packet.smartDrive]).data
+
+    def __init__(self, timeout=readyTimeout, now=None):
+        self.begin = time.monotonic() if now is None else now
+        self.deadline = self.begin + timeout
+        self.nextSend = self.begin
+        self.interval = readyInterval
+        self.decoder = Decoder()
+        self.readyTime = None
+
+    def expired(self, now):
+        return now >= self.deadline
+
+    def poll(self, now):
+        '''Returns the start packet if it is time to (re)send it, else None.'''
+        if now < self.nextSend:
+            return None
+        self.nextSend = now + self.interval
+        self.interval = min(self.interval * 2, readyMaxInterval)
+        return self.startPacket
+
+    def feed(self, data, now):
+        '''Returns true once data completed a valid otaReady packet.'''
+        for resp in self.decoder.feed(data):
+            if resp.isValid(Type=Packet.command, SubType=Packet.otaReady):
+                self.readyTime = now - self.begin
+                return True
+        return False
+
+def waitForReady(port, isRunning, timeout=readyTimeout):
+    '''Performs the Handshake on a blocking port. Returns the seconds
+    taken to sync, or None if isRunning() went false or the timeout
+    expired.'''
+    portTimeout = port.timeout
+    port.timeout = readyPollInterval
+    port.reset_input_buffer()
+    handshake = Handshake(timeout)
+    try:
+        while isRunning():
+            now = time.monotonic()
+            if handshake.expired(now):
+                return None
+            p = handshake.poll(now)
+            if p is not None:
+                port.write(p)
+            data = port.read(max(1, port.in_waiting))
+            if handshake.feed(data, time.monotonic()):
+                return handshake.readyTime
+        return None
+    finally:
+        port.timeout = portTimeout
+
+class FrameStream:
+    '''All OTA packets of an image framed once into one buffer, so they
+    can be prepared ahead of time and sent to any number of units.'''
+    def __init__(self, fw):
+        self.size = len(fw)
+        frameLength = Packet.packetLength(blockSize)
+        self.data = bytearray(frameLength * ((self.size + blockSize - 1) // blockSize))
+        # (percent, end offset) of every frame
+        self.ends = []
+        offset = 0
+        for percent, frame in firmwareFrames(fw):
+            end = offset + len(frame)
+            self.data[offset:end] = frame
+            self.ends.append((percent, end))
+            offset = end
+        del self.data[offset:]
+
+    def __len__(self):
+        return self.size
+
+    def frames(self):
+        data = memoryview(self.data)
+        start = 0
+        for percent, end in self.ends:
+            yield percent, data[start:end]
+            start = end
+
+def firmwareFrames(fw):
+    '''Yields (percent, frame) with one OTA packet per block of fw, an
+    image in memory, a FirmwareFile or a FrameStream.
+
+    Every block is framed into the same buffer, so each frame must be
+    written out before asking for the next one.'''
+    if isinstance(fw, FrameStream):
+        yield from fw.frames()
+        return
+    size = len(fw)
+    if isinstance(fw, FirmwareFile):
+        blocks = fw.blocks()
+    else:
+        fw = memoryview(fw)
+        blocks = (fw[i:(i+blockSize)] for i in range(0, size, blockSize))
+    frame = bytearray(Packet.packetLength(blockSize))
+    sent = 0
+    for block in blocks:
+        end = Packet.encode(frame, 0, Packet.ota, Packet.smartDrive, block)
+        yield 100 * sent / size, frame[:end]
+        sent += len(block)
+
+def sendFirmware(port, fw, isRunning, progress=None, transmitDelay=0.001, writeSize=None):
+    '''Streams the OTA image to the bootloader, one packet per block.
+
+    progress(percent) is called before each block. Without a transmit
+    delay, a FrameStream is written writeSize bytes at a time if it is
+    given. Returns true if the whole image was sent, false if isRunning()
+    went false.'''
+    if writeSize and not transmitDelay and isinstance(fw, FrameStream):
+        return sendFrameStream(port, fw, isRunning, progress, writeSize)
+    for percent, frame in firmwareFrames(fw):
+        if not isRunning():
+            return False
+        port.write(frame)
+        if progress is not None:
+            progress(percent)
+        if transmitDelay:
+            time.sleep(transmitDelay)
+    return True
+
+def sendFrameStream(port, fw, isRunning, progress, writeSize):
+    '''Writes the frames back to back, writeSize bytes or more at a time,
+    always ending on a frame boundary.'''
+    data = memoryview(fw.data)
+    start = 0
+    for percent, end in fw.ends:
+        if end - start < writeSize and end < len(data):
+            continue
+        if not isRunning():
+            return False
+        port.write(data[start:end])
+        if progress is not None:
+            progress(percent)
+        start = end
+    return True
+
+stopPacket = Packet(Packet.command, Packet.otaStop, [Packet.smartDrive]).data
+
+def sendStop(port):
+    '''Tells the bootloader the image is complete so the MX2+ reboots.
+    Returns once the stop packet, and every frame queued before it, is
+    out on the wire.'''
+    port.write(stopPacket)
+    port.flush()
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+'''Block-level deltas between MX2+ OTA images.
+
+A delta lists the OTA blocks of a new image that differ from the block
+at the same offset in a base image, and is tied to the base by the
+version and checksum in its header.  The report shows how many packets
+and how much transfer time a delta would save for each release pair,
+compared with streaming the whole image:
+
+    python ./otadelta.py firmwares/MX2+.15.ota firmwares/SmartDriveMCU.1.6.ota
+    python ./otadelta.py --output 15-16.otadelta old.ota new.ota
+
+Sending a delta needs a bootloader that reports the installed version
+and accepts addressed blocks; the current bootloader takes the whole
+image in order, and lpc21isp wipes the flash before every OTA, so the
+programmer itself always sends the full image.
+'''
+import argparse
+import struct
+import sys
+
+import ota
+from packet import Header, Packet
+
+magic = b'SDDELTA1'
+# base version, base checksum, target length, number of blocks
+deltaHeader = struct.Struct('<BIII')
+# block index, followed by the block
+blockHeader = struct.Struct('<I')
+
+def baseId(fw):
+    '''Returns (version, checksum) from the header of an OTA image.'''
+    header = Header.fromFirmware(fw)
+    return header.data[3], int.from_bytes(bytes(header.data[7:11]), 'little')
+
+def diff(base, fw, blockSize=ota.blockSize):
+    '''Returns the indexes of the blocks of fw that differ from base.'''
+    base = memoryview(base)
+    fw = memoryview(fw)
+    return [i // blockSize for i in range(0, len(fw), blockSize)
+            if fw[i:(i+blockSize)] != base[i:(i+blockSize)]]
+
+def movedBlocks(base, fw, changed, blockSize=ota.blockSize):
+    '''Returns how many of the changed blocks appear somewhere else in
+    base, i.e. what a delta with copy instructions could also avoid.'''
+    seen = set(bytes(base[i:(i+blockSize)]) for i in range(len(base) - blockSize + 1))
+    return sum(1 for b in changed if bytes(fw[(b*blockSize):((b+1)*blockSize)]) in seen)
+
+def encode(base, fw, changed, blockSize=ota.blockSize):
+    '''Returns the delta file contents for the changed blocks.'''
+    version, checksum = baseId(base)
+    out = bytearray(magic)
+    out += deltaHeader.pack(version, checksum, len(fw), len(changed))
+    for b in changed:
+        out += blockHeader.pack(b)
+        out += fw[(b*blockSize):((b+1)*blockSize)].ljust(blockSize, b'\0')
+    return out
+
+def apply(base, delta, blockSize=ota.blockSize):
+    '''Rebuilds the new image from base and a delta, raising ValueError
+    if the delta is not for this base.'''
+    if not delta.startswith(magic):
+        raise ValueError('Not an OTA delta')
+    offset = len(magic)
+    version, checksum, length, count = deltaHeader.unpack_from(delta, offset)
+    offset += deltaHeader.size
+    if (version, checksum) != baseId(base):
+        raise ValueError('Delta is for base version {}, checksum {:08x}'.format(
+            ota.versionString([version]), checksum))
+    fw = bytearray(base[:length].ljust(length, b'\0'))
+    for i in range(count):
+        b, = blockHeader.unpack_from(delta, offset)
+        offset += blockHeader.size
+        start = b * blockSize
+        fw[start:(start+blockSize)] = delta[offset:(offset+blockSize)][:max(0, length - start)]
+        offset += blockSize
+    return fw
+
+def transferTime(packets, packetLength, transmitDelay):
+    '''Seconds to send packets of packetLength bytes at the OTA baudrate
+    with transmitDelay after each: 8N1, ten bits on the wire per byte.'''
+    return packets * (packetLength * 10 / ota.baudrate + transmitDelay)
+
+def compare(base, fw, transmitDelay=0.001, blockSize=ota.blockSize):
+    '''Returns the full and delta transfer sizes and times for a pair.'''
+    changed = diff(base, fw, blockSize)
+    packets = (len(fw) + blockSize - 1) // blockSize
+    fullLength = Packet.packetLength(blockSize)
+    # a delta packet also carries the block index
+    deltaLength = Packet.packetLength(blockHeader.size + blockSize)
+    return {
+        'blocks': packets,
+        'changed': len(changed),
+        'moved': movedBlocks(base, fw, changed, blockSize),
+        'fullBytes': packets * fullLength,
+        'deltaBytes': len(changed) * deltaLength,
+        'fullTime': transferTime(packets, fullLength, transmitDelay),
+        'deltaTime': transferTime(len(changed), deltaLength, transmitDelay),
+    }
+
+def printComparison(baseName, baseVersion, fwName, fwVersion, c):
+    print('{} ({}) -> {} ({})'.format(baseName, baseVersion, fwName, fwVersion))
+    print('  changed blocks: {} of {} ({:.1%}), {} of them found elsewhere in the base'.format(
+        c['changed'], c['blocks'], c['changed'] / c['blocks'], c['moved']))
+    print('  full:  {:7d} bytes {:6.1f} s'.format(c['fullBytes'], c['fullTime']))
+    print('  delta: {:7d} bytes {:6.1f} s  (saves {:.1%} of the bytes, {:.1f} s)'.format(
+        c['deltaBytes'], c['deltaTime'], 1 - c['deltaBytes'] / c['fullBytes'],
+        c['fullTime'] - c['deltaTime']))
+
+def main():
+    parser = argparse.ArgumentParser(description='Block-level deltas between OTA images')
+    parser.add_argument('images', nargs='+',
+                        help='OTA files, each compared with the previous version')
+    parser.add_argument('--output', help='write the delta of the last pair to this file')
+    parser.add_argument('--transmit-delay', type=float, default=0.001,
+                        help='delay between OTA packets')
+    args = parser.parse_args()
+    if len(args.images) < 2:
+        parser.error('need at least two OTA images')
+
+    try:
+        images = [(name,) + ota.readFirmware(name) for name in args.images]
+    except (OSError, ValueError) as error:
+        print(error)
+        return 1
+    images.sort(key=lambda image: tuple(int(v) for v in image[2].split('.')))
+    for (baseName, base, baseVersion), (fwName, fw, fwVersion) in zip(images, images[1:]):
+        printComparison(baseName, baseVersion, fwName, fwVersion,
+                        compare(base, fw, args.transmit_delay))
+
+    if args.output:
+        baseName, base, baseVersion = images[-2]
+        fwName, fw, fwVersion = images[-1]
+        delta = encode(base, fw, diff(base, fw))
+        assert apply(base, delta) == fw
+        with open(args.output, 'wb') as f:
+            f.write(delta)
+        print('wrote {} ({} bytes)'.format(args.output, len(delta)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,9 @@
 def checkSum(data, mask=0xFF):
-    cs = 0x00
-    for i in range(0,len(data)):
-        cs += data[i]
-    cs = (cs & mask) ^ mask
-    return cs
+    return (sum(data) & mask) ^ mask
 
 class Packet:
+    __slots__ = ('Type', 'SubType', 'data')
+
     start    = 0xFE
     end      = 0xEF
 
@@ -27,25 +25,45 @@ class Packet:
             self.SubType = SubType
             length = len(data) if data is not None else 0
             self.data = bytearray(length + self.minPacketLength)
-            self.data[0] = self.start
-            self.data[1] = self.Type
-            self.data[2] = self.SubType
-
-            for i in range(0, length):
-                self.data[3 + i] = data[i]
-
-            self.data[-3] = length
-            self.data[-2] = checkSum(data)
-            self.data[-1] = self.end
+            self.encode(self.data, 0, Type, SubType, data if length else b'')
 
         elif data is not None:
             self.data = data
             if len(self.data) >= self.minPacketLength:
                 self.Type = self.data[1]
                 self.SubType = self.data[2]
+            else:
+                self.Type = None
+                self.SubType = None
         else:
             raise ValueError("must provide either data or Type AND SubType")
 
+    @classmethod
+    def packetLength(cls, payloadLength):
+        return payloadLength + cls.minPacketLength
+
+    @classmethod
+    def encode(cls, buffer, offset, Type, SubType, payload):
+        '''Writes a packet straight into buffer at offset, without creating
+        a Packet, and returns the offset just past it.'''
+        length = len(payload)
+        end = offset + 3 + length
+        buffer[offset] = cls.start
+        buffer[offset + 1] = Type
+        buffer[offset + 2] = SubType
+        buffer[(offset + 3):end] = payload
+        buffer[end] = length
+        buffer[end + 1] = checkSum(payload)
+        buffer[end + 2] = cls.end
+        return end + 3
+
+    def encodeInto(self, buffer, offset=0):
+        '''Copies this packet into buffer at offset and returns the offset
+        just past it.'''
+        end = offset + len(self.data)
+        buffer[offset:end] = self.data
+        return end
+
     def __str__(self):
         return ' '.join('{:02x}'.format(x) for x in self.data)
 
@@ -64,13 +82,74 @@ class Packet:
         return True
 
 class Header(Packet):
+    '''OTA header packet carrying the firmware version and checksum.'''
+    __slots__ = ()
+
+    length = 8
+
     def __init__(self, version, checksum):
-        payload = bytearray(8)
+        payload = bytearray(self.length)
         payload[0] = version
         payload[4] = checksum & 0xFF
         payload[5] = (checksum >> 8) & 0xFF
         payload[6] = (checksum >> 16) & 0xFF
         payload[7] = (checksum >> 24) & 0xFF
-        super(self.ota, self.smartDrive, payload, 8)
+        super().__init__(self.ota, self.smartDrive, payload)
+
+    @classmethod
+    def fromFirmware(cls, fw):
+        '''Builds the header from the first 8 bytes of an OTA image.'''
+        version = sum(fw[0:4]) & 0xFF
+        checksum = int.from_bytes(bytes(fw[4:8]), 'little')
+        return cls(version, checksum)
+
+class Decoder:
+    '''Streaming packet decoder for the receive path.
+
+    Received bytes can be fed in arbitrary chunks; every valid packet in
+    the stream is returned in order.  Packets are located from their end
+    marker backwards using the length byte, so a packet is returned as
+    soon as its last byte arrives, and noise, partial packets and corrupt
+    packets are skipped instead of misaligning everything after them.
+    '''
+    maxPayloadLength = 0xFF
+    maxPacketLength = maxPayloadLength + Packet.minPacketLength
+    # distance from the start marker to the end marker of an empty packet
+    minEnd = Packet.minPacketLength - 1
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.buffer = bytearray()
+        self.packets = 0
+        self.dropped = 0
+        # offset to search for the next end marker from
+        self._search = 0
 
+    def feed(self, data):
+        '''Adds data to the stream and returns the list of packets
+        completed by it.'''
+        buf = self.buffer
+        buf += data
+        result = []
+        first = 0
+        j = buf.find(Packet.end, self._search)
+        while j >= 0:
+            # cheap checks on the markers and length first, then checksum
+            if j - first >= self.minEnd:
+                s = j - self.minEnd - buf[j-2]
+                if (s >= first and buf[s] == Packet.start and
+                    buf[j-1] == (sum(buf[(s+3):(j-2)]) & 0xFF) ^ 0xFF):
+                    result.append(Packet(data=bytes(buf[s:(j+1)])))
+                    self.packets += 1
+                    self.dropped += s - first
+                    first = j + 1
+            j = buf.find(Packet.end, j + 1)
 
+        # only keep what could still be the start of a packet
+        keep = max(first, len(buf) - self.maxPacketLength + 1)
+        self.dropped += max(0, keep - first)
+        del buf[:keep]
+        self._search = len(buf)
+        return result
@@ -1,10 +1,63 @@
 from PyQt5 import QtGui
-from PyQt5.QtWidgets import (QWidget, QPushButton, QLabel, QVBoxLayout, QVBoxLayout, QMessageBox, QErrorMessage, QScrollArea, QSizePolicy)
+from PyQt5.QtWidgets import (QWidget, QPushButton, QLabel, QVBoxLayout, QVBoxLayout, QMessageBox, QErrorMessage, QScrollArea, QSizePolicy, QFileDialog)
 from PyQt5.QtCore import pyqtSignal, pyqtSlot, QSize, Qt
 
+import manifest
 import resource
+import tools
 from progress import ProgressBar
 
+# DIP switch instructions and picture for each step of an MX2+ unit
+bootloaderSwitches = (
+    "Set the MX2+ DIP switches for bootloader programming as shown below.\nThen power-cycle the SmartDrive.",
+    'images/bootloaderProgramming.jpg')
+firmwareSwitches = (
+    "Set the MX2+ DIP switches for firmware programming as shown below.\nThen power-cycle the SmartDrive.",
+    'images/firmwareProgramming.jpg')
+runSwitches = (
+    "Set the MX2+ DIP switches for running the firmware as shown below. \nThen power-cycle the SmartDrive.",
+    'images/runMX2+.jpg')
+
+def checkFirmware(parent, fileName, target):
+    '''Checks a selected firmware file against the manifest. An image
+    that is in no manifest is only used if the operator confirms it.
+    Returns true if the file can be used.'''
+    try:
+        manifest.verify(fileName, target)
+    except manifest.UnlistedImage as error:
+        reply = QMessageBox.warning(
+            parent, 'Unlisted Firmware File',
+            '{}.\nSHA-256: {}\n\nProgram units with it anyway?'.format(
+                error, error.image.sha256),
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return False
+        manifest.allow(error.image)
+    except (OSError, ValueError) as error:
+        QMessageBox.critical(parent, 'Firmware File Error', str(error),
+                             QMessageBox.Ok, QMessageBox.Ok)
+        return False
+    return True
+
+def locateBleUpdate(parent):
+    '''Asks for the bleupdate-cli executable and configures it. Returns
+    the tool, or None if none was selected or it can't be used.'''
+    fname, _ = QFileDialog.getOpenFileName(
+        parent,
+        'Select SmartDrive BLE Update CLI Executable',
+        'C:\\Bluegiga\\BleUpdate',
+        'bleupdate-cli (bleupdate-cli*)',
+        options=QFileDialog.Options()
+    )
+    if fname is None or len(fname) == 0:
+        return None
+    tool = tools.configure('bleupdate-cli', fname)
+    print(tools.describe(tool))
+    if tool.error is not None:
+        QMessageBox.critical(parent, 'bleupdate-cli', tool.error, QMessageBox.Ok, QMessageBox.Ok)
+        return None
+    return tool
+
 class BasePage(QWidget):
     finished = pyqtSignal()
 
@@ -86,9 +139,9 @@ class BootloaderPage(BasePage):
         self.nextEnabled = False
 
         title = QLabel("Programming Bootloader")
-        switchesLabel = QLabel("Set the MX2+ DIP switches for bootloader programming as shown below.\nThen power-cycle the SmartDrive.")
+        switchesLabel = QLabel(bootloaderSwitches[0])
         switchesLabel.setWordWrap(True)
-        self.pixMap = QtGui.QPixmap(resource.path('images/bootloaderProgramming.jpg'))
+        self.pixMap = QtGui.QPixmap(resource.path(bootloaderSwitches[1]))
 
         self.progressBar = ProgressBar()
         self.startButton = QPushButton("Start")
@@ -158,7 +211,7 @@ class FirmwarePage(BasePage):
         super().__init__(parent=parent)
         self.nextEnabled = False
 
-        self.pixMap = QtGui.QPixmap(resource.path('images/firmwareProgramming.jpg'))
+        self.pixMap = QtGui.QPixmap(resource.path(firmwareSwitches[1]))
 
         title = QLabel("Programming Firmware")
         self.progressBar = ProgressBar()
@@ -169,7 +222,7 @@ class FirmwarePage(BasePage):
         self.stopButton.clicked.connect(self.onStop)
         self.stopButton.hide()
 
-        switchesLabel = QLabel("Set the MX2+ DIP switches for firmware programming as shown below.\nThen power-cycle the SmartDrive.")
+        switchesLabel = QLabel(firmwareSwitches[0])
         switchesLabel.setWordWrap(True)
 
         self.labels = [title, switchesLabel, self.progressBar, self.startButton, self.stopButton]
@@ -313,9 +366,9 @@ class EndPage(BasePage):
         super().__init__(parent=parent)
         self.nextEnabled = False
 
-        self.pixMap = QtGui.QPixmap(resource.path('images/runMX2+.jpg'))
+        self.pixMap = QtGui.QPixmap(resource.path(runSwitches[1]))
 
-        title = QLabel("Set the MX2+ DIP switches for running the firmware as shown below. \nThen power-cycle the SmartDrive.")
+        title = QLabel(runSwitches[0])
         title.setWordWrap(True)
 
         note = QLabel("NOTE: if you need to limit the speed, set DIP 7 OFF. For other configuration settings, please check out the 'Help' menu of this program.")
@@ -0,0 +1,182 @@
+'''Serial port sessions that keep a port open across programming stages.
+
+Opening and closing a port can take hundreds of milliseconds with the
+FTDI drivers on Windows.  A PortSession owns the handle of one port for
+a unit's programming session: the port is opened once, its baud rate
+is changed in place between stages, and it is only closed when an
+external tool such as lpc21isp needs the port, or the session ends.
+
+Every open and close goes through here and is counted in `stats`,
+together with the time spent in it.
+
+While a session holds an FTDI port it is in low latency mode, see
+ftdi.py; the original settings are restored when the port is released.
+'''
+import sys
+import threading
+import time
+
+import serial.tools.list_ports
+
+import ftdi
+import ota
+
+class PortStats:
+    '''Counts of port opens, closes and in place reconfigurations, with
+    the seconds spent in them, for all sessions of the process.'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.opens = 0
+        self.openSeconds = 0.0
+        self.closes = 0
+        self.closeSeconds = 0.0
+        self.reconfigures = 0
+
+    def opened(self, seconds):
+        with self.lock:
+            self.opens += 1
+            self.openSeconds += seconds
+
+    def closed(self, seconds):
+        with self.lock:
+            self.closes += 1
+            self.closeSeconds += seconds
+
+    def reconfigured(self):
+        with self.lock:
+            self.reconfigures += 1
+
+    def __str__(self):
+        return '{} opens ({:.3f} s), {} closes ({:.3f} s), {} reconfigures'.format(
+            self.opens, self.openSeconds, self.closes, self.closeSeconds, self.reconfigures)
+
+stats = PortStats()
+
+# port name -> session currently holding that port open
+_sessions = {}
+_sessionsLock = threading.Lock()
+
+def openPort(portName, baudrate=ota.baudrate, timeout=1):
+    '''ota.openPort, counted in stats.'''
+    begin = time.monotonic()
+    port = ota.openPort(portName, baudrate=baudrate, timeout=timeout)
+    stats.opened(time.monotonic() - begin)
+    return port
+
+def closePort(port):
+    '''port.close(), counted in stats.'''
+    begin = time.monotonic()
+    port.close()
+    stats.closed(time.monotonic() - begin)
+
+def isHeld(portName):
+    '''Returns true if a session holds portName open.'''
+    with _sessionsLock:
+        return portName in _sessions
+
+def probe(portName):
+    '''Returns None if portName can be opened (or a session already holds
+    it), else the error.'''
+    if isHeld(portName):
+        return None
+    try:
+        closePort(openPort(portName))
+    except Exception as error:
+        return error
+    return None
+
+def listSerialPorts():
+    """ Lists serial port names
+
+        :raises EnvironmentError:
+            On unsupported or unknown platforms
+        :returns:
+            A list of the serial ports available on the system
+    """
+    portDesc = ''
+    if sys.platform.startswith('win'):
+        portDesc = 'USB Serial Port'
+    elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
+        portDesc = 'TTL232R-3V3'
+    elif sys.platform.startswith('darwin'):
+        portDesc = 'TTL232R-3V3'
+    else:
+        raise EnvironmentError('Unsupported platform')
+
+    ports = list(serial.tools.list_ports.comports())
+    result = []
+    for p in ports:
+        if portDesc in p.description:
+            # ports held open by our own session are available too
+            error = probe(p.device)
+            if error is None:
+                result.append(p.device)
+            else:
+                print(error)
+
+    return result
+
+class PortSession:
+    '''Owns the serial handle of one port for a programming session.'''
+    def __init__(self, portName, lowLatency=True):
+        self.portName = portName
+        self.port = None
+        self.lowLatency = lowLatency
+        self.tuning = None
+
+    @property
+    def writeSize(self):
+        '''Bytes per write for back to back frames, None for one per frame.'''
+        return ftdi.writeSize if self.tuning is not None else None
+
+    def acquire(self, baudrate, timeout=1):
+        '''Returns the open port at baudrate, opening it only if needed.'''
+        if self.port is not None:
+            try:
+                # fails if the device went away, e.g. the cable was unplugged
+                self.port.reset_input_buffer()
+                if self.port.baudrate != baudrate:
+                    # pyserial changes the baudrate at once, so the bytes
+                    # still queued would go out at the new one
+                    self.port.flush()
+                    self.port.baudrate = baudrate
+                    stats.reconfigured()
+                self.port.timeout = timeout
+                return self.port
+            except Exception:
+                self.release()
+        self.port = openPort(self.portName, baudrate=baudrate, timeout=timeout)
+        if self.lowLatency:
+            self.tuning = ftdi.tune(self.port, self.portName)
+            if self.tuning is not None:
+                print("[PORT] {}: {}".format(self.portName, self.tuning))
+        with _sessionsLock:
+            _sessions[self.portName] = self
+        return self.port
+
+    def check(self, baudrate):
+        '''Returns (True, None) if the port can be used at baudrate, else
+        (False, error).'''
+        if not self.portName:
+            return False, "You must select a serial port!"
+        try:
+            self.acquire(baudrate)
+        except Exception as error:
+            return False, error
+        return True, None
+
+    def release(self):
+        '''Closes the port, e.g. so an external tool can open it.'''
+        port, self.port = self.port, None
+        if port is None:
+            return
+        with _sessionsLock:
+            if _sessions.get(self.portName) is self:
+                del _sessions[self.portName]
+        tuning, self.tuning = self.tuning, None
+        if tuning is not None:
+            tuning.restore()
+        try:
+            closePort(port)
+        except Exception:
+            pass
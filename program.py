@@ -5,21 +5,85 @@ import sys
 import os
 
 import argparse
-# for spawning lpc21isp process
-from multiprocessing import Process, Queue
-
-from ui import Programmer
-from PyQt5.QtWidgets import QApplication
+import lpc21isp
+# for running one programming session per port in headless mode
+import multiprocessing
 
 # baudrate for lpc21isp: 38400
 # baudrate for mx2+ FW:  115200
 
+def parseArguments():
+    parser = argparse.ArgumentParser(description='SmartDrive MX2+ Programmer')
+    parser.add_argument('--headless', action='store_true',
+                        help='program the given ports without the UI')
+    parser.add_argument('--dashboard', action='store_true',
+                        help='program several stations at once from one dashboard')
+    parser.add_argument('--port', action='append', dest='ports', default=[],
+                        help='serial port to program, can be repeated (headless, dashboard)')
+    parser.add_argument('--firmware', help='MX2+ OTA file (headless, dashboard)')
+    parser.add_argument('--ble-firmware', help='SmartDrive Bluetooth firmware file (dashboard)')
+    parser.add_argument('--selftest', action='store_true',
+                        help='test the serial adapters of the ports with a loopback plug and exit')
+    parser.add_argument('--stages', type=lambda s: s.split(','),
+                        default=['bootloader', 'firmware'],
+                        help='comma separated stages to run (headless)')
+    parser.add_argument('--allow-unlisted', action='store_true',
+                        help='program firmware images that are in no manifest')
+    parser.add_argument('--bootloader-preset', default='default',
+                        help='lpc21isp options: default, fast (115200 baud) or nowipe (blank units)')
+    parser.add_argument('--bootloader-jobs', type=int, default=None,
+                        help='lpc21isp runs at the same time (dashboard), defaults to 8')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes, defaults to one per port up to the core count')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve programming statistics on http://localhost:PORT/')
+    parser.add_argument('--metrics-file', default=None,
+                        help='write programming statistics to this file every few seconds')
+    parser.add_argument('--jobs-file', default=None,
+                        help='where unit progress is kept for resuming, defaults to ~/.sdprogrammer/jobs.sqlite3')
+    args, _ = parser.parse_known_args()
+    if args.headless and (not args.ports or not args.firmware):
+        parser.error('--headless needs at least one --port and a --firmware')
+    if args.bootloader_preset not in lpc21isp.presets:
+        parser.error('--bootloader-preset must be one of {}'.format(', '.join(lpc21isp.presets)))
+    import headless
+    unknown = [stage for stage in args.stages if stage not in headless.stages]
+    if unknown:
+        parser.error('unknown --stages {}, must be from {}'.format(
+            ', '.join(unknown), ', '.join(headless.stages)))
+    return args
+
 def main():
+    args = parseArguments()
+    import tools
+    # locate and check the external tools once, before any stage runs
+    for tool in tools.discover().values():
+        print(tools.describe(tool))
+    if args.allow_unlisted:
+        import manifest
+        manifest.allowUnlisted()
+    if args.selftest:
+        import selftest
+        sys.exit(selftest.main(args.ports))
+    if args.headless:
+        import headless
+        sys.exit(headless.main(args))
+
+    from ui import Programmer
+    from PyQt5.QtWidgets import QApplication
+
     app = QApplication(sys.argv)
-    p = Programmer()
+    if args.dashboard:
+        from dashboard import DashboardWindow
+        from ui import listSerialPorts
+        d = DashboardWindow(args.ports or listSerialPorts(), args.firmware, args.ble_firmware,
+                            args.bootloader_preset, args.bootloader_jobs)
+        sys.exit(app.exec_())
+    p = Programmer(metricsPort=args.metrics_port, metricsFile=args.metrics_file,
+                   jobsFile=args.jobs_file)
     sys.exit(app.exec_())
     return
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
-
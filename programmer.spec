@@ -1,4 +1,9 @@
 # -*- mode: python -*-
+import os
+import sys
+
+sys.path.insert(0, SPECPATH)
+import bundle
 
 block_cipher = None
 
@@ -15,11 +20,8 @@ a = Analysis(['program.py'],
              cipher=block_cipher,
              noarchive=False)
 
-# added for including the lpc21isp executables
-a.datas += Tree('./exes', prefix='exes/')
-a.datas += Tree('./firmwares', prefix='firmwares/')
-a.datas += Tree('./icons', prefix='icons/')
-a.datas += Tree('./images', prefix='images/')
+# lpc21isp executables, firmwares (OTA images compressed), icons and images
+a.datas += [(name, path, 'DATA') for name, path in bundle.datas(os.path.join(workpath, 'bundle'))]
 
 pyz = PYZ(a.pure, a.zipped_data,
              cipher=block_cipher)
@@ -0,0 +1,304 @@
+#!/usr/bin/python
+'''Performance regression checks for the programmer's hot paths.
+
+Each case times one hot path on the bundled firmware images or the
+recorded tool output in fakes/profiles:
+
+    checksum       packet.checkSum over every OTA block
+    encode         Packet.encode of every OTA block
+    validate       Packet.isValid of every framed OTA packet
+    decoder        Decoder.feed of the framed image in 64 byte reads
+    framing        ota.FrameStream of the OTA image, as SmartDrive.prepare
+    frames         ota.firmwareFrames of the image in memory, as sent
+    lpc21isp       lpc21isp.OutputParser over the recorded lpc21isp output
+    bleupdate-get     bleupdate.OutputParser over the recorded 'get' output
+    bleupdate-update  bleupdate.OutputParser over the recorded 'update' output
+
+A case is run in rounds of enough loops to take roundTime, and its time
+is the fastest round, per loop.  Times are stored relative to a fixed
+pure Python calibration workload that is timed in the same run, so the
+baselines in regression.json carry over to a faster or slower machine
+reasonably well.  A case that is more than --threshold slower than its
+baseline is measured again, to rule out a busy moment, and fails if it
+still is.  The parser cases take well under a millisecond and are mostly
+regular expression work, which doesn't scale with the calibration as
+closely, so they get the wider threshold in caseThresholds.
+
+    python regression.py                 compare with regression.json
+    python regression.py --save          store new baselines
+    python regression.py -k lpc21isp     only the matching cases
+    python -m pytest test_regression.py  the same checks as a test suite
+
+Nothing here needs a display or hardware.
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import bleupdate
+import lpc21isp
+import ota
+import packet
+from packet import Decoder, Packet
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, 'fakes'))
+import replay
+
+baselineFile = os.path.join(here, 'regression.json')
+firmwares = os.path.join(here, 'firmwares')
+defaultFirmware = os.path.join(firmwares, 'MX2+.15.ota')
+
+# seconds each round should take at least
+roundTime = 0.1
+rounds = 7
+# a case fails if it is this much slower than its baseline
+threshold = 0.25
+# wider thresholds of the cases that are noisier than that
+caseThresholds = {
+    'lpc21isp': 0.4,
+    'bleupdate-get': 0.4,
+    'bleupdate-update': 0.4,
+}
+# times a slow case is measured again before it fails
+retries = 2
+
+def readFirmware(fileName=defaultFirmware):
+    return ota.readFirmware(fileName)[0]
+
+def blocks(fw):
+    return [bytes(fw[i:(i + ota.blockSize)]) for i in range(0, len(fw), ota.blockSize)]
+
+def framedImage(fw):
+    return bytes(ota.FrameStream(fw).data)
+
+def recordedOutput(name):
+    '''The text of a recorded tool profile, as the tool printed it.'''
+    return [text for delay, text in replay.loadProfile(replay.profile(name))]
+
+# case setups: each returns the function timed
+
+def caseChecksum():
+    data = blocks(readFirmware())
+    checkSum = packet.checkSum
+
+    def run():
+        for block in data:
+            checkSum(block)
+    return run
+
+def caseEncode():
+    data = blocks(readFirmware())
+    buffer = bytearray(Packet.packetLength(ota.blockSize) * len(data))
+
+    def run():
+        offset = 0
+        for block in data:
+            offset = Packet.encode(buffer, offset, Packet.ota, Packet.smartDrive, block)
+    return run
+
+def caseValidate():
+    frames = [Packet(data=bytearray(frame)) for percent, frame in
+              ota.FrameStream(readFirmware()).frames()]
+
+    def run():
+        for p in frames:
+            if not p.isValid(Packet.ota, Packet.smartDrive):
+                raise AssertionError('invalid frame')
+    return run
+
+def caseDecoder():
+    stream = framedImage(readFirmware())
+    count = len(ota.FrameStream(readFirmware()).ends)
+
+    def run():
+        decoder = Decoder()
+        found = 0
+        for i in range(0, len(stream), 64):
+            found += len(decoder.feed(stream[i:(i + 64)]))
+        if found != count:
+            raise AssertionError('decoded {} of {} packets'.format(found, count))
+    return run
+
+def caseFraming():
+    fw = ota.FirmwareFile(defaultFirmware)
+
+    def run():
+        ota.FrameStream(fw)
+    return run
+
+def caseFrames():
+    fw = readFirmware()
+
+    def run():
+        for percent, frame in ota.firmwareFrames(fw):
+            pass
+    return run
+
+def caseLPC21ISP():
+    output = recordedOutput('lpc21isp.txt')
+
+    def run():
+        parser = lpc21isp.OutputParser()
+        for text in output:
+            percent, status = parser.feed(text)
+        if int(percent) != 100:
+            raise AssertionError('parsed {}%'.format(percent))
+    return run
+
+def caseBleUpdate(command):
+    output = recordedOutput('bleupdate-{}.txt'.format(command))
+
+    def run():
+        parser = bleupdate.OutputParser(command)
+        for text in output:
+            parser.feed(text)
+        parser.finish()
+        if parser.errors:
+            raise AssertionError(parser.errors[0])
+    return run
+
+cases = {
+    'checksum': caseChecksum,
+    'encode': caseEncode,
+    'validate': caseValidate,
+    'decoder': caseDecoder,
+    'framing': caseFraming,
+    'frames': caseFrames,
+    'lpc21isp': caseLPC21ISP,
+    'bleupdate-get': lambda: caseBleUpdate('get'),
+    'bleupdate-update': lambda: caseBleUpdate('update'),
+}
+
+def calibration():
+    '''A fixed mix of byte, integer and call overhead work.'''
+    data = bytearray(range(256)) * 64
+    total = 0
+    for i in range(0, len(data), 16):
+        block = data[i:(i + 16)]
+        total = (total + sum(block)) & 0xFFFF
+    return total
+
+def measure(run, rounds=rounds, roundTime=roundTime):
+    '''Returns the fastest round's seconds per loop of run.'''
+    run()
+    loops = 1
+    while True:
+        begin = time.perf_counter()
+        for i in range(loops):
+            run()
+        elapsed = time.perf_counter() - begin
+        if elapsed >= roundTime:
+            break
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(roundTime / elapsed) + 1))
+    best = elapsed
+    for r in range(rounds - 1):
+        begin = time.perf_counter()
+        for i in range(loops):
+            run()
+        best = min(best, time.perf_counter() - begin)
+    return best / loops
+
+def runCases(names, rounds=rounds):
+    '''Returns the calibration time and {name: seconds per loop}.'''
+    calibrate = measure(calibration, rounds)
+    times = {}
+    for name in names:
+        times[name] = measure(cases[name](), rounds)
+    # again at the end, in case the machine got busier or quieter
+    calibrate = min(calibrate, measure(calibration, rounds))
+    return calibrate, times
+
+def loadBaselines(fileName=baselineFile):
+    try:
+        with open(fileName) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def saveBaselines(calibrate, times, fileName=baselineFile):
+    old = loadBaselines(fileName) or {}
+    entries = old.get('cases', {})
+    for name, seconds in times.items():
+        entries[name] = {'seconds': seconds, 'relative': seconds / calibrate}
+    baselines = {
+        'platform': {'python': platform.python_version(), 'system': platform.platform()},
+        'calibration': calibrate,
+        'cases': dict(sorted(entries.items())),
+    }
+    with open(fileName, 'w') as f:
+        json.dump(baselines, f, indent=2)
+        f.write('\n')
+
+def compare(calibrate, times, baselines, threshold=threshold):
+    '''Returns [(name, seconds, ratio to the baseline or None, failed)].'''
+    results = []
+    for name, seconds in times.items():
+        entry = (baselines or {}).get('cases', {}).get(name)
+        if entry is None:
+            results.append((name, seconds, None, False))
+            continue
+        ratio = seconds / calibrate / entry['relative']
+        limit = max(threshold, caseThresholds.get(name, 0))
+        results.append((name, seconds, ratio, ratio > 1 + limit))
+    return results
+
+def check(names, baselines, threshold=threshold, rounds=rounds, retries=retries):
+    '''Measures the cases and compares them with the baselines, measuring
+    the slow ones again. Returns the calibration time, the times and the
+    compare() results.'''
+    calibrate, times = runCases(names, rounds)
+    results = compare(calibrate, times, baselines, threshold)
+    for retry in range(retries):
+        slow = [name for name, seconds, ratio, failed in results if failed]
+        if not slow:
+            break
+        again = runCases(slow, rounds)[1]
+        times.update({name: min(times[name], again[name]) for name in slow})
+        results = compare(calibrate, times, baselines, threshold)
+    return calibrate, times, results
+
+def report(results):
+    lines = ['{:18s} {:>12s} {:>10s}  {}'.format('case', 'per loop', 'baseline', 'result')]
+    for name, seconds, ratio, failed in results:
+        lines.append('{:18s} {:>9.1f} us {:>10s}  {}'.format(
+            name, seconds * 1e6, '-' if ratio is None else '{:.2f}x'.format(ratio),
+            'REGRESSED' if failed else ('no baseline' if ratio is None else 'ok')))
+    return '\n'.join(lines)
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Performance regression checks for the hot paths.')
+    parser.add_argument('-k', dest='match', default=None,
+                        help='only run the cases whose name contains this')
+    parser.add_argument('--save', action='store_true',
+                        help='store the times as the new baselines')
+    parser.add_argument('--threshold', type=float, default=threshold,
+                        help='fail a case that is this fraction slower than its baseline')
+    parser.add_argument('--rounds', type=int, default=rounds)
+    parser.add_argument('--baselines', default=baselineFile)
+    args = parser.parse_args(args)
+
+    names = [n for n in cases if args.match is None or args.match in n]
+    if not names:
+        print('No case matches {}'.format(args.match))
+        return 2
+    baselines = loadBaselines(args.baselines)
+    calibrate, times, results = check(names, baselines, args.threshold, args.rounds,
+                                      0 if args.save else retries)
+    print(report(results))
+    print('calibration {:.1f} us'.format(calibrate * 1e6))
+    if args.save:
+        saveBaselines(calibrate, times, args.baselines)
+        print('Baselines saved to {}'.format(args.baselines))
+        return 0
+    regressed = [name for name, seconds, ratio, failed in results if failed]
+    if regressed:
+        print('Regressed: {}'.format(', '.join(regressed)))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,214 @@
+'''Serial adapter self-test, run with a loopback plug on each port.
+
+Marginal USB-serial adapters that run slowly or lose bytes otherwise
+only show up as failed firmware transfers.  With TX wired to RX (or a
+"sim://name?loopback=1" port), each baud rate the programmer uses is
+tested for
+    throughput  a stream of bytes written and read back, as a fraction
+                of the baud rate (8N1, ten bits per byte)
+    latency     round trips of one OTA packet, written and read back
+    errors      bytes lost or changed on the way, per byte sent
+and a port is flagged if any of them is past its threshold, before a
+unit is connected to it.
+
+    python selftest.py                     every TTL232R-3V3 port
+    python selftest.py sim://a?loopback=1&realtime=1
+'''
+import argparse
+import collections
+import statistics
+import sys
+import threading
+import time
+
+import lpc21isp
+import ota
+import portsession
+from packet import Packet
+
+baudrates = (lpc21isp.baudrate, ota.baudrate)
+
+# seconds of data streamed at each baud rate
+streamSeconds = 1.0
+# bytes written at a time while streaming
+chunkSize = 256
+# round trips timed at each baud rate
+pings = 50
+pingSize = Packet.packetLength(ota.blockSize)
+
+# thresholds
+minEfficiency = 0.8
+maxLatency = 0.05
+maxErrorRate = 0.0
+
+Result = collections.namedtuple(
+    'Result', 'port baudrate sent received efficiency latency maxLatency errors problems')
+
+def wireTime(size, baudrate):
+    return size * 10 / baudrate
+
+def pattern(size):
+    '''A counting pattern, so lost bytes can be told from changed ones.'''
+    return (bytes(range(256)) * (size // 256 + 1))[:size]
+
+def countErrors(sent, received, window=8):
+    '''Returns the bytes of sent that were lost or changed in received.'''
+    errors = 0
+    k = 0
+    for b in received:
+        if k >= len(sent):
+            errors += 1
+            continue
+        if b == sent[k]:
+            k += 1
+            continue
+        # skip over lost bytes, else the byte was changed
+        skip = sent.find(bytes([b]), k + 1, k + 1 + window)
+        if skip >= 0:
+            errors += skip - k
+            k = skip + 1
+        else:
+            errors += 1
+            k += 1
+    return errors + len(sent) - k
+
+def readBack(port, data, size, deadline):
+    '''Reads into data until it holds size bytes or the deadline passes.
+    Returns the time the last byte arrived, or None.'''
+    last = None
+    while len(data) < size and time.monotonic() < deadline:
+        n = len(data)
+        data += port.read(max(1, min(size - len(data), port.in_waiting)))
+        if len(data) > n:
+            last = time.monotonic()
+    return last
+
+def stream(port, baudrate, seconds=streamSeconds):
+    '''Writes seconds worth of data and reads it back as it arrives.
+    Returns (sent, received, seconds until the last byte came back).'''
+    sent = pattern(int(seconds * baudrate / 10))
+    received = bytearray()
+    port.reset_input_buffer()
+    begin = last = time.monotonic()
+    for i in range(0, len(sent), chunkSize):
+        port.write(sent[i:(i + chunkSize)])
+        n = len(received)
+        received += port.read(port.in_waiting)
+        if len(received) > n:
+            last = time.monotonic()
+    # everything should be back within the wire time, with a margin
+    deadline = time.monotonic() + 2 * seconds + 0.5
+    last = readBack(port, received, len(sent), deadline) or last
+    return sent, bytes(received), last - begin
+
+def ping(port, baudrate, count=pings):
+    '''Returns the round trip times of count OTA packet sized writes that
+    came back whole, and the bytes lost or changed.'''
+    data = pattern(pingSize)
+    times = []
+    errors = 0
+    for i in range(count):
+        port.reset_input_buffer()
+        back = bytearray()
+        begin = time.monotonic()
+        port.write(data)
+        last = readBack(port, back, len(data), begin + 0.5 + wireTime(len(data), baudrate))
+        if len(back) == len(data):
+            times.append(last - begin)
+        errors += countErrors(data, back)
+    return times, errors
+
+def failedResults(portName, baudrates, problem):
+    '''Flagged Results for the baud rates a port couldn't be tested at.'''
+    return [Result(portName, b, 0, 0, 0, None, None, 0, [problem]) for b in baudrates]
+
+def testPort(portName, baudrates=baudrates, seconds=streamSeconds):
+    '''Tests one looped back port at each baud rate, returns the Results.'''
+    results = []
+    try:
+        port = portsession.openPort(portName, baudrate=baudrates[0], timeout=0.05)
+    except Exception as error:
+        return failedResults(portName, baudrates, "Couldn't open port: {}".format(error))
+    try:
+        for baudrate in baudrates:
+            port.baudrate = baudrate
+            sent, received, elapsed = stream(port, baudrate, seconds)
+            if not received:
+                results.append(Result(portName, baudrate, len(sent), 0, 0, None, None, len(sent),
+                                      ['nothing read back, is the loopback plug in?']))
+                continue
+            times, pingErrors = ping(port, baudrate)
+            errors = countErrors(sent, received) + pingErrors
+            total = len(sent) + pings * pingSize
+            efficiency = len(received) * 10 / baudrate / elapsed if elapsed else 0
+            problems = []
+            if efficiency < minEfficiency:
+                problems.append('throughput {:.0%} of the baud rate'.format(efficiency))
+            if times and max(times) > maxLatency:
+                problems.append('round trip up to {:.1f} ms'.format(max(times) * 1000))
+            if errors / total > maxErrorRate:
+                problems.append('{} of {} bytes lost or changed'.format(errors, total))
+            results.append(Result(portName, baudrate, total, len(received), efficiency,
+                                  statistics.median(times) if times else None,
+                                  max(times) if times else None, errors, problems))
+    finally:
+        portsession.closePort(port)
+    return results
+
+def run(portNames, baudrates=baudrates, seconds=streamSeconds):
+    '''Tests the ports concurrently, returns their Results in order.'''
+    results = {}
+
+    def test(portName):
+        try:
+            results[portName] = testPort(portName, baudrates, seconds)
+        except Exception as error:
+            # e.g. the adapter was unplugged during the test
+            results[portName] = failedResults(portName, baudrates, 'Test failed: {}'.format(error))
+
+    threads = [threading.Thread(target=test, args=(p,)) for p in portNames]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return [r for p in portNames for r in results[p]]
+
+def flagged(results):
+    '''The names of the ports that failed any test, in order.'''
+    names = []
+    for r in results:
+        if r.problems and r.port not in names:
+            names.append(r.port)
+    return names
+
+def report(results):
+    lines = ['{:24s} {:>7s} {:>11s} {:>9s} {:>9s} {:>8s}  {}'.format(
+        'port', 'baud', 'throughput', 'rtt p50', 'rtt max', 'errors', 'result')]
+    for r in results:
+        lines.append('{:24s} {:7d} {:>11s} {:>9s} {:>9s} {:8d}  {}'.format(
+            r.port, r.baudrate, '{:.0%}'.format(r.efficiency),
+            '{:.1f} ms'.format(r.latency * 1000) if r.latency is not None else '-',
+            '{:.1f} ms'.format(r.maxLatency * 1000) if r.maxLatency is not None else '-',
+            r.errors, '; '.join(r.problems) or 'ok'))
+    return '\n'.join(lines)
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Self-test serial adapters with a loopback plug.')
+    parser.add_argument('ports', nargs='*', help='ports to test, defaults to every TTL232R-3V3 port')
+    parser.add_argument('--seconds', type=float, default=streamSeconds,
+                        help='seconds of data streamed at each baud rate')
+    args = parser.parse_args(args)
+    portNames = args.ports or portsession.listSerialPorts()
+    if not portNames:
+        print('No serial ports found.')
+        return 1
+    results = run(portNames, seconds=args.seconds)
+    print(report(results))
+    bad = flagged(results)
+    if bad:
+        print('Flagged: {}'.format(', '.join(bad)))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+'''Serial I/O tracing for the OTA protocol, and a replay tool for traces.
+
+A TracedPort wraps a pyserial-style port and records every write and
+every non-empty read with a monotonic timestamp into a Recorder.  The
+recorder keeps the most recent records in a fixed amount of memory as
+compact binary segments and only touches the disk when dump() is
+called, e.g. when programming failed.
+
+Replaying a trace feeds both directions through packet.Decoder and
+shows every packet with the gap since the previous one, throughput and
+the stalls in the transfer:
+
+    python ./serialtrace.py [--all] <file.sdtrace>
+'''
+import argparse
+import collections
+import os
+import re
+import struct
+import sys
+import time
+
+from packet import Decoder, Packet
+
+magic = b'SDTRACE1'
+# record kind, monotonic seconds, data length
+recordHeader = struct.Struct('<cdH')
+
+WRITE = b'w'
+READ = b'r'
+OPEN = b'o'
+CLOSE = b'c'
+RESET = b'x'
+
+class Recorder:
+    '''Ring buffer of trace records, holding about capacity bytes.'''
+    segmentSize = 64 * 1024
+
+    def __init__(self, capacity=4 * 1024 * 1024):
+        self.maxSegments = max(2, capacity // self.segmentSize)
+        self.segments = collections.deque()
+        self.segment = bytearray()
+        self.dropped = 0
+
+    def record(self, kind, data=b''):
+        segment = self.segment
+        segment += recordHeader.pack(kind, time.monotonic(), len(data))
+        segment += data
+        if len(segment) >= self.segmentSize:
+            self.segments.append(segment)
+            self.segment = bytearray()
+            if len(self.segments) >= self.maxSegments:
+                self.dropped += 1
+                self.segments.popleft()
+
+    def clear(self):
+        self.segments.clear()
+        self.segment = bytearray()
+        self.dropped = 0
+
+    def dump(self, fileName):
+        '''Writes the recorded trace to fileName.'''
+        with open(fileName, 'wb') as f:
+            f.write(magic)
+            for segment in self.segments:
+                f.write(segment)
+            f.write(self.segment)
+        return fileName
+
+def traceFileName(traceDir, portName):
+    '''Returns a new trace file name for the port in traceDir.'''
+    safeName = re.sub(r'[^\w.-]+', '_', portName).strip('_')
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(traceDir, '{}-{}.sdtrace'.format(safeName, stamp))
+
+class TracedPort:
+    '''Pyserial-style port that records its I/O into a Recorder.'''
+    def __init__(self, port, recorder, name=None):
+        self._port = port
+        self._recorder = recorder
+        recorder.record(OPEN, (name or str(getattr(port, 'port', ''))).encode('utf-8'))
+
+    @property
+    def timeout(self):
+        return self._port.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self._port.timeout = value
+
+    @property
+    def in_waiting(self):
+        return self._port.in_waiting
+
+    @property
+    def out_waiting(self):
+        return self._port.out_waiting
+
+    def write(self, data):
+        self._recorder.record(WRITE, data)
+        return self._port.write(data)
+
+    def read(self, size=1):
+        data = self._port.read(size)
+        if data:
+            self._recorder.record(READ, data)
+        return data
+
+    def reset_input_buffer(self):
+        self._recorder.record(RESET)
+        self._port.reset_input_buffer()
+
+    def close(self):
+        self._recorder.record(CLOSE)
+        self._port.close()
+
+    def __getattr__(self, name):
+        return getattr(self._port, name)
+
+def readTrace(fileName):
+    '''Yields (kind, seconds, data) for every record in a trace file.'''
+    with open(fileName, 'rb') as f:
+        data = f.read()
+    if not data.startswith(magic):
+        raise ValueError("'{}' is not a serial trace".format(fileName))
+    offset = len(magic)
+    while offset + recordHeader.size <= len(data):
+        kind, t, length = recordHeader.unpack_from(data, offset)
+        offset += recordHeader.size
+        yield kind, t, data[offset:(offset+length)]
+        offset += length
+
+packetNames = {
+    (Packet.command, Packet.otaStart): 'otaStart',
+    (Packet.command, Packet.otaStop): 'otaStop',
+    (Packet.command, Packet.otaReady): 'otaReady',
+    (Packet.ota, Packet.smartDrive): 'ota',
+}
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def replay(fileName, showAll=False, stallFactor=10, out=sys.stdout):
+    '''Prints the packets in a trace with their gaps, then a summary of
+    throughput and stalls in the data written to the device.'''
+    decoders = {WRITE: Decoder(), READ: Decoder()}
+    begin = None
+    last = {WRITE: None, READ: None}
+    gaps = []
+    packets = []
+    written = 0
+    for kind, t, data in readTrace(fileName):
+        if begin is None:
+            begin = t
+        if kind in decoders:
+            if kind == WRITE:
+                written += len(data)
+            for p in decoders[kind].feed(data):
+                gap = None if last[kind] is None else t - last[kind]
+                last[kind] = t
+                name = packetNames.get((p.Type, p.SubType), '{:02x}/{:02x}'.format(p.Type, p.SubType))
+                packets.append((t - begin, kind, name, gap, len(p.data)))
+                if kind == WRITE and name == 'ota' and gap is not None:
+                    gaps.append((gap, t - begin))
+        else:
+            packets.append((t - begin, kind, {OPEN: 'open ' + data.decode('utf-8', 'replace'),
+                                              CLOSE: 'close', RESET: 'reset input'}.get(kind, '?'),
+                            None, 0))
+
+    threshold = percentile([g for g, t in gaps], 50) * stallFactor if gaps else 0
+    for t, kind, name, gap, length in packets:
+        stall = gap is not None and threshold and gap > threshold and name == 'ota'
+        if showAll or name != 'ota' or stall:
+            out.write('{:10.6f} {} {:12s} {:>10s} {}\n'.format(
+                t, {WRITE: '->', READ: '<-'}.get(kind, '  '), name,
+                '' if gap is None else '+{:.2f}ms'.format(gap * 1000),
+                'STALL' if stall else ''))
+
+    if begin is None:
+        out.write('empty trace\n')
+        return
+    out.write('\n{} packets written, {} read, {} bytes written, {} bytes skipped as noise\n'.format(
+        decoders[WRITE].packets, decoders[READ].packets, written,
+        decoders[WRITE].dropped + decoders[READ].dropped))
+    if gaps:
+        total = sum(g for g, t in gaps)
+        values = [g for g, t in gaps]
+        out.write('ota gap: p50 {:.2f}ms p99 {:.2f}ms max {:.2f}ms, {:.0f} bytes/s\n'.format(
+            percentile(values, 50) * 1000, percentile(values, 99) * 1000, max(values) * 1000,
+            written / total if total > 0 else 0))
+        stalls = [(g, t) for g, t in gaps if g > threshold]
+        out.write('{} stalls over {:.2f}ms, {:.3f}s lost\n'.format(
+            len(stalls), threshold * 1000, sum(g - threshold for g, t in stalls)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a serial trace')
+    parser.add_argument('trace')
+    parser.add_argument('--all', action='store_true', help='show every OTA packet')
+    parser.add_argument('--stall', type=float, default=10,
+                        help='gaps this many times the median are stalls')
+    args = parser.parse_args()
+    replay(args.trace, showAll=args.all, stallFactor=args.stall)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+'''Simulated MX2+ bootloader behind a pyserial-style port.
+
+ota.openPort returns a SimulatedPort for port names like
+
+    sim://1?boot=0.5&realtime=1&drop=0.001
+
+where the optional query sets the seconds until the device has booted
+after power on (boot), whether writes take as long as they would on the
+wire (realtime) and the fraction of written bytes that get lost (drop).
+
+With loopback=1 the port is a loopback plug instead of a device: written
+bytes come straight back.  corrupt sets the fraction of bytes that come
+back wrong.  latency sets the seconds received bytes are held before
+they can be read, like the latency timer of a USB adapter; it drops to
+1 ms in low latency mode (see ftdi.py).
+'''
+import collections
+import random
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from packet import Decoder, Packet
+
+# power on time of each simulated device, by name
+_poweredOn = {}
+
+class SimulatedPort:
+    def __init__(self, port, baudrate=115200, timeout=1):
+        url = urlsplit(port)
+        options = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        self.port = port
+        self.name = url.netloc + url.path
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.bootTime = float(options.get('boot', 0))
+        self.realtime = options.get('realtime', '0') not in ('0', 'false')
+        self.dropRate = float(options.get('drop', 0))
+        self.loopback = options.get('loopback', '0') not in ('0', 'false')
+        self.corruptRate = float(options.get('corrupt', 0))
+        self.defaultLatency = self.latency = float(options.get('latency', 0))
+        # (time they can be read, bytes) held by the latency timer
+        self.pending = collections.deque()
+        self.rng = random.Random(self.name)
+        self.is_open = True
+
+        self.decoder = Decoder()
+        self.output = bytearray()
+        self.state = 'boot'
+        self.image = bytearray()
+        self.packets = 0
+        self.bytesWritten = 0
+        self.poweredOn = _poweredOn.setdefault(self.name, time.monotonic())
+
+    @staticmethod
+    def powerCycle(name):
+        _poweredOn[name] = time.monotonic()
+
+    def set_low_latency_mode(self, enable):
+        self.latency = min(self.defaultLatency, 0.001) if enable else self.defaultLatency
+
+    def send(self, data):
+        '''Makes data readable, once the latency timer expires.'''
+        if self.latency:
+            self.pending.append((time.monotonic() + self.latency, bytes(data)))
+        else:
+            self.output += data
+
+    def deliver(self):
+        now = time.monotonic()
+        while self.pending and self.pending[0][0] <= now:
+            self.output += self.pending.popleft()[1]
+
+    @property
+    def in_waiting(self):
+        self.deliver()
+        return len(self.output)
+
+    @property
+    def out_waiting(self):
+        return 0
+
+    def reset_input_buffer(self):
+        self.deliver()
+        del self.output[:]
+
+    flushInput = reset_input_buffer
+
+    def close(self):
+        self.is_open = False
+
+    def flush(self):
+        # writes are delivered (and take their wire time) as they are made
+        pass
+
+    def write(self, data):
+        data = bytes(data)
+        self.bytesWritten += len(data)
+        if self.realtime:
+            # 8N1: ten bits on the wire per byte
+            time.sleep(len(data) * 10 / self.baudrate)
+        if self.dropRate > 0:
+            data = bytes(b for b in data if self.rng.random() >= self.dropRate)
+        if self.corruptRate > 0:
+            data = bytes(b ^ 0x55 if self.rng.random() < self.corruptRate else b for b in data)
+        if self.loopback:
+            self.send(data)
+            return len(data)
+        for p in self.decoder.feed(data):
+            self.receive(p)
+        return len(data)
+
+    def read(self, size=1):
+        self.deliver()
+        if not self.output and self.timeout:
+            # wait for held bytes, up to the timeout
+            wait = self.timeout
+            if self.pending:
+                wait = min(wait, max(0, self.pending[0][0] - time.monotonic()))
+            time.sleep(wait)
+            self.deliver()
+        data = bytes(self.output[:size])
+        del self.output[:len(data)]
+        return data
+
+    def receive(self, p):
+        '''Handles one packet the way the MX2+ bootloader would.'''
+        self.packets += 1
+        booted = time.monotonic() - self.poweredOn >= self.bootTime
+        if p.isValid(Type=Packet.command, SubType=Packet.otaStart):
+            if booted and self.baudrate == 115200:
+                self.state = 'ota'
+                self.image = bytearray()
+                ready = Packet(Packet.command, Packet.otaReady)
+                self.send(ready.data)
+        elif p.isValid(Type=Packet.ota, SubType=Packet.smartDrive):
+            if self.state == 'ota':
+                self.image += p.data[3:-3]
+        elif p.isValid(Type=Packet.command, SubType=Packet.otaStop):
+            if self.state == 'ota':
+                self.state = 'done'
@@ -1,29 +1,18 @@
-import re
-import time
-import serial
-import sys
-from PyQt5.QtCore import QObject, QProcess, pyqtSignal, pyqtSlot
+'''Qt adapter for smartdrivecore.SmartDriveCore.
 
-import resource
-from packet import Packet
+The core's events are emitted as the signals of the same name, its
+stages run as slots on the SmartDrive's thread, and lpc21isp runs in a
+BootloaderPool, which may be shared with other stations.
+'''
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 
-def processErrorToString(e):
-    if e == 0:
-        return 'The process failed to start. Either the invoked program is missing, or you may have insufficient permissions to invoke the program.'
-    elif e == 1:
-        return 'The process crashed some time after starting successfully.'
-    elif e == 2:
-        return 'The last waitFor...() function timed out. The state of QProcess is unchanged, and you can try calling waitFor...() again.'
-    elif e == 3:
-        return 'An error occurred when attempting to read from the process. For example, the process may not be running.'
-    elif e == 4:
-        return 'An error occurred when attempting to write to the process. For example, the process may not be running, or it may have closed its input channel.'
-    elif e == 5:
-        return 'An unknown error occurred. This is the default return value of error().'
+import lpc21isp
+import ota
+from bootloaderpool import BootloaderPool
+from events import coreAttribute
+from smartdrivecore import SmartDriveCore
 
 class SmartDrive(QObject):
-    totalLPC21ISPLength = 574
-
     invalidFirmware = pyqtSignal(str)
 
     bootloaderStatus = pyqtSignal(int, str)
@@ -35,248 +24,112 @@ class SmartDrive(QObject):
     firmwareFailed = pyqtSignal(str)
 
     stopSignal = pyqtSignal()
-
-    def __init__(self, port, fwFileName=None, transmitDelay=0.001):
+    portReleased = pyqtSignal()
+    # port, preset; connected to the bootloader pool
+    submitBootloader = pyqtSignal(str, str)
+    cancelBootloader = pyqtSignal(str)
+
+    portName = coreAttribute('portName')
+    session = coreAttribute('session')
+    fw = coreAttribute('fw')
+    fwFileName = coreAttribute('fwFileName')
+    image = coreAttribute('image')
+    version = coreAttribute('version')
+    crc = coreAttribute('crc')
+    frames = coreAttribute('frames')
+    isProgramming = coreAttribute('isProgramming')
+    bootloaderResult = coreAttribute('bootloaderResult')
+    readyTime = coreAttribute('readyTime')
+    transferTime = coreAttribute('transferTime')
+    transferBytes = coreAttribute('transferBytes')
+    bootloaderSetupTime = coreAttribute('bootloaderSetupTime')
+    firmwareSetupTime = coreAttribute('firmwareSetupTime')
+
+    def __init__(self, port, fwFileName=None, transmitDelay=0.001, traceDir=None,
+                 pool=None, bootloaderPreset='default'):
         super().__init__()
-        self.transmitDelay = transmitDelay
-        self.portName = port
-        self.isProgramming = False
-        self.fw = None
-        self.fwFileName = None
+        self.core = SmartDriveCore(port, transmitDelay=transmitDelay, traceDir=traceDir,
+                                   bootloaderPreset=bootloaderPreset)
+        for name in self.core.eventNames:
+            self.core.events.connect(name, getattr(self, name).emit)
+
+        # lpc21isp runs in a pool, which may be shared with other stations
+        self.pool = pool if pool is not None else BootloaderPool(parent=self)
+        self.bootloaderPort = None
+        self.submitBootloader.connect(self.pool.submit)
+        self.cancelBootloader.connect(self.pool.cancel)
+        self.pool.status.connect(self.onBootloaderStatus)
+        self.pool.finished.connect(self.onBootloaderResult)
 
         if fwFileName is not None:
-            self.onFirmwareFileSelected(fwFileName)
-
-        self.bootloaderPercent = 0
-        self.bootloaderState = ''
-        self.firmwarePercent = 0
-        self.firmwareState = ''
-        self.bootloaderProcess = None
+            self.core.selectFirmware(fwFileName)
 
     @staticmethod
     def versionBytesToString(vBytes):
-        v = sum(vBytes)
-        if v >= 0xFF or v <= 0x00:
-            return 'unknown'
-        else:
-            return '{}.{}'.format((v & 0xF0) >> 4, v & 0x0F)
+        return ota.versionString(vBytes)
 
     @pyqtSlot(str)
     def onPortSelected(self, portName):
-        self.portName = portName
+        self.core.selectPort(portName)
+
+    @pyqtSlot()
+    def releasePort(self):
+        '''Closes the port if the session holds it open.'''
+        self.core.releasePort()
+        self.portReleased.emit()
 
     @pyqtSlot(str)
     def onFirmwareFileSelected(self, fwFileName):
-        self.fw = None
-        self.version = 'unknown'
-        self.crc = 'unknown'
-        self.fwCheckSum = 0
-        self.fwFileName = fwFileName
-        if fwFileName is None or len(fwFileName) == 0:
-            msg = "Please select a MX2+ OTA file!"
-            self.invalidFirmware.emit(msg)
-            return
-
-        # open the firmware file
-        try:
-            f = open(self.fwFileName, 'rb')
-        except Exception as error:
-            msg = "Couldn't open firmware file '{}'!\n{}".format(self.fwFileName, error)
-            self.invalidFirmware.emit(msg)
-            return
-        else:
-            with f:
-                fileData = bytearray(f.read())
-        self.version = self.versionBytesToString(fileData[0:4])
-        if self.version != 'unknown':
-            self.fw = fileData
-            self.fwCheckSum = self.fw[4:8]
-            self.crc = ''.join('{:02x}'.format(x) for x in self.fwCheckSum)
-        else:
-            msg = "Invalid OTA file '{}'!\nPlease select a valid MX2+ OTA file!".format(
-                self.fwFileName
-            )
-            self.invalidFirmware.emit(msg)
+        self.core.selectFirmware(fwFileName)
 
-    def checkPort(self):
-        '''Returns true if we have a valid port, false otherwise'''
-        if self.portName is None or len(self.portName) <= 0:
-            return False, "You must select a serial port!"
+    def checkPort(self, baudrate=lpc21isp.baudrate):
+        return self.core.checkPort(baudrate)
 
-        # open the port
-        try:
-            port = serial.Serial(port=self.portName,
-                                 baudrate=38400,
-                                 bytesize=serial.EIGHTBITS,
-                                 parity=serial.PARITY_NONE,
-                                 stopbits=serial.STOPBITS_ONE,
-                                 timeout=1)
-        except Exception as error:
-            return False, error
-        else:
-            # close the port so lpc21isp can use it
-            port.close()
-        return True, None
+    def checkFirmware(self):
+        return self.core.checkFirmware()
 
-    def processBootloaderError(self, error):
-        self.bootloaderFailed.emit(processErrorToString(error))
+    @pyqtSlot()
+    def prepare(self):
+        self.core.prepare()
 
     @pyqtSlot()
     def programBootloader(self):
-        goodPort, portErr = self.checkPort()
-        if not goodPort:
-            self.bootloaderFailed.emit(
-                "Couldn't open serial port: {}".format(portErr)
-            )
+        if self.bootloaderPort is not None:
+            # its run's result is still to come
             return
+        if not self.core.beginBootloader():
+            return
+        self.bootloaderPort = self.core.portName
+        self.submitBootloader.emit(self.bootloaderPort, self.core.bootloaderPreset)
+        self.core.onBootloaderStarted()
 
-        self.isProgramming = True
-        self.lpc21ispOutput = ''
-        self.bootloaderPercent = 0
-        self.bootloaderState = ''
-        self.bootloaderStatus.emit(0, '')
-
-        # lpc21isp process
-        self.bootloaderProcess = QProcess()
-        self.bootloaderProcess.errorOccurred.connect(self.processBootloaderError)
-        self.bootloaderProcess.readyReadStandardOutput.connect(self.onBootloaderDataReady)
-        self.bootloaderProcess.readyReadStandardError.connect(self.onBootloaderErrorReady)
-        self.bootloaderProcess.finished.connect(self.onLPC21ISPFinished)
-        self.stopSignal.connect(self.bootloaderProcess.kill)
-
-        program = resource.path('exes/lpc21isp')
-        if sys.platform.startswith('win'):
-            program += '.exe'
-        args = [
-            "-wipe",
-            resource.path("firmwares/ota-bootloader.hex"),
-            self.portName,
-            "38400",  # baudrate
-            "12000"   # crystal frequency on board
-        ]
-        if sys.platform.startswith('win'):
-            args[2] = "\\\\.\\" + self.portName
-        self.bootloaderProcess.start(program, args)
-
-    def onBootloaderDataReady(self):
-        data = str(self.bootloaderProcess.readAllStandardOutput(), 'utf-8')
-        self.lpc21ispOutput += data
-        percent, state = self.parseLPC21ISPOutput()
-        self.bootloaderStatus.emit(percent, state)
-
-    def onBootloaderErrorReady(self):
-        data = str(self.bootloaderProcess.readAllStandardError(), 'utf-8')
-        print("STDERR:",data)
-        self.lpc21ispOutput += data
-        percent, state = self.parseLPC21ISPOutput()
-        self.bootloaderStatus.emit(percent, state)
-
-    def onLPC21ISPFinished(self, code, status):
-        if code == 0:
-            self.bootloaderStatus.emit(100, 'Bootloader complete')
-            self.bootloaderFinished.emit()
-        elif self.isProgramming:
-            self.bootloaderStatus.emit(0, 'Bootloader failed.')
-            self.bootloaderFailed.emit("Bootloader failed: {}: {}".format(code, status))
-        else:
-            self.bootloaderStatus.emit(0, 'Bootloader stopped.')
-        self.bootloaderProcess = None
-        self.isProgramming = False
+    @pyqtSlot(str, int, str)
+    def onBootloaderStatus(self, portName, percent, state):
+        if portName == self.bootloaderPort:
+            self.core.onBootloaderStatus(percent, state)
 
-    def parseLPC21ISPOutput(self):
-        data = self.lpc21ispOutput
-        # TODO: regex here to determine status and percent
-        m = re.split(r'Sector \d: (\.+)', self.lpc21ispOutput, re.M)
-        if len(m) > 1:
-            percent = len(''.join(m[1:-1]).replace('\n','')) / self.totalLPC21ISPLength * 100
-        else:
-            percent = 0
-        status = m[0].split('\n')[-1]
-        if len(status) == 0:
-            status = "Writing new firmware."
-        return percent, status
+    @pyqtSlot(object)
+    def onBootloaderResult(self, result):
+        if result.port == self.bootloaderPort:
+            self.bootloaderPort = None
+            self.core.onBootloaderResult(result)
 
     @pyqtSlot()
     def stop(self):
-        self.isProgramming = False
-        if self.bootloaderProcess:
-            self.bootloaderProcess.errorOccurred.disconnect(self.processBootloaderError)
+        self.core.stop()
+        if self.bootloaderPort is not None:
+            self.cancelBootloader.emit(self.bootloaderPort)
         self.stopSignal.emit()
 
     @pyqtSlot()
-    def programFirmware(self):
-        goodPort, portErr = self.checkPort()
-        if not goodPort:
-            self.firmwareFailed.emit(
-                "Couldn't open serial port {}".format(portErr)
-            )
-            return
-
-        if self.fw is None or len(self.fw) <= 0:
-            self.firmwareFailed.emit("Please select MX2+ firmware file!")
-            return
-
-        # init variables
-        self.isProgramming = True
-        self.firmwarePercent = 0
-        self.firmwareState = ''
-        self.firmwareStatus.emit(0, '')
-
-        size = len(self.fw)
-        haveRecvReady = False
-        port = serial.Serial(port=self.portName,
-                             baudrate=115200,
-                             bytesize=serial.EIGHTBITS,
-                             parity=serial.PARITY_NONE,
-                             stopbits=serial.STOPBITS_ONE,
-                             timeout=1)
-
-        # wait for ready
-        self.firmwareStatus.emit(0, 'Waiting for Bootloader Ready')
-        while not haveRecvReady:
-            # send start
-            p = Packet(Packet.command, Packet.otaStart, [Packet.smartDrive])
-            port.flushInput();
-            port.write(p.data)
-
-            # receive ota ready
-            respData = bytearray(port.read(Packet.otaReadyLength))
-            resp = Packet(data=respData)
-            if resp.isValid(Type=Packet.command, SubType=Packet.otaReady):
-                haveRecvReady = True
-            else:
-                time.sleep(0.5)
-
-            if not self.isProgramming:
-                break
+    def saveTrace(self, fileName=None):
+        return self.core.saveTrace(fileName)
 
-        if not self.isProgramming:
-            port.close()
-            return
-
-        # send firmware data
-        for i in range(0, size, 16):
-            if not self.isProgramming:
-                break
-            length = min(size - i, 16)
-            fwData = self.fw[i:(i+length)]
-            p = Packet(Packet.ota, Packet.smartDrive, fwData)
-            port.write(p.data)
-            self.firmwareStatus.emit(100 * i/size, 'Sending MX2+ Firmware')
-            time.sleep(self.transmitDelay)
-
-        if not self.isProgramming:
-            port.close()
-            return
+    def isRunning(self):
+        return self.core.isRunning()
 
-        # send stop
-        self.firmwareStatus.emit(100, 'Rebooting MX2+')
-        p = Packet(Packet.command, Packet.otaStop, [Packet.smartDrive])
-        port.write(p.data)
-
-        # close the port
-        port.close()
-
-        # let everyone know we're finished
-        self.isProgramming = False
-        self.firmwareFinished.emit()
+    @pyqtSlot()
+    def programFirmware(self):
+        if self.core.programFirmware():
+            # get ready for the next unit while this one reboots
+            self.core.prepare()
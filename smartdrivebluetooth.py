@@ -1,29 +1,18 @@
-import re
-import time
-import serial
-import sys
+'''Qt adapters for smartdrivebluetoothcore.
+
+SmartDriveBluetooth runs the bleupdate-cli commands of its core with
+QProcess and emits the core's events as the signals of the same name;
+BluetoothStation programs every attached CC-Debugger at once.
+'''
 from PyQt5.QtCore import QObject, QProcess, pyqtSignal, pyqtSlot
-from PyQt5.QtWidgets import QFileDialog
-
-import resource
-
-import os
-exe = '/Bluegiga/BleUpdate/bleupdate-cli.exe'
-exePath = os.environ['SYSTEMDRIVE'] + exe
-
-def processErrorToString(e):
-    if e == 0:
-        return 'The process failed to start. Either the invoked program is missing, or you may have insufficient permissions to invoke the program.'
-    elif e == 1:
-        return 'The process crashed some time after starting successfully.'
-    elif e == 2:
-        return 'The last waitFor...() function timed out. The state of QProcess is unchanged, and you can try calling waitFor...() again.'
-    elif e == 3:
-        return 'An error occurred when attempting to read from the process. For example, the process may not be running.'
-    elif e == 4:
-        return 'An error occurred when attempting to write to the process. For example, the process may not be running, or it may have closed its input channel.'
-    elif e == 5:
-        return 'An unknown error occurred. This is the default return value of error().'
+
+import bleupdate
+import capture
+from events import coreAttribute
+from smartdrivebluetoothcore import SmartDriveBluetoothCore, exePath, notFoundMessage
+
+# the device shown for the one debugger programmed without selecting it
+defaultDebugger = 'default'
 
 class SmartDriveBluetooth(QObject):
     invalidFirmware = pyqtSignal(str)
@@ -41,243 +30,199 @@ class SmartDriveBluetooth(QObject):
     failed = pyqtSignal(str)
     stopSignal = pyqtSignal()
 
-    def __init__(self, fwFileName=None):
+    device = coreAttribute('device')
+    devices = coreAttribute('devices')
+    isProgramming = coreAttribute('isProgramming')
+    fwFileName = coreAttribute('fwFileName')
+    serial = coreAttribute('serial')
+    licenseKey = coreAttribute('licenseKey')
+    address = coreAttribute('address')
+    firmwarePercent = coreAttribute('firmwarePercent')
+
+    def __init__(self, fwFileName=None, device=None):
         super().__init__()
-        self.isProgramming = False
-        self.fwFileName = None
-        self.serial = None
-        self.licenseKey = None
-        self.address = None
+        self.core = SmartDriveBluetoothCore(device=device)
+        for name in self.core.eventNames:
+            self.core.events.connect(name, getattr(self, name).emit)
+        self.process = None
 
         if fwFileName is not None:
-            self.onFirmwareFileSelected(fwFileName)
-
-        self.firmwarePercent = 0
-        self.firmwareState = ''
+            self.core.selectFirmware(fwFileName)
 
-        self.listProcess = None
-        self.getProcess = None
-        self.firmwareProcess = None
-
-        
         self.listFinished.connect(self.getDeviceInfo)
         self.getFinished.connect(self.programFirmware)
 
     @pyqtSlot(str)
     def onFirmwareFileSelected(self, fwFileName):
-        self.fw = None
-        self.fwFileName = None
-        if fwFileName is None or len(fwFileName) == 0:
-            msg = "Please select a SmartDrive Bluetooth FW file!"
-            self.invalidFirmware.emit(msg)
-            return
-        self.fwFileName = fwFileName
+        self.core.selectFirmware(fwFileName)
 
-    def processError(self, error):
-        global exePath
-        self.failed.emit('Could not execute ' + exePath + ' - ' + processErrorToString(error))
-        if error == 0:
-            fname, _ = QFileDialog.getOpenFileName(
-                None,
-                'Select SmartDrive BLE Update CLI Executable',
-                'C:\Bluegiga\BleUpdate',
-                'bleupdate-cli.exe (bleupdate-cli.exe)',
-                options=QFileDialog.Options()
-            )
-            if fname is not None and len(fname) > 0:
-                exePath = fname
+    def arguments(self, *args):
+        return self.core.arguments(*args)
+
+    def run(self, command):
+        '''Starts the bleupdate-cli command in a QProcess.'''
+        args = self.core.begin(command)
+        if args is None:
+            return
+        process = QProcess()
+        process.errorOccurred.connect(self.core.processError)
+        process.readyReadStandardOutput.connect(
+            lambda: self.core.feed(process.readAllStandardOutput()))
+        process.readyReadStandardError.connect(
+            lambda: self.core.feed(process.readAllStandardError(), 'stderr'))
+        process.finished.connect(self.onFinished)
+        self.stopSignal.connect(process.kill)
+        self.process = process
+        process.start(exePath(), args)
+
+    def onFinished(self, code, status):
+        self.process = None
+        self.core.exited(code, status)
 
     @pyqtSlot()
     def start(self):
         '''Determines if there is a valid cc-debugger attached to the system'''
-        self.firmwarePercent = 0
-        self.status.emit(0, '')
-        self.resetDeviceInfo()
-
-        # BleUpdate process
-        self.isProgramming = True
-        self.listOutput = ''
-        self.listProcess = QProcess()
-        self.listProcess.errorOccurred.connect(self.processError)
-        self.listProcess.readyReadStandardOutput.connect(self.onListDataReady)
-        self.listProcess.readyReadStandardError.connect(self.onListErrorReady)
-        self.listProcess.finished.connect(self.onListFinished)
-        self.stopSignal.connect(self.listProcess.kill)
-
-        program = resource.path(exePath)
-        args = [
-            "list"
-        ]
-        self.listProcess.start(program, args)
-
-    def onListDataReady(self):
-        data = str(self.listProcess.readAllStandardOutput(), 'utf-8')
-        self.listOutput += data
-        found, state = self.parseListOutput()
-        self.status.emit(0, state)
-
-    def onListErrorReady(self):
-        data = str(self.listProcess.readAllStandardError(), 'utf-8')
-        print("STDERR:",data)
-        self.listOutput += data
-        found, state = self.parseListOutput()
-        self.status.emit(0, state)
-
-    def onListFinished(self, code, status):
-        found, state = self.parseListOutput()
-        if code == 0 and found:
-            self.status.emit(0, 'Found CC-Debugger')
-            self.listFinished.emit()
-        elif self.isProgramming:
-            self.status.emit(0, 'Could not find CC-Debugger, check to make sure it is plugged in and drivers are installed.')
-            self.failed.emit("Could not find CC-Debugger.")
-        else:
-            self.listStatus.emit(0, 'Stopped.')
-            self.listFinished.emit()
-        self.listProcess = None
-
-    def parseListOutput(self):
-        data = self.listOutput
-        # TODO: regex here to determine status and percent
-        m = re.search(r'CC Debugger', self.listOutput, re.M)
-        if m is not None:
-            return True, 'Found CC-Debugger'
-        else:
-            return False, 'No CC-Debugger Found'
-
-    def resetDeviceInfo(self):
-        # reset device info
-        self.serial = None
-        self.licenseKey = None
-        self.address = None
-        self.deviceInfo.emit(self.serial, self.licenseKey, self.address)
+        self.run('list')
 
     @pyqtSlot()
     def getDeviceInfo(self):
         '''Gets the MAC Address and License Key from the Device before proramming'''
-        self.resetDeviceInfo()
-
-        # BleUpdate process
-        self.isProgramming = True
-        self.getOutput = ''
-        self.getProcess = QProcess()
-        self.getProcess.errorOccurred.connect(self.processError)
-        self.getProcess.readyReadStandardOutput.connect(self.onGetDataReady)
-        self.getProcess.readyReadStandardError.connect(self.onGetErrorReady)
-        self.getProcess.finished.connect(self.onGetFinished)
-        self.stopSignal.connect(self.getProcess.kill)
-
-        program = resource.path(exePath)
-        args = [
-            "get"
-        ]
-        self.getProcess.start(program, args)
-
-    def onGetDataReady(self):
-        data = str(self.getProcess.readAllStandardOutput(), 'utf-8')
-        self.getOutput += data
-        gotData, state = self.parseGetOutput()
-        self.status.emit(0, state)
-
-    def onGetErrorReady(self):
-        data = str(self.getProcess.readAllStandardError(), 'utf-8')
-        print("STDERR:",data)
-        self.getOutput += data
-        gotData, state = self.parseGetOutput()
-        self.status.emit(0, state)
-
-    def onGetFinished(self, code, status):
-        gotData, state = self.parseGetOutput()
-        if code == 0 and gotData:
-            self.status.emit(0, 'Got Device Info')
-            self.getFinished.emit()
-        elif self.isProgramming:
-            self.status.emit(0, 'Could not get dvice info:\n' + state + '\nMake sure SmartDrive is on and the CC-Debugger light is GREEN')
-            self.failed.emit("Could not get device info")
-        else:
-            self.status.emit(0, 'Get stopped.')
-        self.getProcess = None
-
-    def parseGetOutput(self):
-        data = self.getOutput
-        # TODO: regex here to determine status and percent
-        if len(data) > 1:
-            error = re.search(r'error', self.getOutput, re.M)
-            if error is not None:
-                return False, self.getOutput
-            s = re.search(r'Serial number\s*:\s*([\d\w]+)', self.getOutput, re.M)
-            a = re.search(r'Address\s*:\s*([\d:\w]+)', self.getOutput, re.M)
-            l = re.search(r'License key\s*:\s*([\d\w]+)', self.getOutput, re.M)
-            if a is not None and l is not None and s is not None:
-                self.serial = s[1]
-                self.address = a[1]
-                self.licenseKey = l[1]
-                self.deviceInfo.emit(self.serial, self.licenseKey, self.address)
-                return True, 'Got device info.'
-        return False, 'Could not get device info.'
+        self.run('get')
 
     @pyqtSlot()
     def programFirmware(self):
-        self.firmwarePercent = 0
-        self.status.emit(0, 'Programming SmartDrive Bluetooth')
-
-        # BleUpdate process
-        self.isProgramming = True
-        self.updateOutput = ''
-        self.firmwareProcess = QProcess()
-        self.firmwareProcess.errorOccurred.connect(self.processError)
-        self.firmwareProcess.readyReadStandardOutput.connect(self.onFirmwareDataReady)
-        self.firmwareProcess.readyReadStandardError.connect(self.onFirmwareErrorReady)
-        self.firmwareProcess.finished.connect(self.onFirmwareFinished)
-        self.stopSignal.connect(self.firmwareProcess.kill)
-
-        program = resource.path(exePath)
-        args = [
-            "update",
-            resource.path(self.fwFileName),
-        ]
-        self.firmwareProcess.start(program, args)
-
-    def onFirmwareDataReady(self):
-        data = str(self.firmwareProcess.readAllStandardOutput(), 'utf-8')
-        self.updateOutput = data
-        percent, state = self.parseUpdateOutput()
-        self.status.emit(percent, state)
-
-    def onFirmwareErrorReady(self):
-        data = str(self.firmwareProcess.readAllStandardError(), 'utf-8')
-        print("STDERR:",data)
-        self.updateOutput += data
-        percent, state = self.parseUpdateOutput()
-        self.status.emit(percent, state)
-
-    def onFirmwareFinished(self, code, status):
-        if code == 0:
-            self.status.emit(100, 'SmartDrive Bluetooth complete')
-            self.firmwareFinished.emit()
-        elif self.isProgramming:
-            self.status.emit(0, 'SmartDrive Bluetooth failed.')
-            self.failed.emit("SmartDrive Bluetooth failed: {}: {}".format(code, status))
-        else:
-            self.status.emit(0, 'Stopped.')
-            self.firmwareFinished.emit()
-        self.firmwareProcess = None
-        self.isProgramming = False
-
-    def parseUpdateOutput(self):
-        data = self.updateOutput
-        # TODO: regex here to determine status and percent
-        m = re.search(r'([\d]+)', self.updateOutput, re.M)
-        if m is not None:
-            percent = int(m.group(1))
-        else:
-            percent = 0
-        status = "Writing SmartDrive Bluetooth Firmware."
-        return percent, status
+        self.run('update')
 
     @pyqtSlot()
     def stop(self):
-        self.resetDeviceInfo()
+        self.core.stop()
+        self.stopSignal.emit()
 
-        self.isProgramming = False
+class BluetoothStation(QObject):
+    '''Programs SmartDrive Bluetooth on every attached CC-Debugger at once.
+
+    Each debugger is bound to its own SmartDriveBluetooth, which runs its
+    own get / update processes, so a failure on one debugger does not
+    affect the others.  Signals carry the debugger's device selector.
+
+    Selecting a debugger relies on bleupdate-cli's deviceOption and on
+    its list format, which are only known from the stand-in in fakes/.
+    With one debugger, or when the list can't be read, the station
+    programs the debugger bleupdate-cli picks without selecting one,
+    shown as defaultDebugger.'''
+    debuggersFound = pyqtSignal(list)
+    status = pyqtSignal(str, int, str)
+    deviceInfo = pyqtSignal(str, str, str, str)
+    firmwareFinished = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+    # device selector -> None on success, or the error message
+    finished = pyqtSignal(dict)
+    stopSignal = pyqtSignal()
+
+    def __init__(self, fwFileName=None):
+        super().__init__()
+        self.fwFileName = fwFileName
+        self.units = {}
+        self.results = {}
+        self.listProcess = None
+        # start() begins a new run; signals of an earlier run's stopped
+        # processes and units are ignored
+        self.runId = 0
+        self.stoppedUnits = []
+
+    @pyqtSlot(str)
+    def onFirmwareFileSelected(self, fwFileName):
+        self.fwFileName = fwFileName
+
+    @pyqtSlot()
+    def start(self):
+        '''Lists the attached CC-Debuggers and programs all of them.'''
+        self.stop()
+        self.runId += 1
+        run = self.runId
+        # kept until they have exited
+        self.stoppedUnits = list(self.units.values())
+        self.units = {}
+        self.results = {}
+        self.listOutput = capture.OutputCapture('bleupdate-list')
+        self.listParser = bleupdate.OutputParser('list')
+        self.listProcess = QProcess()
+        self.listProcess.setProcessChannelMode(QProcess.MergedChannels)
+        self.listProcess.readyReadStandardOutput.connect(lambda: self.onListDataReady(run))
+        self.listProcess.finished.connect(lambda code, status: self.onListFinished(run, code, status))
+        self.listProcess.errorOccurred.connect(lambda error: self.onListError(run, error))
+        self.stopSignal.connect(self.listProcess.kill)
+        self.listProcess.start(exePath(), ["list"])
+
+    def onListDataReady(self, run):
+        if run == self.runId:
+            self.listParser.feed(self.listOutput.feed(self.listProcess.readAllStandardOutput()))
+
+    def onListError(self, run, error):
+        if run == self.runId:
+            self.failed.emit('', notFoundMessage(error))
+
+    def onListFinished(self, run, code, status):
+        if run != self.runId:
+            return
+        self.listProcess = None
+        self.listParser.feed(self.listOutput.finish())
+        self.listParser.finish()
+        devices = self.listParser.devices
+        if code != 0 or len(devices) <= 1:
+            # one debugger needs no selecting, and the list may not be in
+            # the form parseDebuggers() knows: program whichever debugger
+            # bleupdate-cli picks, as with a single SmartDriveBluetooth
+            if code != 0 or not devices:
+                print("[BLE] couldn't list the CC-Debuggers ({}), programming the default one".format(
+                    self.listOutput.saveOnFailure('bleupdate-cli list exited with {}'.format(code))
+                    if code != 0 else 'none recognized'))
+            self.listOutput.close()
+            self.debuggersFound.emit([defaultDebugger])
+            self.startUnit(defaultDebugger, None)
+            return
+        self.listOutput.close()
+        self.debuggersFound.emit(devices)
+        for device in devices:
+            self.startUnit(device)
+
+    def startUnit(self, device, selector=None):
+        '''Programs the debugger shown as device, selected with
+        bleupdate-cli's device option unless selector is None.'''
+        if selector is None and device != defaultDebugger:
+            selector = device
+        unit = SmartDriveBluetooth(self.fwFileName, device=selector)
+        run = self.runId
+        unit.status.connect(lambda p, s, d=device: self.onUnitStatus(run, d, p, s))
+        unit.deviceInfo.connect(
+            lambda sn, lk, addr, d=device: self.onUnitDeviceInfo(run, d, sn, lk, addr))
+        unit.firmwareFinished.connect(lambda d=device: self.onUnitFinished(run, d, None))
+        unit.failed.connect(lambda msg, d=device: self.onUnitFinished(run, d, msg))
+        self.units[device] = unit
+        # the debugger is already known, so skip straight to 'get'
+        unit.getDeviceInfo()
+
+    def onUnitStatus(self, run, device, percent, status):
+        if run == self.runId:
+            self.status.emit(device, percent, status)
+
+    def onUnitDeviceInfo(self, run, device, serialNumber, licenseKey, address):
+        if run == self.runId:
+            self.deviceInfo.emit(device, serialNumber or '', licenseKey or '', address or '')
+
+    def onUnitFinished(self, run, device, error):
+        if run != self.runId or device in self.results:
+            return
+        self.results[device] = error
+        if error is None:
+            self.firmwareFinished.emit(device)
+        else:
+            self.failed.emit(device, error)
+        if len(self.results) == len(self.units):
+            self.finished.emit(dict(self.results))
+
+    @pyqtSlot()
+    def stop(self):
         self.stopSignal.emit()
+        for unit in self.units.values():
+            unit.stop()
@@ -0,0 +1,260 @@
+'''SmartDrive Bluetooth programming without Qt.
+
+SmartDriveBluetoothCore runs the bleupdate-cli commands for one
+CC-Debugger: 'list' finds the debugger, 'get' reads the unit's serial
+number, license key and address, and 'update' programs the firmware.
+For each command, begin() returns the arguments, the output is given to
+feed() as it is read and exited() takes the exit code; the core parses
+the output and reports through events named like the signals of
+smartdrivebluetooth.SmartDriveBluetooth, the Qt adapter that runs the
+commands with QProcess:
+
+    invalidFirmware(message)   status(percent, status)
+    deviceInfo(serial, licenseKey, address)
+    listFinished()   getFinished()   firmwareFinished()   failed(message)
+
+program() runs all three with subprocess and waits for them, e.g. in a
+multiprocessing worker.
+'''
+import subprocess
+
+import bleupdate
+import capture
+import manifest
+import resource
+import tools
+from events import Events
+
+def exePath():
+    '''Path of bleupdate-cli, see tools.'''
+    return tools.path('bleupdate-cli')
+
+def notFoundMessage(error):
+    msg = 'Could not execute ' + exePath() + ' - ' + tools.processErrorToString(error)
+    if error == 0:
+        msg += '\nLocate it with Locate bleupdate-cli (File menu, or the dashboard toolbar), or set $SD_BLEUPDATE_CLI.'
+    return msg
+
+# bleupdate-cli option selecting which CC-Debugger a command runs on.
+# Unverified: only the stand-in fakes/bleupdate-cli is known to take it,
+# so it is only passed when there are several debuggers to choose from
+deviceOption = '-d'
+
+commands = ('list', 'get', 'update')
+
+class SmartDriveBluetoothCore:
+    eventNames = (
+        'invalidFirmware', 'status', 'deviceInfo',
+        'listFinished', 'getFinished', 'firmwareFinished', 'failed',
+    )
+
+    def __init__(self, fwFileName=None, device=None):
+        self.events = Events(*self.eventNames)
+        self.device = device
+        self.devices = []
+        self.isProgramming = False
+        self.fwFileName = None
+        self.serial = None
+        self.licenseKey = None
+        self.address = None
+
+        if fwFileName is not None:
+            self.selectFirmware(fwFileName)
+
+        self.firmwarePercent = 0
+        self.firmwareState = ''
+
+        # the running command, its output and parser
+        self.command = None
+        self.output = None
+        self.parser = None
+        # the subprocess run by run()
+        self.process = None
+
+    def selectFirmware(self, fwFileName):
+        self.fw = None
+        self.fwFileName = None
+        if fwFileName is None or len(fwFileName) == 0:
+            msg = "Please select a SmartDrive Bluetooth FW file!"
+            self.events.emit('invalidFirmware', msg)
+            return
+        try:
+            manifest.verify(resource.path(fwFileName), 'ble')
+        except (OSError, ValueError) as error:
+            msg = "Invalid SmartDrive Bluetooth FW file '{}'!\n{}".format(fwFileName, error)
+            self.events.emit('invalidFirmware', msg)
+            return
+        self.fwFileName = fwFileName
+
+    def arguments(self, *args):
+        '''Command line for bleupdate-cli, selecting our CC-Debugger.'''
+        if self.device is None:
+            return list(args)
+        return [deviceOption, self.device] + list(args)
+
+    def resetDeviceInfo(self):
+        self.serial = None
+        self.licenseKey = None
+        self.address = None
+        self.events.emit('deviceInfo', self.serial, self.licenseKey, self.address)
+
+    def begin(self, command):
+        '''Gets ready to run command, returns its bleupdate-cli arguments or
+        None if it can't run.'''
+        if command == 'list':
+            # determines if there is a valid cc-debugger attached to the system
+            self.firmwarePercent = 0
+            self.events.emit('status', 0, '')
+            self.resetDeviceInfo()
+            args = self.arguments('list')
+        elif command == 'get':
+            # gets the MAC Address and License Key from the Device before programming
+            self.resetDeviceInfo()
+            args = self.arguments('get')
+        else:
+            self.firmwarePercent = 0
+            if self.fwFileName is None:
+                self.events.emit('failed', "Please select a SmartDrive Bluetooth FW file!")
+                return None
+            # free unless the file changed since it was selected
+            try:
+                manifest.verify(resource.path(self.fwFileName), 'ble')
+            except (OSError, ValueError) as error:
+                self.events.emit('failed', "Invalid SmartDrive Bluetooth FW file: {}".format(error))
+                return None
+            self.events.emit('status', 0, 'Programming SmartDrive Bluetooth')
+            args = self.arguments('update', resource.path(self.fwFileName))
+        self.isProgramming = True
+        self.command = command
+        self.output = capture.OutputCapture('bleupdate-' + command, self.device)
+        self.parser = bleupdate.OutputParser(command)
+        return args
+
+    def processError(self, error):
+        self.events.emit('failed', notFoundMessage(error))
+
+    def feed(self, data, channel='stdout'):
+        '''Parses output of the running command.'''
+        text = self.output.feed(data, channel)
+        if channel == 'stderr':
+            print("STDERR:", text)
+        events = self.parser.feed(text)
+        if self.command == 'list':
+            found, state = self.parseListOutput()
+            self.events.emit('status', 0, state)
+        elif self.command == 'get':
+            gotData, state = self.parseGetOutput(events)
+            self.events.emit('status', 0, state)
+        else:
+            percent, state = self.parseUpdateOutput(events)
+            self.events.emit('status', percent, state)
+
+    def exited(self, code, status=0):
+        '''Finishes the running command once bleupdate-cli has exited.
+        Returns true if it succeeded.'''
+        command, output, parser = self.command, self.output, self.parser
+        self.command = None
+        text = output.finish()
+        ok = False
+        if command == 'list':
+            parser.feed(text)
+            parser.finish()
+            found, state = self.parseListOutput()
+            if code == 0 and found:
+                self.events.emit('status', 0, 'Found CC-Debugger')
+                ok = True
+            elif self.isProgramming:
+                self.events.emit('status', 0, 'Could not find CC-Debugger, check to make sure it is plugged in and drivers are installed.')
+                self.events.emit('failed', output.saveOnFailure("Could not find CC-Debugger."))
+            else:
+                self.events.emit('status', 0, 'Stopped.')
+        elif command == 'get':
+            self.parseGetOutput(parser.feed(text))
+            gotData, state = self.parseGetOutput(parser.finish())
+            if code == 0 and gotData:
+                self.events.emit('status', 0, 'Got Device Info')
+                ok = True
+            elif self.isProgramming:
+                self.events.emit('status', 0, 'Could not get dvice info:\n' + state + '\nMake sure SmartDrive is on and the CC-Debugger light is GREEN')
+                self.events.emit('failed', output.saveOnFailure("Could not get device info"))
+            else:
+                self.events.emit('status', 0, 'Get stopped.')
+        else:
+            self.parseUpdateOutput(parser.feed(text))
+            if code == 0:
+                self.events.emit('status', 100, 'SmartDrive Bluetooth complete')
+                ok = True
+            elif self.isProgramming:
+                self.events.emit('status', 0, 'SmartDrive Bluetooth failed.')
+                self.events.emit('failed', output.saveOnFailure(
+                    "SmartDrive Bluetooth failed: {}: {}".format(code, status)))
+            else:
+                self.events.emit('status', 0, 'Stopped.')
+                self.events.emit('firmwareFinished')
+            self.isProgramming = False
+        output.close()
+        if ok:
+            self.events.emit({'list': 'listFinished', 'get': 'getFinished',
+                              'update': 'firmwareFinished'}[command])
+        return ok
+
+    def parseListOutput(self):
+        self.devices = self.parser.devices
+        if len(self.devices) > 0:
+            return True, 'Found {} CC-Debugger(s)'.format(len(self.devices))
+        else:
+            return False, 'No CC-Debugger Found'
+
+    def parseGetOutput(self, events):
+        for event in events:
+            if isinstance(event, bleupdate.DeviceInfo):
+                self.serial, self.licenseKey, self.address = event
+                self.events.emit('deviceInfo', self.serial, self.licenseKey, self.address)
+        if len(self.parser.errors) > 0:
+            return False, '\n'.join(self.parser.errors)
+        if self.parser.deviceInfo is not None:
+            return True, 'Got device info.'
+        return False, 'Could not get device info.'
+
+    def parseUpdateOutput(self, events):
+        for event in events:
+            if isinstance(event, bleupdate.Error):
+                return self.firmwarePercent, event.message
+        self.firmwarePercent = self.parser.percent
+        status = self.parser.phase or "Writing SmartDrive Bluetooth Firmware."
+        return self.firmwarePercent, status
+
+    def stop(self):
+        self.resetDeviceInfo()
+        self.isProgramming = False
+        process = self.process
+        if process is not None:
+            process.kill()
+
+    def run(self, command):
+        '''Runs command with subprocess and waits for it. Returns true if
+        it succeeded.'''
+        args = self.begin(command)
+        if args is None:
+            return False
+        try:
+            self.process = subprocess.Popen([exePath()] + args,
+                                            stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT)
+        except OSError:
+            self.command = None
+            self.output.close()
+            self.processError(0)
+            return False
+        with self.process as process:
+            for data in iter(lambda: process.stdout.read1(4096), b''):
+                self.feed(data)
+            code = process.wait()
+        self.process = None
+        return self.exited(code)
+
+    def program(self):
+        '''Finds the debugger, reads the device info and programs the
+        firmware. Returns true if all of them succeeded.'''
+        return all(self.run(command) for command in commands)
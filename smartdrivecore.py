@@ -0,0 +1,347 @@
+'''SmartDrive MX2+ programming without Qt.
+
+SmartDriveCore holds everything about programming the SmartDrive on one
+port: the port session, the selected OTA image and its frames, the
+bootloader and firmware stages and their timings.  It reports through
+events named like the signals of smartdrive.SmartDrive, which is the Qt
+adapter around it:
+
+    invalidFirmware(message)
+    bootloaderStatus(percent, status)   bootloaderFinished()   bootloaderFailed(message)
+    firmwareStatus(percent, status)     firmwareFinished()     firmwareFailed(message)
+
+The stages run to completion in the calling thread; stop() ends them
+from another one.  Nothing here imports Qt, so a core can run in a
+multiprocessing worker:
+
+    core = SmartDriveCore('/dev/ttyUSB0', 'firmwares/MX2+.15.ota')
+    core.events.connect('firmwareStatus', print)
+    core.programBootloader() and core.programFirmware()
+'''
+import os
+import time
+
+import lpc21isp
+import manifest
+import ota
+import portsession
+import serialtrace
+from events import Events
+
+class SmartDriveCore:
+    eventNames = (
+        'invalidFirmware',
+        'bootloaderStatus', 'bootloaderFinished', 'bootloaderFailed',
+        'firmwareStatus', 'firmwareFinished', 'firmwareFailed',
+    )
+
+    def __init__(self, port, fwFileName=None, transmitDelay=0.001, traceDir=None,
+                 bootloaderPreset='default'):
+        self.events = Events(*self.eventNames)
+        self.transmitDelay = transmitDelay
+        # serial traces are kept in memory and saved to traceDir on failure
+        self.traceDir = traceDir or os.environ.get('SD_TRACE_DIR')
+        self.tracer = serialtrace.Recorder() if self.traceDir else None
+        self.portName = port
+        # keeps the port open between stages, see portsession
+        self.session = portsession.PortSession(port)
+        self.isProgramming = False
+        self.fw = None
+        self.fwFileName = None
+        self.image = None
+        self.version = 'unknown'
+        self.crc = 'unknown'
+        self.fwCheckSum = 0
+
+        if fwFileName is not None:
+            self.selectFirmware(fwFileName)
+
+        self.bootloaderPercent = 0
+        self.bootloaderState = ''
+        self.bootloaderPreset = bootloaderPreset
+        self.bootloaderResult = None
+        self.bootloaderBegin = None
+        self.firmwarePercent = 0
+        self.firmwareState = ''
+        self.readyTime = None
+        self.transferTime = None
+        self.transferBytes = 0
+        # OTA frames and port check prepared for the next unit
+        self.frames = None
+        self.portPrepared = False
+        self.lastFinished = None
+        # seconds from a stage's start to lpc21isp running / the handshake
+        self.bootloaderSetupTime = None
+        self.firmwareSetupTime = None
+
+    def selectPort(self, portName):
+        if portName != self.portName:
+            self.session.release()
+            self.session = portsession.PortSession(portName)
+            self.portPrepared = False
+        self.portName = portName
+
+    def releasePort(self):
+        '''Closes the port if the session holds it open.'''
+        self.session.release()
+
+    def selectFirmware(self, fwFileName):
+        self.fw = None
+        self.image = None
+        self.version = 'unknown'
+        self.crc = 'unknown'
+        self.fwCheckSum = 0
+        self.fwFileName = fwFileName
+        if fwFileName is None or len(fwFileName) == 0:
+            msg = "Please select a MX2+ OTA file!"
+            self.events.emit('invalidFirmware', msg)
+            return
+
+        # check the image against the manifest and read the header; the
+        # image itself is streamed while programming
+        try:
+            image = manifest.verify(self.fwFileName, 'ota')
+            fw = ota.FirmwareFile(self.fwFileName)
+        except ValueError as error:
+            msg = "Invalid OTA file '{}'!\n{}\nPlease select a valid MX2+ OTA file!".format(
+                self.fwFileName, error
+            )
+            self.events.emit('invalidFirmware', msg)
+        except Exception as error:
+            msg = "Couldn't open firmware file '{}'!\n{}".format(self.fwFileName, error)
+            self.events.emit('invalidFirmware', msg)
+        else:
+            self.fw = fw
+            self.image = image
+            self.frames = None
+            self.version = fw.version
+            self.fwCheckSum = fw.checksum
+            self.crc = ''.join('{:02x}'.format(x) for x in self.fwCheckSum)
+
+    def checkPort(self, baudrate=lpc21isp.baudrate):
+        '''Returns true if we have a valid port, false otherwise. The port
+        is left open at baudrate in the session.'''
+        return self.session.check(baudrate)
+
+    def checkFirmware(self):
+        '''Verifies the selected image again before it is sent, which is
+        free unless the file changed. Returns None or the error.'''
+        if self.fw is None:
+            return None
+        try:
+            image = manifest.verify(self.fwFileName, 'ota')
+        except (OSError, ValueError) as error:
+            return error
+        if image.sha256 != self.image.sha256:
+            # the file was replaced, reload it
+            self.selectFirmware(self.fwFileName)
+        return None
+
+    def prepare(self):
+        '''Gets ready for the next unit while the current one reboots: frames
+        the OTA image and checks the port at the lpc21isp baudrate. Left to
+        the caller, as a station programs another unit on the port but a
+        headless worker doesn't.'''
+        begin = time.monotonic()
+        if self.fw is not None and self.frames is None:
+            self.frames = ota.FrameStream(self.fw)
+        self.portPrepared = self.checkPort()[0]
+        print("[SMARTDRIVE] {}: next unit prepared in {:.3f} s".format(
+            self.portName, time.monotonic() - begin))
+
+    def isRunning(self):
+        return self.isProgramming
+
+    def stop(self):
+        self.isProgramming = False
+
+    # bootloader
+
+    def beginBootloader(self):
+        '''Checks the port and the bootloader image and frees the port for
+        lpc21isp. Returns true if lpc21isp can be started.'''
+        self.bootloaderBegin = time.monotonic()
+        if self.lastFinished is not None:
+            print("[SMARTDRIVE] {}: unit changeover {:.3f} s".format(
+                self.portName, self.bootloaderBegin - self.lastFinished))
+            self.lastFinished = None
+        # the port was already checked by prepare()
+        if not self.portPrepared:
+            goodPort, portErr = self.checkPort()
+            if not goodPort:
+                self.events.emit('bootloaderFailed',
+                                 "Couldn't open serial port: {}".format(portErr))
+                return False
+        self.portPrepared = False
+
+        try:
+            manifest.verify(lpc21isp.bootloaderImage(), 'bootloader')
+        except (OSError, ValueError) as error:
+            self.events.emit('bootloaderFailed', "Invalid bootloader image: {}".format(error))
+            return False
+
+        # close the port so lpc21isp can use it
+        self.session.release()
+
+        self.isProgramming = True
+        self.bootloaderPercent = 0
+        self.bootloaderState = ''
+        self.bootloaderResult = None
+        self.events.emit('bootloaderStatus', 0, '')
+        return True
+
+    def onBootloaderStarted(self):
+        self.bootloaderSetupTime = time.monotonic() - self.bootloaderBegin
+
+    def onBootloaderStatus(self, percent, state):
+        self.bootloaderPercent = int(percent)
+        self.bootloaderState = state
+        self.events.emit('bootloaderStatus', self.bootloaderPercent, state)
+
+    def onBootloaderResult(self, result):
+        '''Takes the lpc21isp.Result of the run started by beginBootloader().'''
+        self.bootloaderResult = result
+        self.isProgramming = False
+        if result.ok:
+            self.events.emit('bootloaderFinished')
+        elif not result.stopped:
+            self.events.emit('bootloaderFailed', result.error)
+
+    def programBootloader(self, timeout=lpc21isp.timeout):
+        '''Runs lpc21isp on the port and waits for it. Returns true if the
+        bootloader was programmed.'''
+        if not self.beginBootloader():
+            return False
+        self.onBootloaderStarted()
+        result = lpc21isp.run(self.portName, self.bootloaderPreset,
+                              progress=self.onBootloaderStatus,
+                              isRunning=self.isRunning, timeout=timeout)
+        if result.ok:
+            self.onBootloaderStatus(100, 'Bootloader complete')
+        elif result.stopped:
+            self.onBootloaderStatus(0, 'Bootloader stopped.')
+        else:
+            self.onBootloaderStatus(0, 'Bootloader failed.')
+        self.onBootloaderResult(result)
+        return result.ok
+
+    # firmware
+
+    def saveTrace(self, fileName=None):
+        '''Saves the serial trace of the last firmware transfer, returns
+        the file name or None if tracing is off.'''
+        if self.tracer is None:
+            return None
+        if fileName is None:
+            os.makedirs(self.traceDir, exist_ok=True)
+            fileName = serialtrace.traceFileName(self.traceDir, self.portName)
+        return self.tracer.dump(fileName)
+
+    def onFirmwareProgress(self, percent):
+        # ota gives a float; the signal of the Qt adapter takes an int
+        self.firmwarePercent = int(percent)
+        self.events.emit('firmwareStatus', self.firmwarePercent, 'Sending MX2+ Firmware')
+
+    def programFirmware(self):
+        '''Sends the OTA image once the bootloader is ready. Returns true if
+        the firmware was sent.'''
+        begin = time.monotonic()
+        self.portPrepared = False
+        goodPort, portErr = self.checkPort(ota.baudrate)
+        if not goodPort:
+            self.events.emit('firmwareFailed', "Couldn't open serial port {}".format(portErr))
+            return False
+
+        error = self.checkFirmware()
+        if error is not None:
+            self.events.emit('firmwareFailed', "Invalid MX2+ firmware file: {}".format(error))
+            return False
+
+        if self.fw is None or len(self.fw) <= 0:
+            self.events.emit('firmwareFailed', "Please select MX2+ firmware file!")
+            return False
+
+        # init variables
+        self.isProgramming = True
+        self.firmwarePercent = 0
+        self.firmwareState = ''
+        self.events.emit('firmwareStatus', 0, '')
+
+        if self.frames is None:
+            self.frames = ota.FrameStream(self.fw)
+
+        # the port stays open in the session after the transfer
+        port = self.session.port
+        if self.tracer is not None:
+            self.tracer.clear()
+            port = serialtrace.TracedPort(port, self.tracer, self.portName)
+
+        # the serial trace is saved whenever the transfer doesn't complete:
+        # on a timeout, a serial error, a stop or any other exception
+        error = False
+        traceFile = None
+        self.firmwareSetupTime = time.monotonic() - begin
+        try:
+            error = self.transferFirmware(port)
+        except OSError as e:
+            error = "Serial port error while sending the firmware: {}".format(e)
+        finally:
+            if error is not None:
+                self.isProgramming = False
+                traceFile = self.saveTrace()
+        if error is not None:
+            if traceFile is not None:
+                note = "Serial trace saved to {}".format(traceFile)
+                if error:
+                    error += "\n" + note
+                else:
+                    print("[SMARTDRIVE] {}: {}".format(self.portName, note))
+            if error:
+                self.events.emit('firmwareFailed', error)
+            return False
+
+        # let everyone know we're finished
+        self.isProgramming = False
+        self.events.emit('firmwareFinished')
+        print("[SMARTDRIVE] {}: bootloader setup {:.3f} s, firmware setup {:.3f} s".format(
+            self.portName, self.bootloaderSetupTime or 0, self.firmwareSetupTime))
+
+        self.lastFinished = time.monotonic()
+        return True
+
+    def transferFirmware(self, port):
+        '''Waits for the bootloader, sends the frames and the stop packet.
+        Returns None once the image was sent, False if it was stopped or
+        the error message.'''
+        # wait for ready
+        self.events.emit('firmwareStatus', 0, 'Waiting for Bootloader Ready')
+        self.readyTime = ota.waitForReady(port, self.isRunning)
+
+        if not self.isProgramming:
+            return False
+
+        if self.readyTime is None:
+            return ("Timed out after {} s waiting for the bootloader.\n"
+                    "Check the DIP switches and power-cycle the SmartDrive.".format(
+                        ota.readyTimeout))
+
+        print("[SMARTDRIVE] {}: bootloader ready after {:.3f} s".format(
+            self.portName, self.readyTime))
+        self.events.emit('firmwareStatus', 0, 'Bootloader Ready ({:.2f} s)'.format(self.readyTime))
+
+        # send firmware data
+        begin = time.monotonic()
+        ota.sendFirmware(port, self.frames, self.isRunning,
+                         progress=self.onFirmwareProgress,
+                         transmitDelay=self.transmitDelay,
+                         writeSize=self.session.writeSize)
+        self.transferTime = time.monotonic() - begin
+        self.transferBytes = len(self.fw)
+
+        if not self.isProgramming:
+            return False
+
+        # send stop
+        self.events.emit('firmwareStatus', 100, 'Rebooting MX2+')
+        ota.sendStop(port)
+        return None
@@ -0,0 +1,19 @@
+'''pytest entry point of regression.py: one test per hot path.
+
+    python -m pytest test_regression.py
+'''
+import pytest
+
+import regression
+
+@pytest.fixture(scope='module')
+def baselines():
+    return regression.loadBaselines()
+
+@pytest.mark.parametrize('name', list(regression.cases))
+def test_hot_path(name, baselines):
+    calibrate, times, results = regression.check([name], baselines)
+    name, seconds, ratio, failed = results[0]
+    if ratio is None:
+        pytest.skip('no baseline for {}, run regression.py --save'.format(name))
+    assert not failed, '{} is {:.2f}x its baseline'.format(name, ratio)
@@ -0,0 +1,238 @@
+#!/usr/bin/python
+'''End-to-end throughput benchmark for a programming line.
+
+Runs the full SmartDrive (bootloader + MX2+ firmware) and
+SmartDriveBluetooth pipeline, exactly as the UI wires it up, against
+simulated MX2+ devices and the stand-in tools in fakes/.  Each virtual
+station programs its units one after the other; all stations run at
+once.  Per-stage latency percentiles, CPU use and units/hour are
+printed and written as JSON so results can be compared between
+releases:
+
+    python ./throughput.py --stations 4 --units 10 --speed 0.1
+'''
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+from PyQt5.QtCore import QCoreApplication, QObject, QThread, QTimer, pyqtSignal
+
+from simulator import SimulatedPort
+
+fakes = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakes')
+stageNames = ('bootloader', 'firmware', 'bluetooth', 'unit', 'bootloaderSetup', 'firmwareSetup')
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None,
+    }
+
+class Station(QObject):
+    '''One virtual station: a SmartDrive and a SmartDriveBluetooth on their
+    own threads, driven through the same signals the UI uses.'''
+    startBootloader = pyqtSignal()
+    startFirmware = pyqtSignal()
+    startBluetooth = pyqtSignal()
+    finished = pyqtSignal()
+
+    def __init__(self, index, args):
+        # imported here so the tool paths are set up first
+        from smartdrive import SmartDrive
+        from smartdrivebluetooth import SmartDriveBluetooth
+
+        super().__init__()
+        self.args = args
+        self.deviceName = 'station{}'.format(index)
+        portName = 'sim://{}?boot={}'.format(self.deviceName, args.boot)
+        self.units = []
+        self.unit = None
+        self.remaining = args.units
+
+        self.sdthread = QThread()
+        self.smartDrive = SmartDrive(portName, args.firmware, transmitDelay=args.transmit_delay)
+        self.smartDrive.moveToThread(self.sdthread)
+        self.sdbtthread = QThread()
+        self.bluetooth = SmartDriveBluetooth(args.ble_firmware, device='FAKE{}'.format(index))
+        self.bluetooth.moveToThread(self.sdbtthread)
+
+        self.startBootloader.connect(self.smartDrive.programBootloader)
+        self.startFirmware.connect(self.smartDrive.programFirmware)
+        self.startBluetooth.connect(self.bluetooth.start)
+        self.smartDrive.bootloaderFinished.connect(self.onBootloaderFinished)
+        self.smartDrive.bootloaderFailed.connect(self.onFailed)
+        self.smartDrive.firmwareFinished.connect(self.onFirmwareFinished)
+        self.smartDrive.firmwareFailed.connect(self.onFailed)
+        self.bluetooth.firmwareFinished.connect(self.onBluetoothFinished)
+        self.bluetooth.failed.connect(self.onFailed)
+
+        self.sdthread.start()
+        self.sdbtthread.start()
+
+    def quit(self):
+        for thread in (self.sdthread, self.sdbtthread):
+            thread.quit()
+            thread.wait()
+
+    def nextUnit(self):
+        if self.remaining <= 0:
+            self.unit = None
+            self.finished.emit()
+            return
+        self.remaining -= 1
+        now = time.monotonic()
+        self.unit = {'station': self.deviceName, 'ok': False, 'error': None,
+                     'start': now, 'stageStart': now}
+        self.startBootloader.emit()
+
+    def endStage(self, stage):
+        now = time.monotonic()
+        self.unit[stage] = now - self.unit['stageStart']
+        self.unit['stageStart'] = now
+
+    def onBootloaderFinished(self):
+        self.endStage('bootloader')
+        self.unit['bootloaderSetup'] = self.smartDrive.bootloaderSetupTime
+        # the operator flips the DIP switches and power cycles the unit
+        SimulatedPort.powerCycle(self.deviceName)
+        self.startFirmware.emit()
+
+    def onFirmwareFinished(self):
+        self.endStage('firmware')
+        self.unit['firmwareSetup'] = self.smartDrive.firmwareSetupTime
+        self.startBluetooth.emit()
+
+    def onBluetoothFinished(self):
+        self.endStage('bluetooth')
+        self.unit['ok'] = True
+        self.endUnit()
+
+    def onFailed(self, error):
+        if self.unit is None or self.unit['error'] is not None:
+            return
+        self.unit['error'] = error
+        self.endUnit()
+
+    def endUnit(self):
+        unit = self.unit
+        unit['unit'] = time.monotonic() - unit.pop('start')
+        del unit['stageStart']
+        self.units.append(unit)
+        self.unit = None
+        # next unit after the changeover
+        QTimer.singleShot(int(self.args.changeover * 1000), self.nextUnit)
+
+def run(args):
+    os.environ.setdefault('SD_LPC21ISP', os.path.join(fakes, 'lpc21isp'))
+    os.environ.setdefault('SD_BLEUPDATE_CLI', os.path.join(fakes, 'bleupdate-cli'))
+    os.environ['FAKE_SPEED'] = str(args.speed)
+    os.environ['FAKE_DEBUGGERS'] = str(args.stations)
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    stations = [Station(i, args) for i in range(args.stations)]
+    running = set(range(len(stations)))
+
+    def onStationFinished(i):
+        running.discard(i)
+        if not running:
+            app.quit()
+
+    for i, station in enumerate(stations):
+        station.finished.connect(lambda i=i: onStationFinished(i))
+
+    cpuBefore = os.times()
+    begin = time.monotonic()
+    for station in stations:
+        QTimer.singleShot(0, station.nextUnit)
+    app.exec_()
+    wall = time.monotonic() - begin
+    cpuAfter = os.times()
+    for station in stations:
+        station.quit()
+
+    units = [u for station in stations for u in station.units]
+    ok = [u for u in units if u['ok']]
+    cpu = {
+        'user': cpuAfter[0] - cpuBefore[0],
+        'system': cpuAfter[1] - cpuBefore[1],
+        'childrenUser': cpuAfter[2] - cpuBefore[2],
+        'childrenSystem': cpuAfter[3] - cpuBefore[3],
+    }
+    return {
+        'config': {
+            'stations': args.stations,
+            'unitsPerStation': args.units,
+            'speed': args.speed,
+            'boot': args.boot,
+            'changeover': args.changeover,
+            'transmitDelay': args.transmit_delay,
+            'firmware': os.path.basename(args.firmware),
+            'bleFirmware': os.path.basename(args.ble_firmware),
+        },
+        'platform': {'python': platform.python_version(), 'system': platform.platform()},
+        'wall': wall,
+        'units': len(units),
+        'failed': len(units) - len(ok),
+        'errors': sorted(set(u['error'] for u in units if u['error'])),
+        'unitsPerHour': len(ok) / wall * 3600 if wall > 0 else 0,
+        'cpu': cpu,
+        'cpuUtilisation': (cpu['user'] + cpu['system']) / wall if wall > 0 else 0,
+        'stages': {stage: summarize([u[stage] for u in ok]) for stage in stageNames},
+    }
+
+def printResults(results):
+    c = results['config']
+    print('{} stations x {} units, tool speed {}, changeover {} s'.format(
+        c['stations'], c['unitsPerStation'], c['speed'], c['changeover']))
+    print('{:16s} {:>8s} {:>8s} {:>8s} {:>8s}'.format('stage', 'p50', 'p90', 'p99', 'max'))
+    for stage, s in results['stages'].items():
+        if s['count']:
+            print('{:16s} {:8.3f} {:8.3f} {:8.3f} {:8.3f}'.format(
+                stage, s['p50'], s['p90'], s['p99'], s['max']))
+    print('units: {} ok, {} failed in {:.1f} s'.format(
+        results['units'] - results['failed'], results['failed'], results['wall']))
+    for error in results['errors']:
+        print('  error: {}'.format(error.replace('\n', ' ')))
+    print('cpu: {:.0%} of one core in the programmer, {:.1f} s in tools'.format(
+        results['cpuUtilisation'],
+        results['cpu']['childrenUser'] + results['cpu']['childrenSystem']))
+    print('throughput: {:.0f} units/hour'.format(results['unitsPerHour']))
+
+def main():
+    parser = argparse.ArgumentParser(description='Programming line throughput benchmark')
+    parser.add_argument('--stations', type=int, default=1)
+    parser.add_argument('--units', type=int, default=3, help='units per station')
+    parser.add_argument('--speed', type=float, default=0.1,
+                        help='time scale of the stand-in tools, 1 is realtime')
+    parser.add_argument('--boot', type=float, default=0.5,
+                        help='seconds for a simulated MX2+ to boot after power on')
+    parser.add_argument('--changeover', type=float, default=0,
+                        help='seconds between units at a station')
+    parser.add_argument('--transmit-delay', type=float, default=0.001,
+                        help='delay between OTA packets')
+    parser.add_argument('--firmware', default='firmwares/MX2+.15.ota')
+    parser.add_argument('--ble-firmware', default='firmwares/SmartDriveBluetooth.1.6.fw')
+    parser.add_argument('--output', default='throughput.json',
+                        help='where to write the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args)
+    printResults(results)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    return 0 if results['failed'] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
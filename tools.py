@@ -0,0 +1,189 @@
+'''Discovery of the external programming tools, lpc21isp and bleupdate-cli.
+
+Each tool is looked for once, in order, in
+    its environment variable ($SD_LPC21ISP, $SD_BLEUPDATE_CLI),
+    the tools config file (~/.sdprogrammer/tools.json),
+    the bundled exes/ folder,
+    the PATH,
+    its default install location,
+and the first file found is cached.  discover() resolves all the tools
+and probes them concurrently by running each one and reading its
+version, so it is called once at startup; the stages only ever ask for
+the cached path and never wait for a search or a dialog.
+
+A missing tool is located from the UI with configure(), which saves the
+path to the config file.
+'''
+import collections
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+
+import resource
+
+Tool = collections.namedtuple('Tool', 'name path source version error')
+
+class ToolSpec:
+    def __init__(self, name, env, bundled, installed=None, probeArgs=()):
+        self.name = name
+        self.env = env
+        self.bundled = bundled
+        self.installed = installed
+        self.probeArgs = list(probeArgs)
+
+    def executable(self, path):
+        if sys.platform.startswith('win') and not path.lower().endswith('.exe'):
+            return path + '.exe'
+        return path
+
+specs = {
+    'lpc21isp': ToolSpec('lpc21isp', 'SD_LPC21ISP', 'exes/lpc21isp'),
+    'bleupdate-cli': ToolSpec(
+        'bleupdate-cli', 'SD_BLEUPDATE_CLI', 'exes/bleupdate-cli',
+        installed=lambda: os.environ.get('SYSTEMDRIVE', 'C:') + '/Bluegiga/BleUpdate/bleupdate-cli.exe'),
+}
+
+# how long a tool may take to print its version
+probeTimeout = 5.0
+
+versionPattern = re.compile(r'version\s*:?\s*v?(\d+(?:\.\d+)+)', re.I)
+
+def configFileName():
+    return os.path.join(os.path.expanduser('~'), '.sdprogrammer', 'tools.json')
+
+def readConfig():
+    try:
+        with open(configFileName()) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return config if isinstance(config, dict) else {}
+
+def candidates(spec, config):
+    '''(source, path) pairs where spec's tool may be, in order.'''
+    if os.environ.get(spec.env):
+        yield spec.env, os.environ[spec.env]
+    if config.get(spec.name):
+        yield 'config', config[spec.name]
+    yield 'bundled', spec.executable(resource.path(spec.bundled))
+    found = shutil.which(spec.name)
+    if found:
+        yield 'PATH', found
+    if spec.installed is not None:
+        yield 'installed', spec.installed()
+
+def locate(spec, config=None):
+    '''Returns the Tool found first for spec, not probed yet.'''
+    config = readConfig() if config is None else config
+    tried = []
+    for source, path in candidates(spec, config):
+        if os.path.isfile(path):
+            return Tool(spec.name, path, source, None, None)
+        tried.append(path)
+    # the environment variable is used even if it doesn't exist yet, as before
+    path = os.environ.get(spec.env) or tried[0]
+    return Tool(spec.name, path, None, None, '{} not found in {}'.format(spec.name, ', '.join(tried)))
+
+def probe(tool):
+    '''Runs the tool and returns it with its version or the error.'''
+    if tool.error is not None:
+        return tool
+    try:
+        result = subprocess.run([tool.path] + specs[tool.name].probeArgs,
+                                stdin=subprocess.DEVNULL,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT,
+                                timeout=probeTimeout)
+    except subprocess.TimeoutExpired:
+        return tool._replace(error='{} did not answer within {} s'.format(tool.path, probeTimeout))
+    except OSError as error:
+        return tool._replace(error="Couldn't run {}: {}".format(tool.path, error))
+    m = versionPattern.search(result.stdout.decode('utf-8', 'replace'))
+    return tool._replace(version=m.group(1) if m else 'unknown')
+
+class Registry:
+    '''The resolved tools. Safe to share between threads.'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tools = {}
+
+    def get(self, name):
+        '''The cached Tool, located (without probing) the first time.'''
+        with self.lock:
+            tool = self.tools.get(name)
+        if tool is None:
+            tool = locate(specs[name])
+            with self.lock:
+                tool = self.tools.setdefault(name, tool)
+        return tool
+
+    def path(self, name):
+        return self.get(name).path
+
+    def discover(self, names=None):
+        '''Locates and probes the tools concurrently, returns them by name.'''
+        # imported here, it pulls in logging, which the cores don't need
+        import concurrent.futures
+        names = list(specs) if names is None else names
+        config = readConfig()
+        with concurrent.futures.ThreadPoolExecutor(len(names)) as pool:
+            found = pool.map(lambda n: probe(locate(specs[n], config)), names)
+            found = {tool.name: tool for tool in found}
+        with self.lock:
+            self.tools.update(found)
+        return found
+
+    def configure(self, name, path):
+        '''Uses path for the tool from now on and saves it to the config.'''
+        config = readConfig()
+        config[name] = path
+        fileName = configFileName()
+        os.makedirs(os.path.dirname(fileName), exist_ok=True)
+        with open(fileName, 'w') as f:
+            json.dump(config, f, indent=2)
+        tool = probe(Tool(name, path, 'config', None, None))
+        with self.lock:
+            self.tools[name] = tool
+        return tool
+
+    def forget(self):
+        '''Drops the cache, e.g. after the environment changed.'''
+        with self.lock:
+            self.tools.clear()
+
+registry = Registry()
+
+def path(name):
+    '''Path of the named tool.'''
+    return registry.path(name)
+
+def discover(names=None):
+    return registry.discover(names)
+
+def configure(name, path):
+    return registry.configure(name, path)
+
+def processErrorToString(e):
+    '''Describes a QProcess.ProcessError, also used for a tool that
+    couldn't be run with subprocess.'''
+    if e == 0:
+        return 'The process failed to start. Either the invoked program is missing, or you may have insufficient permissions to invoke the program.'
+    elif e == 1:
+        return 'The process crashed some time after starting successfully.'
+    elif e == 2:
+        return 'The last waitFor...() function timed out. The state of QProcess is unchanged, and you can try calling waitFor...() again.'
+    elif e == 3:
+        return 'An error occurred when attempting to read from the process. For example, the process may not be running.'
+    elif e == 4:
+        return 'An error occurred when attempting to write to the process. For example, the process may not be running, or it may have closed its input channel.'
+    elif e == 5:
+        return 'An unknown error occurred. This is the default return value of error().'
+
+def describe(tool):
+    if tool.error is not None:
+        return '[TOOLS] {}: {}'.format(tool.name, tool.error)
+    return '[TOOLS] {}: {} ({}, version {})'.format(tool.name, tool.path, tool.source, tool.version)
@@ -1,54 +1,34 @@
 import glob
-import sys
-import serial
-import serial.tools.list_ports
+import html
+import threading
+import time
 from PyQt5 import QtGui
 from PyQt5.QtWidgets import (QWidget, QPushButton, QLabel, QComboBox, QApplication, QMainWindow, QStyleFactory, QDesktopWidget, QMessageBox, QErrorMessage, QFileDialog, QSplitter, QScrollArea)
 from PyQt5.QtCore import QFileInfo, QFile, QProcess, QTimer, QBasicTimer, Qt, QObject, QRunnable, QThread, QThreadPool, pyqtSignal
 
+import jobs
+import lpc21isp
+import metrics
 import resource
 import pages
+import selftest
+import tools
 from pager import Pager
+from portsession import listSerialPorts
 from smartdrive import SmartDrive
 from smartdrivebluetooth import SmartDriveBluetooth
 
 from action import\
     Action
 
-def listSerialPorts():
-    """ Lists serial port names
-
-        :raises EnvironmentError:
-            On unsupported or unknown platforms
-        :returns:
-            A list of the serial ports available on the system
-    """
-    portDesc = ''
-    if sys.platform.startswith('win'):
-        portDesc = 'USB Serial Port'
-    elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
-        portDesc = 'TTL232R-3V3'
-    elif sys.platform.startswith('darwin'):
-        portDesc = 'TTL232R-3V3'
-    else:
-        raise EnvironmentError('Unsupported platform')
-
-    ports = list(serial.tools.list_ports.comports())
-    result = []
-    for p in ports:
-        if portDesc in p.description:
-            try:
-                s = serial.Serial(p.device)
-                s.close()
-                result.append(p.device)
-            except (OSError, serial.SerialException) as inst:
-                print(inst)
-                pass
-
-    return result
-
 class Programmer(QMainWindow):
-    def __init__(self):
+    programBootloader = pyqtSignal()
+    programFirmware = pyqtSignal()
+    programBluetooth = pyqtSignal()
+    releasePort = pyqtSignal()
+    selfTestFinished = pyqtSignal(list)
+
+    def __init__(self, metricsPort=None, metricsFile=None, jobsFile=None):
         super().__init__()
 
         self.port = None
@@ -58,7 +38,10 @@ class Programmer(QMainWindow):
         self.fwFileName = None
         self.bleFileName = None
         self.initUI()
+        self.showMissingTools()
         self.initSD()
+        self.initJobs(jobsFile)
+        self.initMetrics(metricsPort, metricsFile)
 
     def initUI(self):
         QApplication.setStyle(QStyleFactory.create('Cleanlooks'))
@@ -99,6 +82,21 @@ class Programmer(QMainWindow):
         bleInfoAction.setStatusTip('BLE Programmer Info')
         bleInfoAction.triggered.connect(self.showBLEInfo)
 
+        discardAction = Action(resource.path('icons/toolbar/redo.png'), 'Discard Unfinished Unit', self)
+        discardAction.setStatusTip('Program every stage of the unit on this port again')
+        discardAction.triggered.connect(self.discardUnit)
+
+        locateBleAction = Action(resource.path('icons/toolbar/open.png'), 'Locate bleupdate-cli', self)
+        locateBleAction.setStatusTip('Select the bleupdate-cli executable used to program BLE')
+        locateBleAction.triggered.connect(self.onLocateBleUpdate)
+
+        selfTestAction = Action(resource.path('icons/toolbar/start.png'), 'Serial Self-Test', self)
+        selfTestAction.setStatusTip('Test the serial adapters with a loopback plug')
+        selfTestAction.triggered.connect(self.onSelfTest)
+        self.selfTestAction = selfTestAction
+        self.selfTestPorts = None
+        self.selfTestFinished.connect(self.onSelfTestFinished)
+
         # Create the widgets for the program (embeddable in the
         # toolbar or elsewhere)
         self.port_selector = QComboBox(self)
@@ -112,6 +110,9 @@ class Programmer(QMainWindow):
         self.menu_add_action('&File', refreshAction)
         self.menu_add_action('&File', openAction)
         self.menu_add_action('&File', openBleAction)
+        self.menu_add_action('&File', discardAction)
+        self.menu_add_action('&File', locateBleAction)
+        self.menu_add_action('&File', selfTestAction)
 
         self.menubar_add_menu('&Help')
         self.menu_add_action('&Help', aboutAction)
@@ -202,14 +203,18 @@ class Programmer(QMainWindow):
 
         # wire up all the events
         self.port_selector.currentIndexChanged[str].connect(self.smartDrive.onPortSelected)
+        self.releasePort.connect(self.smartDrive.releasePort)
+        self.smartDrive.portReleased.connect(self.onPortReleased)
 
         self.smartDrive.invalidFirmware.connect(self.onInvalidFirmwareFile)
+        self.smartDriveBluetooth.invalidFirmware.connect(self.onInvalidFirmwareFile)
 
         # bootloader page
         self.smartDrive.bootloaderStatus.connect(self.bootloaderPage.onProgressUpdate)
         self.smartDrive.bootloaderFailed.connect(self.bootloaderPage.onBootloaderFailed)
         self.smartDrive.bootloaderFinished.connect(self.bootloaderPage.onBootloaderFinished)
-        self.bootloaderPage.start.connect(self.smartDrive.programBootloader)
+        self.bootloaderPage.start.connect(self.onBootloaderStart)
+        self.programBootloader.connect(self.smartDrive.programBootloader)
         self.bootloaderPage.stop.connect(self.smartDrive.stop)
         self.bootloaderPage.finished.connect(self.pager.onNext)
 
@@ -217,7 +222,8 @@ class Programmer(QMainWindow):
         self.smartDrive.firmwareStatus.connect(self.firmwarePage.onProgressUpdate)
         self.smartDrive.firmwareFinished.connect(self.firmwarePage.onFirmwareFinished)
         self.smartDrive.firmwareFailed.connect(self.firmwarePage.onFirmwareFailed)
-        self.firmwarePage.start.connect(self.smartDrive.programFirmware)
+        self.firmwarePage.start.connect(self.onFirmwareStart)
+        self.programFirmware.connect(self.smartDrive.programFirmware)
         self.firmwarePage.stop.connect(self.smartDrive.stop)
         self.firmwarePage.finished.connect(self.pager.onNext)
 
@@ -226,7 +232,8 @@ class Programmer(QMainWindow):
         self.smartDriveBluetooth.deviceInfo.connect(self.blePage.onDeviceInfo)
         self.smartDriveBluetooth.firmwareFinished.connect(self.blePage.onFirmwareFinished)
         self.smartDriveBluetooth.failed.connect(self.blePage.onFirmwareFailed)
-        self.blePage.start.connect(self.smartDriveBluetooth.start)
+        self.blePage.start.connect(self.onBluetoothStart)
+        self.programBluetooth.connect(self.smartDriveBluetooth.start)
         self.blePage.stop.connect(self.smartDriveBluetooth.stop)
         self.blePage.finished.connect(self.pager.onNext)
 
@@ -238,6 +245,31 @@ class Programmer(QMainWindow):
         # start the SDBT thread
         self.sdbtthread.start()
 
+    def initJobs(self, fileName):
+        self.jobs = jobs.JobStore(fileName)
+        self.bluetoothPercent = 0
+        # BLE serial number of the unit once it is read, and the open job
+        # the operator confirmed to be this unit's
+        self.unitSerial = None
+        self.confirmedJob = None
+        self.smartDrive.bootloaderFinished.connect(lambda: self.onStageDone('bootloader'))
+        self.smartDrive.firmwareFinished.connect(lambda: self.onStageDone('firmware'))
+        self.smartDriveBluetooth.status.connect(self.onBluetoothStatus)
+        self.smartDriveBluetooth.firmwareFinished.connect(self.onBluetoothFinished)
+        self.smartDriveBluetooth.deviceInfo.connect(self.onBluetoothDeviceInfo)
+        self.endPage.finished.connect(self.onUnitFinished)
+
+    def initMetrics(self, port, fileName):
+        self.metrics = metrics.StationMetrics()
+        self.metrics.connect(self.smartDrive, self.smartDriveBluetooth,
+                             self.bootloaderPage.start,
+                             self.firmwarePage.start,
+                             self.blePage.start)
+        if port:
+            metrics.serve(self.metrics.registry, port)
+        if fileName:
+            metrics.writePeriodically(self.metrics.registry, fileName)
+
     # Functions for serial port control
     def refreshPorts(self):
         self.serial_ports = listSerialPorts()
@@ -255,6 +287,7 @@ class Programmer(QMainWindow):
     def changePort(self, newPort):
         if newPort != self.port:
             self.port = newPort
+            self.unitSerial = None
 
     # functions for selecting the MX2+ firmware file
     def onInvalidFirmwareFile(self, err):
@@ -267,10 +300,10 @@ class Programmer(QMainWindow):
             self,
             'Select MX2+ Firmware OTA File',
             '',
-            'OTA Files (*.ota)',
+            'OTA Files (*.ota *.ota.gz)',
             options=QFileDialog.Options()
         )
-        if fname is not None and len(fname) > 0:
+        if fname is not None and len(fname) > 0 and pages.checkFirmware(self, fname, 'ota'):
             self.fwFileName = fname
             self.smartDrive.onFirmwareFileSelected(self.fwFileName)
             self.firmwareLabel.setText('<b><i>{}</i></b>'.format(self.smartDrive.version))
@@ -284,19 +317,168 @@ class Programmer(QMainWindow):
             'Firmware Files (*.fw)',
             options=QFileDialog.Options()
         )
-        if fname is not None and len(fname) > 0:
+        if fname is not None and len(fname) > 0 and pages.checkFirmware(self, fname, 'ble'):
             self.bleFileName = fname
             self.smartDriveBluetooth.onFirmwareFileSelected(self.bleFileName)
-            self.bleLabel.setText('<b><i>{}</i></b>'.format(self.bleFileName))
+            # None if it was rejected
+            self.bleFileName = self.smartDriveBluetooth.fwFileName
+            self.bleLabel.setText('<b><i>{}</i></b>'.format(self.bleFileName or ''))
+
+    # functions for the external tools
+    def showMissingTools(self):
+        missing = [t.error for t in (tools.registry.get(n) for n in tools.specs) if t.error]
+        if missing:
+            self.statusBar().showMessage('; '.join(missing))
+
+    def onLocateBleUpdate(self):
+        tool = pages.locateBleUpdate(self)
+        if tool is not None:
+            self.statusBar().showMessage(tools.describe(tool))
+
+    # functions for the serial adapter self-test
+    def onSelfTest(self):
+        if self.smartDrive.isProgramming:
+            QMessageBox.warning(
+                self, 'Serial Self-Test',
+                'A unit is being programmed. Stop it or let it finish before testing the serial adapters.',
+                QMessageBox.Ok, QMessageBox.Ok)
+            return
+        ports = list(self.serial_ports)
+        if not ports:
+            self.statusBar().showMessage('No serial ports to test.')
+            return
+        reply = QMessageBox.question(
+            self, 'Serial Self-Test',
+            'Disconnect all units and plug a loopback plug (TX to RX) into {}.'.format(
+                ', '.join(ports)),
+            QMessageBox.Ok | QMessageBox.Cancel, QMessageBox.Ok)
+        if reply != QMessageBox.Ok or self.smartDrive.isProgramming:
+            return
+        # the test starts once the SmartDrive's thread closed the port
+        self.selfTestAction.setEnabled(False)
+        self.selfTestPorts = ports
+        self.statusBar().showMessage('Testing {}...'.format(', '.join(ports)))
+        self.releasePort.emit()
+
+    def onPortReleased(self):
+        ports, self.selfTestPorts = self.selfTestPorts, None
+        if ports is None:
+            return
+        threading.Thread(target=lambda: self.selfTestFinished.emit(selftest.run(ports)),
+                         daemon=True).start()
+
+    def onSelfTestFinished(self, results):
+        self.selfTestAction.setEnabled(True)
+        bad = selftest.flagged(results)
+        text = '<pre>{}</pre>'.format(html.escape(selftest.report(results)))
+        if bad:
+            self.statusBar().showMessage('Check the serial adapters on {}'.format(', '.join(bad)))
+            QMessageBox.warning(self, 'Serial Self-Test', text, QMessageBox.Ok, QMessageBox.Ok)
+        else:
+            self.statusBar().showMessage('All serial adapters passed the self-test.')
+            QMessageBox.information(self, 'Serial Self-Test', text, QMessageBox.Ok, QMessageBox.Ok)
+
+    # functions for resuming an interrupted unit
+    def stageFirmware(self, stage):
+        '''Returns the hash of the firmware file the stage would program.'''
+        fileName = {
+            'bootloader': lpc21isp.bootloaderImage(),
+            'firmware': self.smartDrive.fwFileName,
+            'bluetooth': self.bleFileName,
+        }[stage]
+        return jobs.fileHash(fileName)
+
+    def confirmUnit(self, job):
+        '''Returns true if the unit on the port is the one of the open job:
+        its serial number matches, or the operator says so. The job is
+        abandoned if it isn't.'''
+        if (self.unitSerial and job.serial == self.unitSerial) or job.id == self.confirmedJob:
+            return True
+        reply = QMessageBox.question(
+            self, 'Resume Unit',
+            'The unit on {} was part way through programming at {}{}.\n\n'
+            'Is it still the same unit? Its completed stages will be skipped. '
+            'Choose No if a different unit is connected.'.format(
+                self.port, time.strftime('%H:%M', time.localtime(job.started)),
+                ' (S/N {})'.format(job.serial) if job.serial else ''),
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            self.jobs.end(self.port, 'abandoned')
+            return False
+        self.confirmedJob = job.id
+        return True
+
+    def resumeStage(self, stage, page, onFinished):
+        '''Skips the stage if the unit's open job already completed it with
+        the selected firmware. Unless the unit's serial number matches the
+        job's, the operator confirms it is the same unit first. Returns
+        true if it was skipped.'''
+        finished = self.jobs.isDone(self.port, stage, self.stageFirmware(stage), self.unitSerial)
+        if finished is None:
+            return False
+        if not self.confirmUnit(self.jobs.job(self.port, self.unitSerial)):
+            return False
+
+        def skip():
+            onFinished()
+            page.onProgressUpdate(100, 'Already programmed at {} (resumed)'.format(
+                time.strftime('%H:%M', time.localtime(finished))))
+        # after the page's own onStart has finished
+        QTimer.singleShot(0, skip)
+        return True
+
+    def onBootloaderStart(self):
+        if not self.resumeStage('bootloader', self.bootloaderPage,
+                                self.bootloaderPage.onBootloaderFinished):
+            self.programBootloader.emit()
+
+    def onFirmwareStart(self):
+        if not self.resumeStage('firmware', self.firmwarePage,
+                                self.firmwarePage.onFirmwareFinished):
+            self.programFirmware.emit()
+
+    def onBluetoothStart(self):
+        if not self.resumeStage('bluetooth', self.blePage,
+                                self.blePage.onFirmwareFinished):
+            self.programBluetooth.emit()
+
+    def onStageDone(self, stage):
+        self.jobs.stageDone(self.port, stage, self.stageFirmware(stage))
+
+    def onBluetoothDeviceInfo(self, serialNumber, licenseKey, address):
+        # the device info is also reset to None before each unit
+        if serialNumber and self.port:
+            self.unitSerial = serialNumber
+            self.jobs.setSerial(self.port, serialNumber)
+
+    def onBluetoothStatus(self, percent, text):
+        self.bluetoothPercent = percent
+
+    def onBluetoothFinished(self):
+        # SmartDriveBluetooth also reports finished when stopped
+        if self.bluetoothPercent == 100:
+            self.onStageDone('bluetooth')
+
+    def onUnitFinished(self):
+        self.jobs.end(self.port)
+        self.unitSerial = None
+        self.confirmedJob = None
+
+    def discardUnit(self):
+        self.jobs.end(self.port, 'abandoned')
+        self.unitSerial = None
+        self.confirmedJob = None
 
     # functions for controlling the programming
     def stop(self):
         self.smartDrive.stop()
         self.sdthread.quit()
         self.sdthread.wait()
+        self.smartDrive.releasePort()
         self.smartDriveBluetooth.stop()
         self.sdbtthread.quit()
         self.sdbtthread.wait()
+        self.jobs.close()
 
     # general functions
     def about(self):